@@ -2,6 +2,7 @@
 ASGI config for crop_monitor_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Notification streams (monitor.sse) are served ahead of Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +14,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crop_monitor_backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from monitor.sse import route  # noqa: E402 (needs the app registry loaded above)
+
+application = route(django_application)
@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "monitor.middleware.RequestMetricsMiddleware",
+    "monitor.middleware.RequestIdMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -55,6 +57,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "monitor.middleware.ReplicaRoutingMiddleware",
+    "monitor.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -96,6 +100,21 @@ else:
         }
     }
 
+# Read replicas (see monitor.replicas): comma-separated database URLs
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = dj_database_url.parse(url.strip(), conn_max_age=600, conn_health_checks=True)
+    DATABASES[f'replica{number}']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['monitor.replicas.ReplicaRouter']
+# Off without Redis: read-your-writes pins in per-process caches would miss other workers' writes
+DATABASE_REPLICA_READS_ENABLED = os.environ.get(
+    'DATABASE_REPLICA_READS_ENABLED', '1' if os.environ.get('REDIS_URL') else '0',
+) == '1'
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', '10'))  # read-your-writes window
+DATABASE_REPLICA_HEALTH_INTERVAL = 5  # seconds between probes of each replica
+DATABASE_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DATABASE_REPLICA_MAX_LAG_SECONDS', '5'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -156,13 +175,140 @@ CORS_ALLOWED_HEADERS = [
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'monitor.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'monitor.renderers.FastJSONRenderer',
+        'monitor.renderers.MsgpackRenderer',
+        'monitor.renderers.PolylineMsgpackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'monitor.renderers.FastJSONParser',
+        'monitor.renderers.MsgpackParser',
+        'monitor.renderers.PolylineMsgpackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+# Cache: Redis shared by all workers when REDIS_URL is set, per-process memory otherwise
+# (size-bound the Redis instance with maxmemory + allkeys-lru)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        },
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'KEY_PREFIX': 'responses',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'responses',
+            'OPTIONS': {'MAX_ENTRIES': 5000},  # LRU eviction beyond this
+        },
+    }
+
+# Per-user dashboard response cache (see monitor.caching)
+# Off without Redis: per-process caches would miss other workers' version bumps
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', '1' if os.environ.get('REDIS_URL') else '0') == '1'
+RESPONSE_CACHE_ALIAS = os.environ.get('RESPONSE_CACHE_ALIAS', 'responses')
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', '3600'))
+
+# Authenticated user cache (see monitor.authentication)
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', '60'))  # seconds, shared cache
+AUTH_USER_CACHE_LOCAL_TTL = int(os.environ.get('AUTH_USER_CACHE_LOCAL_TTL', '5'))  # seconds, per process
+AUTH_USER_CACHE_LOCAL_SIZE = 10000
+
+# Admin review queue (see monitor.review_queue)
+REVIEW_QUEUE_BATCH_SIZE = 20
+REVIEW_QUEUE_MAX_BATCH_SIZE = 100
+REVIEW_QUEUE_LEASE_SECONDS = int(os.environ.get('REVIEW_QUEUE_LEASE_SECONDS', '900'))
+
+# Token-bucket rate limits per scope: {bucket: (tokens per second, bucket size)}.
+# 'user' buckets are per user (per client IP when anonymous), 'global' is shared.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMITS = {
+    'sentinel_token': {'user': (1 / 60, 10), 'global': (2.0, 60)},
+    'signup': {'user': (1 / 600, 5), 'global': (1.0, 30)},
 }
 
+# Scheduled vegetation statistics (manage.py run_field_stats, see monitor.field_stats)
+FIELD_STATS_URL = os.environ.get('FIELD_STATS_URL')
+FIELD_STATS_TOKEN = os.environ.get('FIELD_STATS_TOKEN')
+FIELD_STATS_PERIOD_DAYS = int(os.environ.get('FIELD_STATS_PERIOD_DAYS', '30'))
+FIELD_STATS_CONCURRENCY = int(os.environ.get('FIELD_STATS_CONCURRENCY', '4'))
+FIELD_STATS_PAGE_SIZE = 500  # fields per checkpoint
+FIELD_STATS_GROUP_SIZE = 25  # fields per upstream request
+FIELD_STATS_GROUP_SPAN_DEGREES = 0.25  # max bbox edge of one request's fields
+FIELD_STATS_TIMEOUT = 60
+FIELD_STATS_MAX_ATTEMPTS = 5
+FIELD_STATS_BACKOFF_BASE = 1.0  # seconds; full jitter, doubling per attempt
+FIELD_STATS_BACKOFF_CAP = 60.0
+
+# Splitting large fields into upstream-sized requests (see monitor.tiling)
+TILING_RESOLUTION_M = float(os.environ.get('TILING_RESOLUTION_M', '10'))
+TILING_MAX_PIXELS = int(os.environ.get('TILING_MAX_PIXELS', '2500'))  # per side, Sentinel Hub's request limit
+TILING_CACHE_TIMEOUT = 7 * 24 * 3600  # seconds per tile result
+
+# Per-field index time series (see monitor.timeseries)
+TIMESERIES_CHUNK_SIZE = 366  # points per stored chunk, about a year of daily values
+TIMESERIES_DTYPE = os.environ.get('TIMESERIES_DTYPE', 'float16')  # or 'float32'
+TIMESERIES_MAX_POINTS = 5000  # raw points per API response
+
+# Deferred signup geometry processing (see monitor.signups)
+SIGNUP_PROCESSING_BACKEND = os.environ.get('SIGNUP_PROCESSING_BACKEND', 'local')  # or 'worker'
+SIGNUP_PROCESSING_THREADS = int(os.environ.get('SIGNUP_PROCESSING_THREADS', '2'))  # 0 = inline
+SIGNUP_PROCESSING_LEASE_SECONDS = 300  # a job held longer than this is retried
+SIGNUP_PROCESSING_MAX_ATTEMPTS = 5
+SIGNUP_PROCESSING_RETRY_DELAY = 30  # seconds, doubling per attempt
+SIGNUP_PROCESSING_SWEEP_SECONDS = 30  # 'local': how often retries and expired leases are picked up
+
+# Bulk field submission limits
+BULK_FIELDS_MAX_ITEMS = int(os.environ.get('BULK_FIELDS_MAX_ITEMS', '500'))
+BULK_FIELDS_MAX_VERTICES = int(os.environ.get('BULK_FIELDS_MAX_VERTICES', '250000'))
+BULK_FIELDS_MAX_KML_BYTES = int(os.environ.get('BULK_FIELDS_MAX_KML_BYTES', '1000000'))  # per embedded document
+BULK_CREATE_BATCH_SIZE = 200
+
+# Batch point-in-field lookups
+LOCATE_MAX_POINTS = int(os.environ.get('LOCATE_MAX_POINTS', '10000'))
+
+# Delta sync for offline clients (see monitor.changes)
+FIELD_CHANGES_PAGE_SIZE = int(os.environ.get('FIELD_CHANGES_PAGE_SIZE', '500'))
+FIELD_CHANGES_RETENTION_DAYS = int(os.environ.get('FIELD_CHANGES_RETENTION_DAYS', '30'))  # tombstones; older cursors resync
+
+# Approval notifications over Server-Sent Events (see monitor.notifications, monitor.sse)
+NOTIFICATIONS_BACKEND = os.environ.get('NOTIFICATIONS_BACKEND', 'database')  # or 'memory' (single process)
+NOTIFICATIONS_HEARTBEAT_SECONDS = float(os.environ.get('NOTIFICATIONS_HEARTBEAT_SECONDS', '15'))
+NOTIFICATIONS_POLL_SECONDS = float(os.environ.get('NOTIFICATIONS_POLL_SECONDS', '1'))  # non-PostgreSQL databases
+NOTIFICATIONS_RETENTION_SECONDS = int(os.environ.get('NOTIFICATIONS_RETENTION_SECONDS', '86400'))
+NOTIFICATIONS_REPLAY_LIMIT = 1000
+
+# Overview map clusters (see monitor.clusters)
+CLUSTER_MAX_ZOOM = int(os.environ.get('CLUSTER_MAX_ZOOM', '16'))  # deeper zooms return single fields
+CLUSTER_MAX_RESULTS = int(os.environ.get('CLUSTER_MAX_RESULTS', '5000'))
+CLUSTER_MAX_REPLAY = int(os.environ.get('CLUSTER_MAX_REPLAY', '1000'))  # more pending changes than this: rebuild
+CLUSTER_CHANGE_FEED = os.environ.get('CLUSTER_CHANGE_FEED', 'cache' if os.environ.get('REDIS_URL') else 'database')  # 'cache' needs Redis
+
+# Offline reverse geocoding of submitted coordinates (see monitor.geocoder)
+GEOCODER_DATASET = os.environ.get('GEOCODER_DATASET', str(BASE_DIR / 'monitor' / 'data' / 'places.npy'))
+GEOCODER_NEIGHBOURS = 3  # a country matching any of these places is accepted (borders)
+GEOCODER_MAX_DISTANCE_KM = 300  # beyond this the dataset is too sparse to judge the country
+GEOCODER_CITY_RADIUS_KM = 50  # blank cities are filled only from places this close
+GEOCODER_CITY_MISMATCH_KM = 150
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@cropmonitoring.com'
@@ -170,4 +316,52 @@ EMAIL_HOST_USER = 'noreply@cropmonitoring.com'
 
 # Session settings
 SESSION_COOKIE_SECURE = os.environ.get('RAILWAY_ENVIRONMENT') is not None
-CSRF_COOKIE_SECURE = os.environ.get('RAILWAY_ENVIRONMENT') is not None
\ No newline at end of file
+CSRF_COOKIE_SECURE = os.environ.get('RAILWAY_ENVIRONMENT') is not None
+
+# Request metrics (see monitor.metrics)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_DIR = os.environ.get('METRICS_DIR')  # shared by all gunicorn workers; defaults to a temp dir
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1.0'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token for scrapers; without it /metrics/ is staff-only
+
+# Request profiling (see monitor.profiling)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))  # share of requests profiled
+PROFILING_THRESHOLD_MS = float(os.environ.get('PROFILING_THRESHOLD_MS', '1000'))  # sampled profiles kept above this
+PROFILING_INTERVAL_MS = float(os.environ.get('PROFILING_INTERVAL_MS', '5'))
+PROFILING_TRACEMALLOC = os.environ.get('PROFILING_TRACEMALLOC', 'requested')  # or 'all' / 'off'
+PROFILING_DIR = os.environ.get('PROFILING_DIR')  # defaults to a temp dir
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', '50'))
+
+# Logging: JSON lines written from a background thread (see monitor.log)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_RATE_LIMIT = int(os.environ.get('LOG_RATE_LIMIT', '20'))  # records per event per second
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'rate_limit': {
+            '()': 'monitor.log.RateLimitFilter',
+            'rate': LOG_RATE_LIMIT,
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'monitor.log.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'async_console': {
+            'class': 'monitor.log.AsyncStreamHandler',
+            'formatter': 'json',
+            'filters': ['rate_limit'],
+        },
+    },
+    'loggers': {
+        'monitor': {
+            'handlers': ['async_console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
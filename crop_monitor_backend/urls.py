@@ -1,13 +1,16 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-
-def health_check(request):
-    return JsonResponse({"status": "ok", "message": "Django backend is running"})
+from monitor.admin import profile_download_view, profiles_view
+from monitor.views import health_check, metrics_view
 
 urlpatterns = [
+    path("admin/profiles/", admin.site.admin_view(profiles_view), name="admin_profiles"),
+    path("admin/profiles/<str:profile_id>.folded", admin.site.admin_view(profile_download_view),
+         name="admin_profile_download"),
     path("admin/", admin.site.urls),
-    # path('health/', health_check, name='health_check'),
+    path("health/", health_check, name="health_check"),
+    path("metrics/", metrics_view, name="metrics"),
     path("api/v1/", include("monitor.urls")),
     path("api/v1/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/v1/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
@@ -1,7 +1,16 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Q
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import User, FieldSubmission
+from . import analytics, changes, clusters, notifications, profiling, review_queue, search
+from .caching import bump_user_versions
+from .renderers import refresh_rendered_json
+from .models import FieldChange, FieldSubmission, User
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -16,13 +25,57 @@ class UserAdmin(BaseUserAdmin):
         return f"{approved}/{count}"
     field_count.short_description = "Fields (Approved/Total)"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Also find farmers by what they grow and where, via their fields' search index
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            owners = search.search(FieldSubmission.objects.all(), search_term).values('user_id')
+            queryset |= self.model.objects.filter(pk__in=owners)
+        return queryset, may_have_duplicates
+
+class ReviewClaimFilter(admin.SimpleListFilter):
+    title = "review claim"
+    parameter_name = "claim"
+
+    def lookups(self, request, model_admin):
+        return (("mine", "Claimed by me"), ("unclaimed", "Unclaimed"))
+
+    def queryset(self, request, queryset):
+        now = timezone.now()
+        if self.value() == "mine":
+            return queryset.filter(claimed_by=request.user, claim_expires_at__gte=now)
+        if self.value() == "unclaimed":
+            return queryset.filter(Q(claimed_by__isnull=True) | Q(claim_expires_at__lt=now))
+        return queryset
+
+class LocationCheckFilter(admin.SimpleListFilter):
+    title = "location check"
+    parameter_name = "location"
+
+    def lookups(self, request, model_admin):
+        return (("flagged", "Contradicts coordinates"), ("ok", "Consistent"))
+
+    def queryset(self, request, queryset):
+        if self.value() == "flagged":
+            return queryset.exclude(location_warning="")
+        if self.value() == "ok":
+            return queryset.filter(location_warning="")
+        return queryset
+
 @admin.register(FieldSubmission)
 class FieldSubmissionAdmin(admin.ModelAdmin):
-    list_display = ("field_name", "user", "field_approval_status", "crop_name", "city", "created_at", "approved_at")
-    list_filter = ("is_approved", "crop_name", "country", "created_at")
+    list_display = ("field_name", "user", "field_approval_status", "crop_name", "city", "location_check", "created_at", "approved_at")
+    list_filter = ("is_approved", ReviewClaimFilter, LocationCheckFilter, "crop_name", "country", "created_at")
+    change_list_template = "admin/monitor/fieldsubmission/change_list.html"
     search_fields = ("field_name", "user__username", "user__email", "crop_name", "city")
     ordering = ("-created_at",)
-    readonly_fields = ("created_at", "updated_at", "approved_at", "approved_by")
+    readonly_fields = ("created_at", "updated_at", "approved_at", "approved_by", "claimed_by", "claim_expires_at", "location_warning")
+
+    def get_search_results(self, request, queryset, search_term):
+        # search_fields only turns the search box on; matching uses the full-text index
+        if not search_term.strip():
+            return queryset, False
+        return search.search(queryset, search_term), False
     
     def field_approval_status(self, obj):
         if obj.is_approved:
@@ -31,6 +84,12 @@ class FieldSubmissionAdmin(admin.ModelAdmin):
             return format_html('<span style="color: orange; font-weight: bold;">⏳ Pending</span>')
     field_approval_status.short_description = "Status"
     
+    def location_check(self, obj):
+        if obj.location_warning:
+            return format_html('<span style="color: orange;" title="{}">⚠ Check</span>', obj.location_warning)
+        return format_html('<span style="color: green;">✓</span>')
+    location_check.short_description = "Location"
+    
     fieldsets = (
         ("User Information", {
             "fields": ("user", "first_name", "last_name", "email", "phone")
@@ -39,10 +98,10 @@ class FieldSubmissionAdmin(admin.ModelAdmin):
             "fields": ("field_name", "crop_name", "plantation_date", "lat", "lng", "polygon", "kml_file")
         }),
         ("Location", {
-            "fields": ("city", "country", "zip_code")
+            "fields": ("city", "country", "zip_code", "location_warning")
         }),
         ("Approval", {
-            "fields": ("is_approved", "approved_at", "approved_by"),
+            "fields": ("is_approved", "approved_at", "approved_by", "claimed_by", "claim_expires_at"),
             "classes": ("wide",)
         }),
         ("Timestamps", {
@@ -51,17 +110,74 @@ class FieldSubmissionAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['approve_fields', 'unapprove_fields']
+    actions = ['approve_fields', 'unapprove_fields', 'release_claims']
+    
+    def get_urls(self):
+        urls = [
+            path("review-queue/", self.admin_site.admin_view(self.claim_review_batch),
+                 name="monitor_fieldsubmission_review_queue"),
+        ]
+        return urls + super().get_urls()
+    
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), "review_queue": review_queue.queue_stats()}
+        return super().changelist_view(request, extra_context)
+    
+    def claim_review_batch(self, request):
+        """Claim the next batch of pending fields and show them to this reviewer"""
+        fields = review_queue.claim_batch(request.user)
+        self.message_user(request, f"Claimed {len(fields)} pending fields for review.")
+        changelist = reverse("admin:monitor_fieldsubmission_changelist")
+        return redirect(f"{changelist}?claim=mine&is_approved__exact=0")
     
     def approve_fields(self, request, queryset):
         count = 0
+        skipped = 0
         for field in queryset.filter(is_approved=False):
-            field.approve(request.user)
-            count += 1
-        self.message_user(request, f"{count} fields were approved and notification emails sent.")
+            if review_queue.approve_claimed(request.user, field.id):
+                count += 1
+            else:
+                skipped += 1
+        message = f"{count} fields were approved and notification emails sent."
+        if skipped:
+            message += f" {skipped} were skipped because another reviewer approved or claimed them."
+        self.message_user(request, message)
     approve_fields.short_description = "Approve selected fields (sends emails)"
     
     def unapprove_fields(self, request, queryset):
-        updated = queryset.update(is_approved=False, approved_at=None, approved_by=None)
+        rows = list(queryset.values_list('id', 'user_id'))
+        approved = list(queryset.filter(is_approved=True).values_list('id', 'user_id', 'field_name'))
+        with analytics.track_bulk_change(pk for pk, _ in rows):
+            updated = queryset.update(is_approved=False, approved_at=None, approved_by=None)
+            changes.record((pk, user_id, FieldChange.UNAPPROVED) for pk, user_id, _ in approved)
+            for pk, user_id, field_name in approved:
+                notifications.field_approval_changed(pk, user_id, field_name, False)
+        # update() skips post_save, so refresh stored payloads and cached dashboards explicitly
+        refresh_rendered_json(FieldSubmission.objects.filter(pk__in=[pk for pk, _ in rows]))
+        clusters.track_bulk_change(pk for pk, _ in rows)
+        bump_user_versions(user_id for _, user_id in rows)
         self.message_user(request, f"{updated} fields were unapproved.")
-    unapprove_fields.short_description = "Unapprove selected fields"
\ No newline at end of file
+    unapprove_fields.short_description = "Unapprove selected fields"
+    
+    def release_claims(self, request, queryset):
+        released = review_queue.release(request.user, queryset.values_list("id", flat=True))
+        self.message_user(request, f"Released {released} of your claimed fields.")
+    release_claims.short_description = "Release my review claims on selected fields"
+
+
+def profiles_view(request):
+    """Captured request profiles, newest first (wired up in the project urls)"""
+    context = {
+        **admin.site.each_context(request),
+        "title": "Request profiles",
+        "profiles": profiling.list_profiles(),
+    }
+    return TemplateResponse(request, "admin/monitor/profiles.html", context)
+
+
+def profile_download_view(request, profile_id):
+    path = profiling.folded_path(profile_id)
+    if path is None:
+        raise Http404("No such profile")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=f"{profile_id}.folded",
+                        content_type="text/plain")
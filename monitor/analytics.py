@@ -0,0 +1,181 @@
+"""
+Incrementally maintained field summaries by crop, country and plantation month.
+
+Every write to a FieldSubmission removes the row's previous contribution from
+``FieldSummary`` and adds its new one, so dashboard reads never aggregate the
+submissions table. Bulk ``queryset.update()`` paths must go through
+``track_bulk_change`` and ``bulk_create`` callers through ``track_created``;
+``manage.py rebuild_field_summaries`` recomputes everything from scratch
+(e.g. after deploying this or to correct float drift).
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .geometry import polygon_area_hectares
+from .models import FieldSubmission, FieldSummary
+
+TRACKED_FIELDS = ('crop_name', 'country', 'plantation_date', 'is_approved', 'area_hectares')
+DIMENSIONS = ('total', 'crop', 'country', 'month')
+
+CROP_ALIASES = {
+    'corn': 'maize',
+    'paddy': 'rice',
+    'sugar cane': 'sugarcane',
+    'cotton lint': 'cotton',
+}
+# Words ending in these aren't plurals ('grass', 'citrus', 'hibiscus', 'cannabis')
+SINGULAR_ENDINGS = ('ss', 'us', 'is')
+
+
+def normalize_crop(name):
+    """Fold free-text crop names ('  Wheat ', 'WHEATS', 'whéat') onto one key"""
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode()
+    text = re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+    if not text:
+        return 'unknown'
+    if text.endswith('ies') and len(text) > 4:
+        text = text[:-3] + 'y'
+    elif text.endswith('oes') and len(text) > 4:
+        text = text[:-2]
+    elif text.endswith('s') and not text.endswith(SINGULAR_ENDINGS) and len(text) > 3:
+        text = text[:-1]
+    return CROP_ALIASES.get(text, text)
+
+
+def group_keys(row):
+    """(dimension, key) pairs a submission counts towards"""
+    plantation_date = row['plantation_date']
+    if isinstance(plantation_date, str):
+        month = plantation_date[:7]
+    else:
+        month = plantation_date.strftime('%Y-%m') if plantation_date else 'unknown'
+    return (
+        ('total', 'all'),
+        ('crop', normalize_crop(row['crop_name'])),
+        ('country', (row['country'] or 'unknown').strip().upper()),
+        ('month', month),
+    )
+
+
+def accumulate(deltas, row, sign):
+    hectares = row['area_hectares'] or 0.0
+    approved = bool(row['is_approved'])
+    for group in group_keys(row):
+        delta = deltas[group]
+        delta[0] += sign
+        delta[1] += sign * approved
+        delta[2] += sign * hectares
+        delta[3] += sign * hectares * approved
+
+
+def apply_deltas(deltas):
+    for (dimension, key), (count, approved, hectares, approved_hectares) in deltas.items():
+        if not (count or approved or hectares or approved_hectares):
+            continue
+        FieldSummary.objects.get_or_create(dimension=dimension, key=key)
+        FieldSummary.objects.filter(dimension=dimension, key=key).update(
+            field_count=F('field_count') + count,
+            approved_count=F('approved_count') + approved,
+            total_hectares=F('total_hectares') + hectares,
+            approved_hectares=F('approved_hectares') + approved_hectares,
+        )
+
+
+def _snapshot(instance):
+    return {name: getattr(instance, name) for name in TRACKED_FIELDS}
+
+
+@receiver(pre_save, sender=FieldSubmission)
+def remember_previous_contribution(sender, instance, raw=False, **kwargs):
+    instance._summary_before = None
+    if instance.pk and not raw:
+        instance._summary_before = FieldSubmission.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+
+
+@receiver(post_save, sender=FieldSubmission)
+def update_summaries_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    before = getattr(instance, '_summary_before', None)
+    if before is not None:
+        accumulate(deltas, before, -1)
+    accumulate(deltas, _snapshot(instance), +1)
+    with transaction.atomic():
+        apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=FieldSubmission)
+def update_summaries_on_delete(sender, instance, **kwargs):
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    accumulate(deltas, _snapshot(instance), -1)
+    with transaction.atomic():
+        apply_deltas(deltas)
+
+
+def track_created(instances):
+    """Count rows inserted with bulk_create, which skips post_save"""
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for instance in instances:
+        accumulate(deltas, _snapshot(instance), +1)
+    with transaction.atomic():
+        apply_deltas(deltas)
+
+
+@contextmanager
+def track_bulk_change(field_ids):
+    """Wrap a queryset.update() over ``field_ids`` so summaries follow it"""
+    field_ids = list(field_ids)
+    with transaction.atomic():
+        rows = FieldSubmission.objects.filter(pk__in=field_ids)
+        before = list(rows.select_for_update().values(*TRACKED_FIELDS))
+        yield
+        deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        for row in before:
+            accumulate(deltas, row, -1)
+        for row in rows.values(*TRACKED_FIELDS):
+            accumulate(deltas, row, +1)
+        apply_deltas(deltas)
+
+
+def rebuild():
+    """Recompute every summary row (and any missing areas) from the submissions table"""
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    with transaction.atomic():
+        missing_area = FieldSubmission.objects.filter(area_hectares__isnull=True, polygon__isnull=False)
+        for pk, polygon in missing_area.values_list('pk', 'polygon').iterator():
+            FieldSubmission.objects.filter(pk=pk).update(area_hectares=polygon_area_hectares(polygon))
+        for row in FieldSubmission.objects.values(*TRACKED_FIELDS).iterator():
+            accumulate(deltas, row, +1)
+        FieldSummary.objects.all().delete()
+        FieldSummary.objects.bulk_create(
+            FieldSummary(
+                dimension=dimension, key=key, field_count=count, approved_count=approved,
+                total_hectares=hectares, approved_hectares=approved_hectares,
+            )
+            for (dimension, key), (count, approved, hectares, approved_hectares) in deltas.items()
+        )
+    return len(deltas)
+
+
+def summary(dimension):
+    """Rows for one dimension, straight from the summary table"""
+    return [
+        {
+            'key': row.key,
+            'field_count': row.field_count,
+            'approved_count': row.approved_count,
+            'approval_rate': row.approved_count / row.field_count if row.field_count else 0.0,
+            'total_hectares': round(row.total_hectares, 4),
+            'approved_hectares': round(row.approved_hectares, 4),
+        }
+        for row in FieldSummary.objects.filter(dimension=dimension, field_count__gt=0)
+    ]
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MonitorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "monitor"
+
+    def ready(self):
+        # Connect signal receivers; renderers first so stored payloads are
+        # refreshed before caching bumps the per-user data version
+        from . import renderers  # noqa: F401
+        from . import analytics, authentication, caching, changes, clusters, kml_blobs, search, signups  # noqa: F401
@@ -0,0 +1,115 @@
+"""
+JWT authentication that avoids a ``monitor.User`` query on every request.
+
+Users are cached in two layers: a small per-process dict (``AUTH_USER_CACHE_LOCAL_TTL``)
+in front of the shared Django cache (``AUTH_USER_CACHE_TTL``). Saving or deleting a
+user drops the shared entry and this process's local entries, so a change saved in
+another worker is seen within the local TTL, and one that bypasses signals
+(``queryset.update``) within the shared TTL.
+
+Entries hold the user's field values, not the instance: each request gets
+its own ``User``, so attributes set on ``request.user`` don't leak between
+concurrent requests. The password hash is left out (only the digest the
+token revocation check compares against is kept); ``user.password`` is
+loaded from the database if something reads it.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import replicas
+from .models import User
+
+_local_cache = {}
+_local_lock = threading.Lock()
+
+
+def _now():
+    return time.time()
+
+
+def _shared_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _cached_values(user):
+    values = {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields if field.attname != 'password'}
+    return values, get_md5_hash_password(user.password)
+
+
+def _user_from(values):
+    # Fields missing from values (the password) are deferred, i.e. loaded on access
+    return User.from_db(router.db_for_read(User), list(values), list(values.values()))
+
+
+def invalidate_user(user_id):
+    """Forget a cached user everywhere this process can reach"""
+    cache.delete(_shared_key(user_id))
+    with _local_lock:
+        for key in [key for key in _local_cache if key[0] == str(user_id)]:
+            del _local_cache[key]
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Covers is_active and password changes made through save()/delete();
+    # callers using queryset.update() must call invalidate_user() themselves
+    invalidate_user(instance.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """Drop-in replacement for simplejwt's JWTAuthentication with user caching"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        replicas.identify(user_id)
+
+        # The revoke claim acts as the token version: a password change gives new
+        # tokens a new key, and old tokens fail the check below
+        token_version = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM, '')
+        local_key = (user_id, token_version)
+        now = _now()
+
+        with _local_lock:
+            entry = _local_cache.get(local_key)
+        if (entry is not None and now - entry[0] < settings.AUTH_USER_CACHE_LOCAL_TTL
+                and now - entry[1] < settings.AUTH_USER_CACHE_TTL):
+            _, _, values, password_version = entry
+        else:
+            entry = cache.get(_shared_key(user_id))
+            if entry is not None and now - entry[0] < settings.AUTH_USER_CACHE_TTL:
+                cached_at, values, password_version = entry
+            else:
+                values, password_version = _cached_values(super().get_user(validated_token))
+                cached_at = now
+                cache.set(_shared_key(user_id), (cached_at, values, password_version), settings.AUTH_USER_CACHE_TTL)
+            with _local_lock:
+                if len(_local_cache) >= settings.AUTH_USER_CACHE_LOCAL_SIZE:
+                    _local_cache.clear()
+                _local_cache[local_key] = (now, cached_at, values, password_version)
+        user = _user_from(values)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN and token_version != password_version:
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code="password_changed"
+            )
+
+        return user
@@ -0,0 +1,361 @@
+"""
+Micro-benchmarks run with ``manage.py benchmark [name ...]``.
+
+Each benchmark yields ``(label, seconds, note)`` rows (``seconds`` is None for
+size-only rows); timings are the best of a few repeats so one-off GC pauses
+don't skew comparisons. Benchmarks that write (``bulk``) need a migrated
+database and roll their writes back.
+"""
+
+import math
+import random
+import time
+from datetime import date, timedelta
+from unittest import mock
+
+import numpy as np
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import geocoder, polyline, renderers
+from .locate import FieldIndex
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic_polygon(rng, lat, lng, vertices=64, radius=0.005):
+    polygon = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        r = radius * (0.8 + 0.4 * rng.random())
+        polygon.append({'lat': lat + r * math.sin(angle), 'lng': lng + r * math.cos(angle)})
+    polygon.append(dict(polygon[0]))
+    return polygon
+
+
+def synthetic_fields(count, vertices=64, seed=0):
+    """Dicts shaped like FieldSubmissionSerializer output"""
+    rng = random.Random(seed)
+    fields = []
+    for i in range(count):
+        lat, lng = rng.uniform(24, 36), rng.uniform(61, 77)
+        fields.append({
+            'id': i + 1, 'user_username': f'farmer{i % 97}', 'first_name': 'Ada', 'last_name': 'Farmer',
+            'email': 'ada@example.com', 'phone': '+920000000', 'city': 'Lahore', 'country': 'PK',
+            'zip_code': '54000', 'field_name': f'Field {i}', 'crop_name': 'Wheat',
+            'plantation_date': '2024-11-01', 'lat': lat, 'lng': lng,
+            'polygon': synthetic_polygon(rng, lat, lng, vertices), 'kml_file': None,
+            'is_approved': True, 'approved_at': '2024-11-02T10:00:00Z', 'approved_by': 1,
+            'created_at': '2024-11-01T09:00:00Z', 'updated_at': '2024-11-02T10:00:00Z', 'user': 1,
+        })
+    return fields
+
+
+@benchmark('renderers')
+def bench_renderers():
+    drf = JSONRenderer()
+    fast = renderers.FastJSONRenderer()
+    for count in (1000, 10000):
+        fields = synthetic_fields(count)
+        prerendered = renderers.PrerenderedJSON(renderers.dumps(field) for field in fields)
+        size = len(prerendered.to_bytes())
+        yield f'{count} fields: DRF JSONRenderer', best_of(lambda: drf.render(fields), 3), f'{size / 1e6:.1f} MB'
+        with mock.patch.object(renderers, 'orjson', None):
+            yield f'{count} fields: stdlib fallback', best_of(lambda: fast.render(fields), 3), ''
+        if renderers.orjson is not None:
+            yield f'{count} fields: orjson', best_of(lambda: fast.render(fields), 3), ''
+        yield f'{count} fields: pre-rendered splice', best_of(lambda: fast.render(prerendered), 3), ''
+
+
+@benchmark('polyline')
+def bench_polyline():
+    fields = synthetic_fields(1000)
+    json_body = renderers.FastJSONRenderer().render(fields)
+    msgpack_body = renderers.MsgpackRenderer().render(fields)
+    polyline_body = renderers.PolylineMsgpackRenderer().render(fields)
+    yield '1000 fields: JSON size', None, f'{len(json_body) / 1e3:.0f} kB'
+    yield '1000 fields: msgpack size', None, f'{len(msgpack_body) / 1e3:.0f} kB'
+    yield '1000 fields: polyline+msgpack size', None, f'{len(polyline_body) / 1e3:.0f} kB'
+
+    polygon = synthetic_polygon(random.Random(1), 31.5, 74.3, vertices=10000)
+    coords = polyline.points_to_array(polygon)
+    encoded = polyline.encode_array(coords)
+    as_json = renderers.dumps(polygon)
+    yield '10k vertices: polyline encode', best_of(lambda: polyline.encode_array(coords)), f'{len(encoded)} B'
+    yield '10k vertices: polyline decode (NumPy)', best_of(lambda: polyline.decode_array(encoded)), ''
+    yield '10k vertices: JSON decode', best_of(lambda: renderers.loads(as_json)), f'{len(as_json)} B'
+    error = np.abs(polyline.decode_array(encoded) - coords).max()
+    yield '10k vertices: round-trip max error', None, f'{error:.1e} deg'
+
+
+@benchmark('locate')
+def bench_locate():
+    rng = random.Random(2)
+    polygons = [
+        polyline.points_to_array(synthetic_polygon(rng, rng.uniform(30, 32), rng.uniform(72, 75), vertices=32))
+        for _ in range(10000)
+    ]
+    ids = np.arange(1, len(polygons) + 1)
+    points = np.random.default_rng(2).uniform((30, 72), (32, 75), size=(100000, 2))
+
+    build = best_of(lambda: FieldIndex(ids, polygons), 3)
+    index = FieldIndex(ids, polygons)
+    yield '10k fields: build grid + padded polygons', build, f'{len(index.cell_keys)} cell entries'
+    pairs = len(index.candidate_pairs(points)[0])
+    yield '100k points: grid + bbox pruning', best_of(lambda: index.candidate_pairs(points), 3), f'{pairs} candidate pairs'
+    found = index.locate(points)
+    yield '100k points: locate', best_of(lambda: index.locate(points), 3), f'{np.count_nonzero(found)} points in a field'
+
+
+@benchmark('geocoder')
+def bench_geocoder():
+    def cold_load():
+        geocoder.dataset.cache_clear()
+        geocoder.dataset()
+
+    yield 'open memory-mapped dataset', best_of(cold_load), f'{len(geocoder.dataset())} places'
+    rng = random.Random(3)
+    queries = [(rng.uniform(24, 36), rng.uniform(61, 77)) for _ in range(2000)]
+    xyz = np.asarray(geocoder.dataset()['xyz'], dtype=np.float64)
+
+    def brute_force(queries=queries):
+        for lat, lng in queries:
+            np.argmin(((xyz - geocoder.unit_vectors(lat, lng)) ** 2).sum(axis=1))
+
+    per_query = len(queries)
+    kd_tree = best_of(lambda: [geocoder.nearest(lat, lng) for lat, lng in queries], 3)
+    yield '2000 lookups: KD-tree nearest', kd_tree, f'{kd_tree / per_query * 1e6:.0f} us/lookup'
+    linear = best_of(brute_force, 3)
+    yield '2000 lookups: NumPy linear scan', linear, f'{linear / per_query * 1e6:.0f} us/lookup'
+    checks = best_of(lambda: [geocoder.check_location(lat, lng, 'Lahore', 'PK') for lat, lng in queries], 3)
+    yield '2000 submissions: check_location', checks, f'{checks / per_query * 1e6:.0f} us/check'
+
+    # The bundled dataset is small enough for a linear scan to win; the tree
+    # pays off once it grows to a GeoNames-sized extract
+    np_rng = np.random.default_rng(3)
+    large = np.zeros(200000, dtype=geocoder.PLACE_DTYPE)
+    large['lat'] = np.degrees(np.arcsin(np_rng.uniform(-1, 1, len(large))))
+    large['lng'] = np_rng.uniform(-180, 180, len(large))
+    large['xyz'] = geocoder.unit_vectors(large['lat'].astype(np.float64), large['lng'].astype(np.float64))
+    large = large[geocoder.kd_order(large['xyz'].astype(np.float64))]
+    with mock.patch.object(geocoder, 'dataset', lambda: large):
+        kd_tree = best_of(lambda: [geocoder.nearest(lat, lng) for lat, lng in queries], 3)
+    yield '200k places, 2000 lookups: KD-tree', kd_tree, f'{kd_tree / per_query * 1e6:.0f} us/lookup'
+    xyz = large['xyz'].astype(np.float64)
+    linear = best_of(lambda: brute_force(queries[:100]), 1)
+    yield '200k places, 100 lookups: linear scan', linear, f'{linear / 100 * 1e6:.0f} us/lookup'
+
+
+@benchmark('bulk')
+def bench_bulk():
+    from .models import User
+    from .views import BulkFieldSubmissionView, FieldSubmissionView
+
+    factory = APIRequestFactory()
+    single_view, bulk_view = FieldSubmissionView.as_view(), BulkFieldSubmissionView.as_view()
+    items = []
+    for field in synthetic_fields(200, vertices=32):
+        items.append({name: field[name] for name in (
+            'first_name', 'last_name', 'email', 'phone', 'city', 'country', 'zip_code',
+            'field_name', 'crop_name', 'plantation_date', 'lat', 'lng', 'polygon',
+        )})
+
+    def post(view, data):
+        request = factory.post('/', data, format='json')
+        force_authenticate(request, user)
+        response = view(request)
+        assert response.status_code in (201, 207), response.data
+
+    with transaction.atomic():
+        user = User.objects.create_user(username='benchmark-bulk', password=None)
+        single = best_of(lambda: [post(single_view, item) for item in items], 3)
+        yield '200 fields: one POST /fields/add/ each', single, f'{len(items) / single:.0f} fields/s'
+        bulk = best_of(lambda: post(bulk_view, {'fields': items}), 3)
+        yield '200 fields: one POST /fields/bulk/', bulk, f'{len(items) / bulk:.0f} fields/s'
+        transaction.set_rollback(True)
+
+
+@benchmark('timeseries')
+def bench_timeseries():
+    from . import timeseries
+    from .models import FieldSubmission, TimeSeriesChunk, User
+
+    start = date(2015, 1, 1)
+    dates = [start + timedelta(days=i) for i in range(3650)]
+    values = np.random.default_rng(0).uniform(-0.1, 0.9, len(dates))
+
+    with transaction.atomic():
+        user = User.objects.create_user(username='benchmark-timeseries', password=None)
+        field = FieldSubmission.objects.create(user=user, **{name: value for name, value in synthetic_fields(1)[0].items() if name in (
+            'first_name', 'last_name', 'email', 'phone', 'city', 'country', 'zip_code',
+            'field_name', 'crop_name', 'plantation_date', 'lat', 'lng', 'polygon',
+        )})
+        seconds = best_of(lambda: timeseries.append(field.id, 'ndvi', dates, values), 3)
+        yield '10 years of daily NDVI: one append', seconds, ''
+        daily = best_of(lambda: [timeseries.append(field.id, 'evi', [day], [0.5]) for day in dates[:365]], 1)
+        yield '365 single-day appends', daily, f'{daily / 365 * 1000:.2f} ms each'
+        stored = sum(len(chunk.data) for chunk in TimeSeriesChunk.objects.filter(field=field, index='ndvi'))
+        month = best_of(lambda: timeseries.query(field.id, 'ndvi', date(2020, 6, 1), date(2020, 6, 30)))
+        yield 'query one month of 10 years', month, f'{stored / len(dates):.1f} bytes/point stored'
+        full = best_of(lambda: timeseries.query(field.id, 'ndvi'))
+        yield 'query full history', full, ''
+        days, series = timeseries.query(field.id, 'ndvi')
+        monthly = best_of(lambda: timeseries.rollup(days, series, 'monthly'))
+        yield 'monthly rollup of full history', monthly, ''
+        transaction.set_rollback(True)
+
+
+@benchmark('profiling')
+def bench_profiling():
+    from . import profiling
+
+    fields = synthetic_fields(500)
+    render = JSONRenderer().render
+
+    plain = best_of(lambda: render(fields))
+    yield 'render 500 fields', plain, ''
+
+    def profiled(trigger):
+        with profiling.Profile(trigger):
+            render(fields)
+
+    sampled = best_of(lambda: profiled('sampled'))
+    yield 'render 500 fields, stack sampling', sampled, f'{(sampled / plain - 1) * 100:+.0f}%'
+    traced = best_of(lambda: profiled('requested'))
+    yield 'render 500 fields, sampling + tracemalloc', traced, f'{(traced / plain - 1) * 100:+.0f}%'
+
+
+@benchmark('clusters')
+def bench_clusters():
+    from .clusters import ClusterIndex
+
+    rng = np.random.default_rng(0)
+    count = 1_000_000
+    # Fields bunch around farming towns, like real submissions
+    towns = np.column_stack((rng.uniform(24, 36, 2000), rng.uniform(61, 77, 2000)))
+    town = rng.integers(0, len(towns), count)
+    lat = towns[town, 0] + rng.normal(0, 0.1, count)
+    lng = towns[town, 1] + rng.normal(0, 0.1, count)
+    ids = np.arange(1, count + 1)
+    hectares = rng.uniform(0.5, 20, count)
+
+    start = time.perf_counter()
+    index = ClusterIndex(ids, lat, lng, hectares, max_zoom=16)
+    build = time.perf_counter() - start
+    yield '1M fields: build all zooms', build, f'{index.nbytes / 2 ** 20:.0f} MB'
+    sizes = ', '.join(f'z{zoom}: {len(level.keys) / 1000:.0f}k' for zoom, level in enumerate(index.levels) if zoom % 4 == 0)
+    yield '1M fields: entries per zoom', None, sizes
+
+    for zoom, bbox in ((5, (60, 23, 78, 37)), (10, (73.5, 31, 74.5, 31.8)), (14, (74.0, 31.4, 74.06, 31.45))):
+        seconds = best_of(lambda: index.clusters(*bbox, zoom, limit=5000))
+        results, _ = index.clusters(*bbox, zoom, limit=5000)
+        yield f'query zoom {zoom} viewport', seconds, f'{len(results)} clusters'
+
+    moved = best_of(lambda: [index.add(field_id, 30.0, 70.0, 5.0) for field_id in range(1, 11)], 1)
+    yield '10 approvals (incremental)', moved, f'{moved / 10 * 1000:.1f} ms each'
+    removed = best_of(lambda: [index.remove(field_id) for field_id in range(1, 11)], 1)
+    yield '10 unapprovals (incremental)', removed, f'{removed / 10 * 1000:.1f} ms each'
+
+
+@benchmark('notifications')
+def bench_notifications():
+    import asyncio
+    import tracemalloc
+    from types import SimpleNamespace
+
+    from django.test import override_settings
+
+    from . import notifications, sse
+
+    count = 5000
+    heartbeats, delivered = [], []
+
+    async def run():
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            body = message.get('body', b'')
+            if body.startswith(b': heartbeat'):
+                heartbeats.append(time.perf_counter())
+            elif body.startswith(b'id: '):
+                delivered.append(time.perf_counter())
+
+        def scope(user_id):
+            return {'type': 'http', 'method': 'GET', 'path': sse.STREAM_PATH, 'query_string': b'',
+                    'headers': [(b'authorization', f'Bearer {user_id}'.encode())]}
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        streams = [asyncio.ensure_future(sse.stream(scope(user_id), receive, send)) for user_id in range(count)]
+        while notifications.hub.connections() < count:
+            await asyncio.sleep(0.01)
+        per_stream = (tracemalloc.get_traced_memory()[0] - before) / count
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for user_id in range(count):
+            notifications.backend().publish(user_id, 'field.approved', {'field_id': user_id})
+        while len(delivered) < count:
+            await asyncio.sleep(0.001)
+        fan_out = max(delivered) - start
+
+        heartbeats.clear()
+        while len(heartbeats) < count:
+            await asyncio.sleep(0.01)
+        sweep = max(heartbeats) - min(heartbeats)
+        disconnect.set()
+        await asyncio.gather(*streams)
+        return per_stream, fan_out, sweep
+
+    # Tokens are user ids: authentication isn't what's being measured
+    with override_settings(NOTIFICATIONS_BACKEND='memory', NOTIFICATIONS_HEARTBEAT_SECONDS=1), \
+            mock.patch.object(sse, '_authenticate', lambda token: SimpleNamespace(pk=int(token))):
+        per_stream, fan_out, sweep = asyncio.run(run())
+    yield f'{count} idle streams: memory', None, f'{per_stream / 1024:.1f} KiB per stream'
+    yield f'{count} streams: one event each, publish to last send', fan_out, f'{fan_out / count * 1e6:.0f} us per event'
+    yield f'{count} streams: one heartbeat round', sweep, ''
+
+
+@benchmark('tiling')
+def bench_tiling():
+    from . import tiling
+
+    # A ragged estate about 80 km across: 12 tiles at 10 m
+    estate = synthetic_polygon(random.Random(0), 31.5, 74.3, vertices=5000, radius=0.3)
+    seconds = best_of(lambda: tiling.plan(estate))
+    tile_plan = tiling.plan(estate)
+    yield '5000-vertex estate: plan and clip', seconds, f'{len(tile_plan.tiles)} tiles, {tile_plan.width} x {tile_plan.height} px'
+    seconds = best_of(lambda: [tile.key for tile in tile_plan.tiles])
+    yield '5000-vertex estate: tile cache keys', seconds, ''
+
+    rng = np.random.default_rng(0)
+    parts = [
+        {'ndvi': {'count': int(rng.integers(1, 6_000_000)), 'mean': rng.random(), 'std': rng.random(), 'min': 0.0, 'max': 1.0}}
+        for _ in tile_plan.tiles
+    ]
+    yield 'merge tile statistics', best_of(lambda: tiling.merge_statistics(parts)), ''
+    small = tiling.plan(estate, max_pixels=250)
+    images = {tile.key: np.zeros((tile.height, tile.width), dtype=np.float32) for tile in small.tiles}
+    seconds = best_of(lambda: tiling.mosaic(small, images), 3)
+    yield f'mosaic {len(small.tiles)} tiles', seconds, f'{small.width} x {small.height} px'
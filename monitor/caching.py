@@ -0,0 +1,113 @@
+"""
+Per-user response cache for the dashboard read endpoints.
+
+Entries are keyed by view, user id and a per-user data version. Anything that
+changes what a user would see bumps the version instead of hunting down keys,
+so stale entries simply become unreachable and age out of the cache.
+
+Every worker has to see every bump, so caching is only on
+(``RESPONSE_CACHE_ENABLED``) when the cache is shared, i.e. Redis: with
+per-process memory caches other workers would keep serving stale responses.
+"""
+
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+from . import metrics, replicas
+from .models import FieldSubmission, User
+
+CACHE_REQUESTS = metrics.Counter(
+    'response_cache_requests_total', 'Per-user response cache lookups by view and result.',
+    ('view', 'result'),
+)
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'datav:{user_id}'
+
+
+def get_user_version(user_id):
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Seed from the clock so an evicted counter can't restart at a value
+        # that older cached entries were stored under
+        cache.add(_version_key(user_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def bump_user_version(user_id):
+    cache = _cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+    # The user's next reads must see this change even if replicas lag
+    replicas.pin_user(user_id)
+
+
+def bump_user_versions(user_ids):
+    for user_id in set(user_ids):
+        bump_user_version(user_id)
+
+
+def _bump_now_and_on_commit(user_id):
+    bump_user_version(user_id)
+    # Bump again once the write is visible, so a read that raced the open
+    # transaction can't leave pre-commit data cached under the new version
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+@receiver(post_save, sender=FieldSubmission)
+@receiver(post_delete, sender=FieldSubmission)
+def bump_version_on_field_change(sender, instance, **kwargs):
+    _bump_now_and_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def bump_version_on_user_change(sender, instance, **kwargs):
+    # user_profile embeds the user's own details
+    _bump_now_and_on_commit(instance.pk)
+
+
+def cached_user_response(view_name):
+    """
+    Cache a successful GET response's data per user and data version.
+    Works on both APIView methods and @api_view functions.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            request = args[-1]
+            # Query parameters (e.g. a search) aren't part of the key, so skip caching
+            if not settings.RESPONSE_CACHE_ENABLED or request.method != 'GET' \
+                    or not request.user.is_authenticated or request.GET:
+                return view_func(*args, **kwargs)
+
+            cache = _cache()
+            user_id = request.user.pk
+            key = f'resp:{view_name}:{user_id}:{get_user_version(user_id)}'
+            data = cache.get(key)
+            if data is not None:
+                CACHE_REQUESTS.inc(view=view_name, result='hit')
+                return Response(data)
+
+            CACHE_REQUESTS.inc(view=view_name, result='miss')
+            response = view_func(*args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,143 @@
+"""
+Per-user field change log behind ``GET /api/v1/fields/changes/?since=``.
+
+Every write to a FieldSubmission adds a ``FieldChange`` (created, updated,
+approved, unapproved or deleted) in the same transaction. Saves and deletes
+are logged by signals; ``bulk_create`` and ``queryset.update()`` callers must
+call ``record`` themselves.
+
+Cursors are ``seq`` values, stamped after commit rather than at insert:
+``stamp`` takes a lock (a PostgreSQL advisory lock, SQLite's write lock
+elsewhere), then numbers every committed unstamped entry after the current
+head. An entry committed later can only ever get a higher number, so a
+client that has seen cursor N never misses a change numbered at or below N,
+however transactions interleave. Entries left unstamped by a crash are
+stamped by the next writer or reader.
+
+``compact`` keeps only each field's latest entry, which is all a client
+needs, and drops tombstones older than ``FIELD_CHANGES_RETENTION_DAYS``. A
+client whose cursor predates dropped tombstones gets 410 and resyncs.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import FieldChange, FieldChangeCompaction, FieldSubmission
+
+ADVISORY_LOCK_ID = 0x6669656c64  # 'field'
+
+
+class CursorExpired(Exception):
+    """The log no longer holds everything that happened after the cursor"""
+
+
+def record(entries):
+    """Log ``(field_id, user_id, kind)`` entries; they get cursors once the transaction commits"""
+    changes = [FieldChange(field_id=field_id, user_id=user_id, kind=kind) for field_id, user_id, kind in entries]
+    if changes:
+        FieldChange.objects.bulk_create(changes)
+        transaction.on_commit(stamp)
+
+
+def _lock(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [ADVISORY_LOCK_ID])
+    else:
+        # A write that matches nothing still takes SQLite's database write lock
+        FieldChange.objects.filter(pk=-1).update(seq=None)
+
+
+def head():
+    """The highest cursor handed out so far"""
+    seq = FieldChange.objects.aggregate(head=Max('seq'))['head'] or 0
+    horizon = FieldChangeCompaction.objects.aggregate(horizon=Max('horizon'))['horizon'] or 0
+    return max(seq, horizon)
+
+
+def stamp():
+    """Number committed unstamped entries in id order; returns the new head"""
+    with transaction.atomic():
+        _lock(connections[router.db_for_write(FieldChange)])
+        current = head()
+        pending = list(FieldChange.objects.filter(seq__isnull=True).order_by('id').only('id'))
+        for seq, change in enumerate(pending, current + 1):
+            change.seq = seq
+        FieldChange.objects.bulk_update(pending, ['seq'], batch_size=500)
+    return current + len(pending)
+
+
+def changes_since(user, since, limit=None):
+    """
+    ``(cursor, has_more, changed ids, deleted ids)`` for ``user``'s fields
+    after cursor ``since``, at most ``limit`` log entries at a time. Raises
+    ValueError for cursors never handed out.
+    """
+    limit = limit or settings.FIELD_CHANGES_PAGE_SIZE
+    if FieldChange.objects.filter(seq__isnull=True).exists():
+        stamp()
+    current = head()
+    if not 0 <= since <= current:
+        raise ValueError('Unknown cursor')
+    horizon = FieldChangeCompaction.objects.aggregate(horizon=Max('horizon'))['horizon'] or 0
+    if since < horizon:
+        raise CursorExpired(horizon)
+    entries = list(
+        FieldChange.objects.filter(user_id=user.pk, seq__gt=since).order_by('seq').values_list('seq', 'field_id', 'kind')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    latest = {field_id: kind for _, field_id, kind in entries}
+    changed = [field_id for field_id, kind in latest.items() if kind != FieldChange.DELETED]
+    deleted = [field_id for field_id, kind in latest.items() if kind == FieldChange.DELETED]
+    # With nothing left for this user, skip the client past everyone else's entries
+    cursor = entries[-1][0] if has_more else max([current, *(seq for seq, _, _ in entries)])
+    return cursor, has_more, changed, deleted
+
+
+def compact(now=None):
+    """Collapse the log to each field's latest entry and expire old tombstones; returns entries removed"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        _lock(connections[router.db_for_write(FieldChange)])
+        latest = FieldChange.objects.filter(field_id=OuterRef('field_id'), seq__isnull=False).order_by('-seq').values('seq')[:1]
+        superseded, _ = FieldChange.objects.filter(seq__isnull=False, seq__lt=Subquery(latest)).delete()
+        expired = FieldChange.objects.filter(
+            kind=FieldChange.DELETED, seq__isnull=False,
+            changed_at__lt=now - timedelta(days=settings.FIELD_CHANGES_RETENTION_DAYS),
+        )
+        horizon = expired.aggregate(horizon=Max('seq'))['horizon']
+        dropped, _ = expired.delete()
+        if horizon is not None:
+            FieldChangeCompaction.objects.create(horizon=horizon, removed=superseded + dropped)
+    return superseded + dropped
+
+
+@receiver(post_save, sender=FieldSubmission)
+def record_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        kind = FieldChange.CREATED
+    else:
+        # analytics.remember_previous_contribution saved the row as it was before
+        before = getattr(instance, '_summary_before', None)
+        was_approved = before['is_approved'] if before else instance.is_approved
+        if instance.is_approved and not was_approved:
+            kind = FieldChange.APPROVED
+        elif was_approved and not instance.is_approved:
+            kind = FieldChange.UNAPPROVED
+        else:
+            kind = FieldChange.UPDATED
+    record([(instance.pk, instance.user_id, kind)])
+
+
+@receiver(post_delete, sender=FieldSubmission)
+def record_delete(sender, instance, **kwargs):
+    record([(instance.pk, instance.user_id, FieldChange.DELETED)])
@@ -0,0 +1,422 @@
+"""
+Zoom-aware clustering of approved fields for overview maps.
+
+``ClusterIndex`` precomputes, for every zoom 0..``CLUSTER_MAX_ZOOM``, the
+approved fields' lat/lng points grouped into grid cells of 1/8 of a web map
+tile (32 px on 256 px tiles), plus one entry per field for deeper zooms.
+Each cluster keeps its point count, mean Web Mercator position, total
+hectares and the sum of its field ids (the id itself once one field is
+left).
+
+Cells are numbered along a Z-order (Morton) curve, so each level is one
+sorted key array and the parent of a cell is ``key >> 2``: the whole
+hierarchy is built from one sort, a ``(bbox, zoom)`` query is a few
+``searchsorted`` calls over the key ranges of the quadtree cells covering the
+bbox, and adding or removing a field updates exactly one entry per level.
+Cells emptied by removals stay as zero-count entries until the index is
+compacted.
+
+Every process keeps its own index, built on first use, and before answering
+replays the changes other processes made since, or rebuilds from the
+database if they are too many or no longer known. ``CLUSTER_CHANGE_FEED``
+says where those changes come from:
+
+* ``cache``: approval changes are published after commit to a numbered
+  change feed in the default cache, which must be shared by every process
+  (Redis); the default when ``REDIS_URL`` is set.
+* ``database``: the field change log (monitor.changes), which records every
+  write; each request checks its head and reloads the fields changed since.
+
+Memory (``manage.py benchmark clusters``, 1M fields around 2000 towns in
+Pakistan, max zoom 16): about 200 MB, i.e. 5.7M entries of 32 bytes over 18
+levels plus 20 bytes per field for the id lookup. Zooms 12 and deeper hold
+nearly one entry per field each, so lowering ``CLUSTER_MAX_ZOOM`` by one
+saves about 32 MB per 1M fields.
+"""
+
+import logging
+import math
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changes as change_log
+from .models import FieldChange, FieldChangeCompaction, FieldSubmission
+
+logger = logging.getLogger(__name__)
+CELL_BITS = 3  # 2**3 cells per tile side
+MAX_LAT = 85.05112878
+GENERATION_KEY = 'clusters:generation'
+CHANGE_TTL = 24 * 3600
+
+_index = None
+_generation = 0
+_lock = threading.RLock()
+
+
+def project(lat, lng):
+    """Web Mercator x, y in [0, 1) (y grows southwards)"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LAT, MAX_LAT)
+    x = np.asarray(lng, dtype=np.float64) / 360 + 0.5
+    y = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) / (2 * np.pi)
+    upper = np.nextafter(1.0, 0.0)
+    return np.clip(x, 0.0, upper), np.clip(y, 0.0, upper)
+
+
+def stored(v):
+    """Coordinates as the index stores them (float32), which is what cells are derived from"""
+    v = np.asarray(v, dtype=np.float32)
+    return np.minimum(v, np.nextafter(np.float32(1.0), np.float32(0.0))).astype(np.float64)
+
+
+def unproject(x, y):
+    lng = (np.asarray(x, dtype=np.float64) - 0.5) * 360
+    lat = np.degrees(2 * np.arctan(np.exp((0.5 - np.asarray(y, dtype=np.float64)) * 2 * np.pi)) - np.pi / 2)
+    return lat, lng
+
+
+def _spread(v):
+    """Interleave zero bits into the low 32 bits of each value"""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def morton(cx, cy):
+    return _spread(np.asarray(cx)) | (_spread(np.asarray(cy)) << np.uint64(1))
+
+
+def cells(x, y, zoom):
+    side = 1 << (zoom + CELL_BITS)
+    return (np.asarray(x) * side).astype(np.int64), (np.asarray(y) * side).astype(np.int64)
+
+
+class Level:
+    __slots__ = ('keys', 'count', 'x', 'y', 'hectares', 'id_sum')
+
+    def __init__(self, keys, count, x, y, hectares, id_sum):
+        self.keys = keys
+        self.count = count.astype(np.int32)
+        self.x = x.astype(np.float32)
+        self.y = y.astype(np.float32)
+        self.hectares = hectares.astype(np.float32)
+        self.id_sum = id_sum.astype(np.int64)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def parent(self):
+        """The level one zoom out, merging the cells that share a parent"""
+        keys = self.keys >> np.uint64(2)
+        if not len(keys):
+            return Level(keys, self.count, self.x, self.y, self.hectares, self.id_sum)
+        starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+        count = np.add.reduceat(self.count.astype(np.int64), starts)
+        weight = self.count.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x = np.add.reduceat(self.x * weight, starts) / count
+            y = np.add.reduceat(self.y * weight, starts) / count
+        return Level(
+            keys[starts], count, np.nan_to_num(x), np.nan_to_num(y),
+            np.add.reduceat(self.hectares.astype(np.float64), starts), np.add.reduceat(self.id_sum, starts),
+        )
+
+    def insert(self, at, key, x, y, hectares, field_id):
+        self.keys = np.insert(self.keys, at, np.uint64(key))
+        self.count = np.insert(self.count, at, 1)
+        self.x = np.insert(self.x, at, x)
+        self.y = np.insert(self.y, at, y)
+        self.hectares = np.insert(self.hectares, at, hectares)
+        self.id_sum = np.insert(self.id_sum, at, field_id)
+
+    def adjust(self, i, x, y, hectares, field_id, sign):
+        n = int(self.count[i])
+        remaining = n + sign
+        if remaining <= 0:
+            self.count[i] = self.x[i] = self.y[i] = self.hectares[i] = self.id_sum[i] = 0
+            return
+        self.x[i] = (float(self.x[i]) * n + sign * x) / remaining
+        self.y[i] = (float(self.y[i]) * n + sign * y) / remaining
+        self.count[i] = remaining
+        self.hectares[i] = max(float(self.hectares[i]) + sign * hectares, 0.0)
+        self.id_sum[i] += sign * field_id
+
+
+class ClusterIndex:
+    """Clusters for every zoom of a set of (id, lat, lng, hectares) points"""
+
+    def __init__(self, ids, lat, lng, hectares, max_zoom=None):
+        self.max_zoom = settings.CLUSTER_MAX_ZOOM if max_zoom is None else max_zoom
+        ids = np.asarray(ids, dtype=np.int64)
+        # Cells come from the stored float32 positions, so add() and remove()
+        # find the same cell for a field that the build put it in
+        x, y = (stored(v) for v in project(lat, lng))
+        hectares = np.nan_to_num(np.asarray(hectares, dtype=np.float64))
+
+        order = np.argsort(ids, kind='stable')
+        self.member_ids = ids[order]
+        self.member_x = x[order].astype(np.float32)
+        self.member_y = y[order].astype(np.float32)
+        self.member_hectares = hectares[order].astype(np.float32)
+        self.dead = 0
+
+        # Zooms past max_zoom show single fields
+        keys = morton(*cells(x, y, self.points_zoom))
+        order = np.argsort(keys, kind='stable')
+        levels = [Level(keys[order], np.ones(len(ids)), x[order], y[order], hectares[order], ids[order])]
+        for _ in range(self.points_zoom):
+            levels.append(levels[-1].parent())
+        self.levels = levels[::-1]
+
+    @property
+    def points_zoom(self):
+        return self.max_zoom + 1
+
+    @property
+    def nbytes(self):
+        members = self.member_ids.nbytes + self.member_x.nbytes + self.member_y.nbytes + self.member_hectares.nbytes
+        return members + sum(level.nbytes for level in self.levels)
+
+    def __len__(self):
+        return len(self.member_ids)
+
+    def _member(self, field_id):
+        i = int(np.searchsorted(self.member_ids, field_id))
+        return i if i < len(self.member_ids) and self.member_ids[i] == field_id else None
+
+    def add(self, field_id, lat, lng, hectares):
+        """Add (or move) an approved field"""
+        self.remove(field_id)
+        x, y = (float(stored(value)) for value in project(lat, lng))
+        hectares = float(hectares or 0.0)
+        at = int(np.searchsorted(self.member_ids, field_id))
+        self.member_ids = np.insert(self.member_ids, at, field_id)
+        self.member_x = np.insert(self.member_x, at, x)
+        self.member_y = np.insert(self.member_y, at, y)
+        self.member_hectares = np.insert(self.member_hectares, at, hectares)
+        # Reuse the mean position as stored, so a later removal subtracts exactly it
+        self._apply(field_id, self.member_x[at], self.member_y[at], self.member_hectares[at], +1)
+
+    def remove(self, field_id):
+        """Take a field out; no-op if it isn't in the index"""
+        at = self._member(field_id)
+        if at is None:
+            return
+        self._apply(field_id, self.member_x[at], self.member_y[at], self.member_hectares[at], -1)
+        self.member_ids = np.delete(self.member_ids, at)
+        self.member_x = np.delete(self.member_x, at)
+        self.member_y = np.delete(self.member_y, at)
+        self.member_hectares = np.delete(self.member_hectares, at)
+
+    def _apply(self, field_id, x, y, hectares, sign):
+        x, y, hectares = float(x), float(y), float(hectares)
+        key = int(morton(*cells(x, y, self.points_zoom)))
+        points = self.levels[self.points_zoom]
+        if sign > 0:
+            points.insert(int(np.searchsorted(points.keys, np.uint64(key), 'right')), key, x, y, hectares, field_id)
+        else:
+            lo, hi = np.searchsorted(points.keys, np.uint64(key), 'left'), np.searchsorted(points.keys, np.uint64(key), 'right')
+            matches = np.flatnonzero((points.id_sum[lo:hi] == field_id) & (points.count[lo:hi] > 0))
+            points.adjust(lo + int(matches[0]), x, y, hectares, field_id, -1)
+            self.dead += 1
+        for zoom in range(self.points_zoom - 1, -1, -1):
+            key >>= 2
+            level = self.levels[zoom]
+            i = int(np.searchsorted(level.keys, np.uint64(key)))
+            if i < len(level.keys) and level.keys[i] == key:
+                level.adjust(i, x, y, hectares, field_id, sign)
+            else:
+                level.insert(i, key, x, y, hectares, field_id)
+
+    def compacted(self):
+        """A fresh index of the same fields, without emptied entries"""
+        lat, lng = unproject(self.member_x, self.member_y)
+        return ClusterIndex(self.member_ids, lat, lng, self.member_hectares, self.max_zoom)
+
+    def _ranges(self, level, zoom, x0, y0, x1, y1):
+        """Entry indexes of ``level`` in cells touching the bbox"""
+        (cx0, cx1), (cy0, cy1) = cells([x0, x1], [y0, y1], zoom)
+        # Cover the bbox with at most ~16x16 quadtree cells, each a contiguous key range
+        shift = 0
+        while ((cx1 >> shift) - (cx0 >> shift) + 1) * ((cy1 >> shift) - (cy0 >> shift) + 1) > 256:
+            shift += 1
+        cover_x, cover_y = np.meshgrid(np.arange(cx0 >> shift, (cx1 >> shift) + 1),
+                                       np.arange(cy0 >> shift, (cy1 >> shift) + 1))
+        starts = morton(cover_x.ravel(), cover_y.ravel()) << np.uint64(2 * shift)
+        ends = starts + np.uint64(1 << (2 * shift))
+        lo, hi = np.searchsorted(level.keys, starts), np.searchsorted(level.keys, ends)
+        spans = [np.arange(a, b) for a, b in zip(lo, hi) if b > a]
+        return np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+
+    def query(self, west, south, east, north, zoom):
+        """
+        Clusters (and single fields) of ``zoom`` whose position is inside the
+        bbox, largest first. A bbox crossing the antimeridian has west > east.
+        """
+        zoom = min(max(int(zoom), 0), self.points_zoom)
+        level = self.levels[zoom]
+        (x0, x1), (y0, y1) = project([north, south], [west, east])
+        y0, y1 = float(y0), float(y1)
+        if west <= east:
+            boxes = [(float(x0), float(x1))]
+        else:
+            boxes = [(float(x0), 1.0), (0.0, float(x1))]
+        found = []
+        for bx0, bx1 in boxes:
+            idx = self._ranges(level, zoom, bx0, y0, np.nextafter(bx1, 0.0), y1)
+            keep = (level.count[idx] > 0) & (level.x[idx] >= bx0) & (level.x[idx] <= bx1) \
+                & (level.y[idx] >= y0) & (level.y[idx] <= y1)
+            found.append(idx[keep])
+        idx = np.concatenate(found)
+        return idx[np.argsort(-level.count[idx], kind='stable')], level
+
+    def clusters(self, west, south, east, north, zoom, limit=None):
+        idx, level = self.query(west, south, east, north, zoom)
+        truncated = limit is not None and len(idx) > limit
+        idx = idx[:limit]
+        lat, lng = unproject(level.x[idx], level.y[idx])
+        results = []
+        for i, row_lat, row_lng in zip(idx, lat, lng):
+            count = int(level.count[i])
+            cluster = {
+                'lat': round(float(row_lat), 6), 'lng': round(float(row_lng), 6),
+                'count': count, 'hectares': round(float(level.hectares[i]), 4),
+            }
+            if count == 1:
+                cluster['field_id'] = int(level.id_sum[i])
+            results.append(cluster)
+        return results, truncated
+
+
+def load():
+    """A ClusterIndex of every approved field"""
+    rows = np.array(
+        list(FieldSubmission.objects.filter(is_approved=True).values_list('id', 'lat', 'lng', 'area_hectares')),
+        dtype=np.float64,
+    ).reshape(-1, 4)
+    return ClusterIndex(rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2], rows[:, 3])
+
+
+def _cache_generation():
+    return cache.get(GENERATION_KEY, 0)
+
+
+def _cache_changes(since, until):
+    keys = [f'clusters:change:{number}' for number in range(since + 1, until + 1)]
+    found = cache.get_many(keys)
+    return [found[key] for key in keys] if len(found) == len(keys) else None
+
+
+def _log_generation():
+    if FieldChange.objects.filter(seq__isnull=True).exists():
+        change_log.stamp()
+    return change_log.head()
+
+
+def _log_changes(since, until):
+    horizon = FieldChangeCompaction.objects.aggregate(horizon=Max('horizon'))['horizon'] or 0
+    if since < horizon:
+        return None
+    field_ids = set(FieldChange.objects.filter(seq__gt=since, seq__lte=until).values_list('field_id', flat=True))
+    rows = FieldSubmission.objects.filter(pk__in=field_ids).values_list('id', 'is_approved', 'lat', 'lng', 'area_hectares')
+    found = {row[0]: _change(*row) for row in rows}
+    return [found.get(field_id, (field_id, None)) for field_id in sorted(field_ids)]
+
+
+FEEDS = {'cache': (_cache_generation, _cache_changes), 'database': (_log_generation, _log_changes)}
+
+
+def current_index():
+    """This process's index, brought up to date with the change feed"""
+    global _index, _generation
+    generation_of, changes_between = FEEDS[settings.CLUSTER_CHANGE_FEED]
+    with _lock:
+        shared = generation_of()
+        if _index is not None and shared != _generation:
+            pending = None
+            if _generation < shared <= _generation + settings.CLUSTER_MAX_REPLAY:
+                pending = changes_between(_generation, shared)
+            if pending is None:
+                _index = None
+            else:
+                try:
+                    for field_id, point in pending:
+                        if point is None:
+                            _index.remove(field_id)
+                        else:
+                            _index.add(field_id, *point)
+                except Exception:
+                    # A half-applied replay leaves the index inconsistent; rebuild it
+                    logger.exception("Cluster index replay failed", extra={'event': 'clusters.replay_error'})
+                    _index = None
+                else:
+                    _generation = shared
+                    if _index.dead > max(len(_index), 1000) // 10:
+                        _index = _index.compacted()
+        if _index is None:
+            # Changes racing with the load replay harmlessly: add() and remove() are idempotent
+            _generation = shared
+            _index = load()
+        return _index
+
+
+def reset():
+    """Drop this process's index (tests, and after bulk imports)"""
+    global _index, _generation
+    with _lock:
+        _index, _generation = None, 0
+
+
+def publish(changes):
+    """Queue ``(field_id, (lat, lng, hectares) or None)`` changes for every process"""
+    changes = list(changes)
+    if not changes or settings.CLUSTER_CHANGE_FEED != 'cache':
+        return
+    cache.add(GENERATION_KEY, 0, timeout=None)
+    last = cache.incr(GENERATION_KEY, len(changes))
+    cache.set_many({
+        f'clusters:change:{last - len(changes) + n}': change for n, change in enumerate(changes, 1)
+    }, timeout=CHANGE_TTL)
+
+
+def _change(field_id, is_approved, lat, lng, hectares):
+    if is_approved and lat is not None and lng is not None and math.isfinite(lat) and math.isfinite(lng):
+        return field_id, (lat, lng, hectares)
+    return field_id, None
+
+
+@receiver(post_save, sender=FieldSubmission)
+def publish_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # analytics.remember_previous_contribution saved the row as it was before
+    before = getattr(instance, '_summary_before', None)
+    if not instance.is_approved and not (before and before['is_approved']):
+        return
+    change = _change(instance.pk, instance.is_approved, instance.lat, instance.lng, instance.area_hectares)
+    transaction.on_commit(lambda: publish([change]))
+
+
+@receiver(post_delete, sender=FieldSubmission)
+def publish_on_delete(sender, instance, **kwargs):
+    if instance.is_approved:
+        field_id = instance.pk
+        transaction.on_commit(lambda: publish([(field_id, None)]))
+
+
+def track_bulk_change(field_ids):
+    """Publish fields changed with queryset.update(), which skips post_save"""
+    rows = FieldSubmission.objects.filter(pk__in=list(field_ids)).values_list(
+        'id', 'is_approved', 'lat', 'lng', 'area_hectares',
+    )
+    changes = [_change(*row) for row in rows]
+    transaction.on_commit(lambda: publish(changes))
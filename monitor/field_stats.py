@@ -0,0 +1,250 @@
+"""
+Batch vegetation statistics for every approved field (``manage.py run_field_stats``).
+
+Approved fields are streamed from a DB cursor in pk order, one page at a
+time. Each page is split into groups of nearby fields (sorted by bbox centre,
+capped in count and span) and every group becomes one upstream request;
+requests run on a bounded thread pool and retry with full-jitter backoff.
+Results and the page checkpoint are written in one transaction, and results
+are upserted, so an interrupted run resumes from its last finished page and
+repeating a page is harmless. Fields a response leaves out are recorded on the
+run as failed and asked for again once the pass is over; the run stays
+unfinished until none are left, so rerunning retries only those fields.
+
+The upstream contract (``FIELD_STATS_URL``) takes a FeatureCollection of field
+polygons with their combined bbox and a time range, and answers
+``{"results": {"<field id>": {...stats...}}}``. A field's stats may carry daily
+index values as ``"series": {"ndvi": {"dates": [...], "values": [...]}}``;
+these are appended to the field's time series (monitor.timeseries).
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics, timeseries
+from .locks import advisory_lock
+from .models import FieldStatistics, FieldStatsRun, FieldSubmission
+
+STATS_REQUESTS = metrics.Counter(
+    'field_stats_requests_total', 'Statistics API requests by outcome.', ('outcome',),
+)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class StatsAPIError(Exception):
+    pass
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than a server's Retry-After"""
+    ceiling = min(settings.FIELD_STATS_BACKOFF_CAP, settings.FIELD_STATS_BACKOFF_BASE * 2 ** (attempt - 1))
+    delay = random.uniform(0, ceiling)
+    try:
+        return max(delay, float(retry_after)) if retry_after is not None else delay
+    except ValueError:
+        return delay
+
+
+def approved_fields(after_id=0, only=None):
+    """Approved fields with a polygon, in pk order, streamed from a DB cursor"""
+    rows = FieldSubmission.objects.filter(is_approved=True, pk__gt=after_id, min_lat__isnull=False)
+    if only is not None:
+        rows = rows.filter(pk__in=only)
+    rows = rows.order_by('pk').values('pk', 'polygon', 'min_lat', 'min_lng', 'max_lat', 'max_lng')
+    return rows.iterator(chunk_size=settings.FIELD_STATS_PAGE_SIZE)
+
+
+def pages(rows, size):
+    page = []
+    for row in rows:
+        page.append(row)
+        if len(page) == size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def group_by_proximity(fields, max_fields, max_span):
+    """
+    Split ``fields`` into groups of at most ``max_fields`` whose combined bbox
+    is at most ``max_span`` degrees on each side.
+    """
+    def centre_cell(field):
+        lat = (field['min_lat'] + field['max_lat']) / 2
+        lng = (field['min_lng'] + field['max_lng']) / 2
+        return (int(lat // max_span), int(lng // max_span), lat, lng)
+
+    groups, group, bbox = [], [], None
+    for field in sorted(fields, key=centre_cell):
+        if group:
+            merged = (
+                min(bbox[0], field['min_lat']), min(bbox[1], field['min_lng']),
+                max(bbox[2], field['max_lat']), max(bbox[3], field['max_lng']),
+            )
+            if len(group) < max_fields and merged[2] - merged[0] <= max_span and merged[3] - merged[1] <= max_span:
+                group.append(field)
+                bbox = merged
+                continue
+            groups.append(group)
+        group = [field]
+        bbox = (field['min_lat'], field['min_lng'], field['max_lat'], field['max_lng'])
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _feature(field):
+    ring = [[point['lng'], point['lat']] for point in field['polygon']]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    return {'type': 'Feature', 'id': field['pk'], 'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+
+
+class StatsClient:
+    """Statistics API client; safe to share between pool threads"""
+
+    def __init__(self, url=None, token=None):
+        self.url = url or settings.FIELD_STATS_URL
+        self.token = token if token is not None else settings.FIELD_STATS_TOKEN
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        # requests.Session isn't thread-safe; keep one connection pool per thread
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            if self.token:
+                self._local.session.headers['Authorization'] = f'Bearer {self.token}'
+        return self._local.session
+
+    def fetch(self, group, period_start, period_end):
+        """Stats for one group of fields as {field id: stats}"""
+        payload = {
+            'bbox': [
+                min(f['min_lng'] for f in group), min(f['min_lat'] for f in group),
+                max(f['max_lng'] for f in group), max(f['max_lat'] for f in group),
+            ],
+            'time_range': {'from': period_start.isoformat(), 'to': period_end.isoformat()},
+            'fields': {'type': 'FeatureCollection', 'features': [_feature(field) for field in group]},
+        }
+        for attempt in range(1, settings.FIELD_STATS_MAX_ATTEMPTS + 1):
+            retry_after = None
+            try:
+                with metrics.upstream_timer('field_stats'):
+                    response = self.session.post(self.url, json=payload, timeout=settings.FIELD_STATS_TIMEOUT)
+            except requests.RequestException as exc:
+                error = f'{type(exc).__name__}: {exc}'
+            else:
+                if response.status_code == 200:
+                    STATS_REQUESTS.inc(outcome='ok')
+                    # Ids outside the group would hit the field FK or belong to another page
+                    wanted = {str(field['pk']): field['pk'] for field in group}
+                    return {wanted[pk]: stats for pk, stats in response.json()['results'].items() if pk in wanted}
+                error = f'HTTP {response.status_code}'
+                if response.status_code not in RETRY_STATUSES:
+                    STATS_REQUESTS.inc(outcome='failed')
+                    raise StatsAPIError(f'Statistics request failed: {error}')
+                retry_after = response.headers.get('Retry-After')
+            if attempt == settings.FIELD_STATS_MAX_ATTEMPTS:
+                STATS_REQUESTS.inc(outcome='failed')
+                raise StatsAPIError(f'Statistics request failed after {attempt} attempts: {error}')
+            STATS_REQUESTS.inc(outcome='retried')
+            _sleep(backoff_delay(attempt, retry_after))
+
+
+def write_results(run, page, results):
+    """
+    Upsert a page's results and advance the checkpoint atomically; fields of
+    the page without a result are recorded as failed.
+    """
+    page_ids = {row['pk'] for row in page}
+    results = {pk: stats for pk, stats in results.items() if pk in page_ids}
+    failed = (set(run.failed_field_ids) - page_ids) | (page_ids - set(results))
+    now = timezone.now()
+    rows = [
+        FieldStatistics(
+            field_id=pk, period_start=run.period_start, period_end=run.period_end,
+            stats=stats, computed_at=now,
+        )
+        for pk, stats in results.items()
+    ]
+    with transaction.atomic():
+        FieldStatistics.objects.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=['field', 'period_start', 'period_end'], update_fields=['stats', 'computed_at'],
+        )
+        for pk, stats in results.items():
+            for index, series in (stats.get('series') or {}).items():
+                timeseries.append(pk, index, series['dates'], series['values'])
+        run.last_field_id = max(run.last_field_id, page[-1]['pk'])
+        run.fields_done += len(results)
+        run.failed_field_ids = sorted(failed)
+        run.save(update_fields=['last_field_id', 'fields_done', 'failed_field_ids'])
+
+
+def _fetch_page(pool, client, page, period_start, period_end):
+    """{field id: stats} for one page, one request per group; and the number of groups"""
+    groups = group_by_proximity(page, settings.FIELD_STATS_GROUP_SIZE, settings.FIELD_STATS_GROUP_SPAN_DEGREES)
+    futures = [pool.submit(client.fetch, group, period_start, period_end) for group in groups]
+    results = {}
+    try:
+        for future in futures:
+            results.update(future.result())
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    return results, len(groups)
+
+
+def run(period_start, period_end, client=None, concurrency=None, restart=False, progress=None):
+    """
+    Compute statistics for every approved field over the period, resuming the
+    period's unfinished run unless ``restart``. Returns the FieldStatsRun,
+    finished unless some fields are still missing from upstream's answers.
+    """
+    client = client or StatsClient()
+    concurrency = concurrency or settings.FIELD_STATS_CONCURRENCY
+    with advisory_lock('run-field-stats'):
+        stats_run = None if restart else FieldStatsRun.objects.filter(
+            period_start=period_start, period_end=period_end, finished_at__isnull=True,
+        ).first()
+        if stats_run is None:
+            stats_run = FieldStatsRun.objects.create(period_start=period_start, period_end=period_end)
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='field-stats') as pool:
+            for page in pages(approved_fields(stats_run.last_field_id), settings.FIELD_STATS_PAGE_SIZE):
+                results, requests_made = _fetch_page(pool, client, page, period_start, period_end)
+                write_results(stats_run, page, results)
+                if progress:
+                    progress(stats_run, requests_made)
+
+            # One more try for fields left out of a response; those still missing stay recorded
+            retry = list(approved_fields(only=stats_run.failed_field_ids))
+            if len(retry) < len(stats_run.failed_field_ids):
+                # Unapproved or deleted since; nothing left to fetch
+                stats_run.failed_field_ids = [row['pk'] for row in retry]
+                stats_run.save(update_fields=['failed_field_ids'])
+            for page in pages(retry, settings.FIELD_STATS_PAGE_SIZE):
+                results, requests_made = _fetch_page(pool, client, page, period_start, period_end)
+                write_results(stats_run, page, results)
+                if progress:
+                    progress(stats_run, requests_made)
+
+        # Left unfinished while fields are missing, so a rerun resumes and asks for just those
+        if not stats_run.failed_field_ids:
+            stats_run.finished_at = timezone.now()
+            stats_run.save(update_fields=['finished_at'])
+    return stats_run
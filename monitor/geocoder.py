@@ -0,0 +1,217 @@
+"""
+Offline reverse geocoding against a bundled place dataset.
+
+``monitor/data/places.csv`` is the editable source; ``manage.py build_places``
+compiles it into ``places.npy``, a structured array of unit vectors, names and
+country codes laid out as an implicit KD-tree (each range's median is its
+node, split axes cycle x, y, z). The array is memory-mapped on first lookup,
+so workers start without reading it and share its pages once they do.
+"""
+
+import csv
+import functools
+import heapq
+import math
+import os
+import re
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+
+EARTH_RADIUS_KM = 6371.0088
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+SOURCE_CSV = os.path.join(DATA_DIR, 'places.csv')
+LEAF_SIZE = 64  # subtrees this small are scanned rather than walked
+
+PLACE_DTYPE = np.dtype([
+    ('xyz', '<f4', (3,)),
+    ('lat', '<f4'),
+    ('lng', '<f4'),
+    ('country', 'S2'),
+    ('name', 'S32'),
+])
+
+COUNTRY_NAMES = {
+    'AE': 'United Arab Emirates', 'AF': 'Afghanistan', 'AM': 'Armenia', 'AO': 'Angola', 'AR': 'Argentina',
+    'AT': 'Austria', 'AU': 'Australia', 'AZ': 'Azerbaijan', 'BD': 'Bangladesh', 'BE': 'Belgium',
+    'BF': 'Burkina Faso', 'BG': 'Bulgaria', 'BH': 'Bahrain', 'BO': 'Bolivia', 'BR': 'Brazil', 'BT': 'Bhutan',
+    'BW': 'Botswana', 'BY': 'Belarus', 'CA': 'Canada', 'CD': 'Congo', 'CH': 'Switzerland',
+    'CI': "Cote d'Ivoire", 'CL': 'Chile', 'CN': 'China', 'CO': 'Colombia', 'CU': 'Cuba',
+    'CZ': 'Czechia', 'DE': 'Germany', 'DK': 'Denmark', 'DZ': 'Algeria', 'EC': 'Ecuador', 'EE': 'Estonia',
+    'EG': 'Egypt', 'ES': 'Spain', 'ET': 'Ethiopia', 'FI': 'Finland', 'FR': 'France', 'GB': 'United Kingdom',
+    'GE': 'Georgia', 'GH': 'Ghana', 'GR': 'Greece', 'GT': 'Guatemala', 'HR': 'Croatia', 'HU': 'Hungary',
+    'ID': 'Indonesia', 'IE': 'Ireland', 'IL': 'Israel', 'IN': 'India', 'IQ': 'Iraq', 'IR': 'Iran',
+    'IT': 'Italy', 'JO': 'Jordan', 'JP': 'Japan', 'KE': 'Kenya', 'KG': 'Kyrgyzstan', 'KH': 'Cambodia',
+    'KR': 'South Korea', 'KW': 'Kuwait', 'KZ': 'Kazakhstan', 'LA': 'Laos', 'LB': 'Lebanon', 'LK': 'Sri Lanka',
+    'LT': 'Lithuania', 'LV': 'Latvia', 'LY': 'Libya', 'MA': 'Morocco', 'MD': 'Moldova', 'MG': 'Madagascar',
+    'ML': 'Mali', 'MM': 'Myanmar', 'MN': 'Mongolia', 'MV': 'Maldives', 'MW': 'Malawi', 'MX': 'Mexico',
+    'MY': 'Malaysia', 'MZ': 'Mozambique', 'NA': 'Namibia', 'NE': 'Niger', 'NG': 'Nigeria',
+    'NL': 'Netherlands', 'NO': 'Norway', 'NP': 'Nepal', 'NZ': 'New Zealand', 'OM': 'Oman', 'PE': 'Peru',
+    'PH': 'Philippines', 'PK': 'Pakistan', 'PL': 'Poland', 'PT': 'Portugal', 'PY': 'Paraguay', 'QA': 'Qatar',
+    'RO': 'Romania', 'RS': 'Serbia', 'RU': 'Russia', 'RW': 'Rwanda', 'SA': 'Saudi Arabia', 'SD': 'Sudan',
+    'SE': 'Sweden', 'SG': 'Singapore', 'SN': 'Senegal', 'SO': 'Somalia', 'SY': 'Syria', 'TD': 'Chad',
+    'TH': 'Thailand', 'TJ': 'Tajikistan', 'TM': 'Turkmenistan', 'TN': 'Tunisia', 'TR': 'Turkey',
+    'TZ': 'Tanzania', 'UA': 'Ukraine', 'UG': 'Uganda', 'US': 'United States', 'UY': 'Uruguay',
+    'UZ': 'Uzbekistan', 'VE': 'Venezuela', 'VN': 'Vietnam', 'YE': 'Yemen', 'ZA': 'South Africa',
+    'ZM': 'Zambia', 'ZW': 'Zimbabwe',
+}
+COUNTRY_ALIASES = {
+    'usa': 'US', 'united states of america': 'US', 'america': 'US', 'uk': 'GB', 'england': 'GB',
+    'great britain': 'GB', 'uae': 'AE', 'pak': 'PK', 'ind': 'IN', 'afg': 'AF', 'bgd': 'BD',
+    'turkiye': 'TR', 'burma': 'MM', 'ivory coast': 'CI', 'czech republic': 'CZ', 'korea': 'KR',
+}
+
+Place = namedtuple('Place', 'name country lat lng distance_km')
+LocationCheck = namedtuple('LocationCheck', 'city country warning')
+
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def country_code(value):
+    """ISO alpha-2 code for a free-text country ('pk', 'Pakistan', 'UAE'), or None"""
+    folded = _fold(value)
+    if len(folded) == 2 and folded.upper() in COUNTRY_NAMES:
+        return folded.upper()
+    if folded in COUNTRY_ALIASES:
+        return COUNTRY_ALIASES[folded]
+    return _country_by_name().get(folded)
+
+
+@functools.lru_cache(maxsize=None)
+def _country_by_name():
+    return {_fold(name): code for code, name in COUNTRY_NAMES.items()}
+
+
+def unit_vectors(lat, lng):
+    lat, lng = np.radians(lat), np.radians(lng)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def kd_order(xyz):
+    """Permutation putting ``xyz`` into implicit KD-tree order"""
+    order = np.arange(len(xyz))
+
+    def split(lo, hi, depth):
+        if hi - lo <= 1:
+            return
+        segment = order[lo:hi]
+        order[lo:hi] = segment[np.argsort(xyz[segment, depth % 3], kind='stable')]
+        mid = (lo + hi) // 2
+        split(lo, mid, depth + 1)
+        split(mid + 1, hi, depth + 1)
+
+    split(0, len(xyz), 0)
+    return order
+
+
+def build_dataset(source=SOURCE_CSV, destination=None):
+    """Compile the places CSV into the memory-mappable KD-ordered array"""
+    with open(source, newline='', encoding='utf-8') as fh:
+        rows = list(csv.DictReader(fh))
+    places = np.zeros(len(rows), dtype=PLACE_DTYPE)
+    places['lat'] = [float(row['lat']) for row in rows]
+    places['lng'] = [float(row['lng']) for row in rows]
+    places['country'] = [row['country'].strip().upper().encode('ascii') for row in rows]
+    places['name'] = [row['name'].strip().encode('utf-8')[:32] for row in rows]
+    places['xyz'] = unit_vectors(places['lat'].astype(np.float64), places['lng'].astype(np.float64))
+    places = places[kd_order(places['xyz'].astype(np.float64))]
+    np.save(destination or settings.GEOCODER_DATASET, places)
+    return len(places)
+
+
+@functools.lru_cache(maxsize=None)
+def dataset():
+    """The place array, memory-mapped read-only on first use"""
+    return np.load(settings.GEOCODER_DATASET, mmap_mode='r')
+
+
+@functools.lru_cache(maxsize=None)
+def _places_by_name():
+    index = {}
+    for i, name in enumerate(dataset()['name'].tolist()):
+        index.setdefault(_fold(name.decode('utf-8')), []).append(i)
+    return index
+
+
+def _place(places, i, chord_sq):
+    row = places[i]
+    distance = 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(chord_sq) / 2, 1.0))
+    return Place(row['name'].decode('utf-8'), row['country'].decode('ascii'),
+                 float(row['lat']), float(row['lng']), distance)
+
+
+def nearest(lat, lng, k=1):
+    """The ``k`` places closest to (lat, lng), nearest first"""
+    places = dataset()
+    xyz = places['xyz']
+    target_array = unit_vectors(float(lat), float(lng))
+    target = target_array.tolist()
+    best = []  # max-heap of (-chord², index)
+    stack = [(0, len(places), 0, 0.0)]
+    while stack:
+        lo, hi, depth, bound = stack.pop()
+        if lo >= hi or (len(best) == k and bound >= -best[0][0]):
+            continue
+        if hi - lo <= LEAF_SIZE:
+            # Small subtrees are cheaper to scan in one NumPy pass than to walk
+            chords_sq = ((xyz[lo:hi] - target_array) ** 2).sum(axis=1)
+            for offset in np.argsort(chords_sq)[:k].tolist():
+                chord_sq = float(chords_sq[offset])
+                if len(best) < k:
+                    heapq.heappush(best, (-chord_sq, lo + offset))
+                elif chord_sq < -best[0][0]:
+                    heapq.heapreplace(best, (-chord_sq, lo + offset))
+                else:
+                    break
+            continue
+        mid = (lo + hi) // 2
+        point = xyz[mid].tolist()
+        chord_sq = sum((p - t) ** 2 for p, t in zip(point, target))
+        if len(best) < k:
+            heapq.heappush(best, (-chord_sq, mid))
+        elif chord_sq < -best[0][0]:
+            heapq.heapreplace(best, (-chord_sq, mid))
+        axis = depth % 3
+        diff = target[axis] - point[axis]
+        near, far = ((mid + 1, hi), (lo, mid)) if diff > 0 else ((lo, mid), (mid + 1, hi))
+        stack.append((*far, depth + 1, diff * diff))
+        stack.append((*near, depth + 1, bound))
+    return [_place(places, i, -neg) for neg, i in sorted(best, reverse=True)]
+
+
+def check_location(lat, lng, city='', country=''):
+    """
+    Compare free-text ``city``/``country`` with the places nearest (lat, lng).
+    Blank values are filled from the nearest place when it is close enough;
+    contradictions are described in ``warning`` (empty when all is well).
+    """
+    places = nearest(lat, lng, k=settings.GEOCODER_NEIGHBOURS)
+    closest = places[0]
+    in_range = closest.distance_km <= settings.GEOCODER_MAX_DISTANCE_KM
+    warnings = []
+
+    if not (country or '').strip():
+        country = closest.country if in_range else country
+    else:
+        code = country_code(country)
+        if in_range and code and code not in {place.country for place in places}:
+            warnings.append(f'Coordinates are in {COUNTRY_NAMES.get(closest.country, closest.country)}, '
+                            f'not {COUNTRY_NAMES[code]}')
+
+    if not (city or '').strip():
+        if closest.distance_km <= settings.GEOCODER_CITY_RADIUS_KM:
+            city = closest.name
+    else:
+        known = _places_by_name().get(_fold(city))
+        if known:
+            chords = np.linalg.norm(dataset()['xyz'][known] - unit_vectors(float(lat), float(lng)), axis=1)
+            distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords / 2, 1.0)).min()
+            if distance_km > settings.GEOCODER_CITY_MISMATCH_KM:
+                warnings.append(f'{city.strip()} is {distance_km:.0f} km away; nearest place is {closest.name}')
+    return LocationCheck(city, country, '; '.join(warnings))
@@ -0,0 +1,60 @@
+"""
+Planar geometry helpers for field polygons stored as [{'lat': .., 'lng': ..}, ...].
+
+Fields are small enough that an equirectangular projection around the
+polygon's mean latitude is accurate to well under 1% for area.
+"""
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+M2_PER_HECTARE = 10000.0
+
+
+def polygon_array(points):
+    """Polygon points as a float64 (n, 2) lat/lng array, or None if unusable"""
+    if not points or not isinstance(points, list):
+        return None
+    try:
+        coords = np.array([(p['lat'], p['lng']) for p in points], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return coords if len(coords) >= 3 else None
+
+
+def polygon_area_hectares(points):
+    coords = polygon_array(points)
+    if coords is None:
+        return None
+    lat = np.radians(coords[:, 0])
+    lng = np.radians(coords[:, 1])
+    # Project to metres on a plane tangent at the mean latitude
+    x = EARTH_RADIUS_M * lng * math.cos(float(lat.mean()))
+    y = EARTH_RADIUS_M * lat
+    area = 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))))
+    return area / M2_PER_HECTARE
+
+
+def polygon_bbox(points):
+    """(min_lat, min_lng, max_lat, max_lng) of a polygon, or None if unusable"""
+    coords = polygon_array(points)
+    if coords is None:
+        return None
+    (min_lat, min_lng), (max_lat, max_lng) = coords.min(axis=0), coords.max(axis=0)
+    return float(min_lat), float(min_lng), float(max_lat), float(max_lng)
+
+
+def points_in_polygon(lat, lng, coords):
+    """
+    Vectorized even-odd ray casting: which of the points (lat[i], lng[i]) lie
+    inside the polygon ``coords`` ((n, 2) lat/lng, closed or not).
+    """
+    y1, x1 = coords[:, 0], coords[:, 1]
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+    py, px = lat[:, None], lng[:, None]
+    crosses = (y1 > py) != (y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_at_y = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (px < x_at_y), axis=1) % 2 == 1
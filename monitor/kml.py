@@ -0,0 +1,121 @@
+"""Polygon extraction from KML documents, shared by the upload views and signup processing"""
+
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+
+class KmlParserMixin:
+    """Polygon extraction from uploaded or embedded KML documents"""
+    
+    def parse_kml_file(self, kml_file):
+        """
+        Parse KML file to extract polygon coordinates
+        Returns list of coordinate dictionaries or None if parsing fails
+        """
+        try:
+            # Read file content
+            kml_content = kml_file.read()
+            if isinstance(kml_content, bytes):
+                kml_content = kml_content.decode('utf-8')
+            
+            # Reset file pointer for potential later use
+            kml_file.seek(0)
+            
+            # Parse XML
+            root = ET.fromstring(kml_content)
+            
+            # Define KML namespace
+            ns = {'kml': 'http://www.opengis.net/kml/2.2'}
+            
+            # Look for coordinates in various KML elements
+            coordinates = []
+            
+            # Try to find Polygon coordinates
+            for polygon in root.findall('.//kml:Polygon', ns):
+                outer_boundary = polygon.find('kml:outerBoundaryIs/kml:LinearRing/kml:coordinates', ns)
+                if outer_boundary is not None and outer_boundary.text:
+                    coords_text = outer_boundary.text.strip()
+                    coordinates.extend(self.parse_coordinates_text(coords_text))
+            
+            # Try to find LineString coordinates if no polygon found
+            if not coordinates:
+                for linestring in root.findall('.//kml:LineString/kml:coordinates', ns):
+                    if linestring.text:
+                        coords_text = linestring.text.strip()
+                        coordinates.extend(self.parse_coordinates_text(coords_text))
+            
+            # Try to find Point coordinates if no polygon/linestring found
+            if not coordinates:
+                for point in root.findall('.//kml:Point/kml:coordinates', ns):
+                    if point.text:
+                        coords_text = point.text.strip()
+                        coordinates.extend(self.parse_coordinates_text(coords_text))
+            
+            # Try without namespace if nothing found
+            if not coordinates:
+                for elem in root.iter():
+                    if elem.tag.endswith('coordinates') and elem.text:
+                        coords_text = elem.text.strip()
+                        coordinates.extend(self.parse_coordinates_text(coords_text))
+            
+            if coordinates:
+                return coordinates
+            logger.warning(
+                "No coordinates found in KML file (%d characters)", len(kml_content),
+                extra={'event': 'kml.no_coordinates'},
+            )
+            return None
+                
+        except ET.ParseError as e:
+            logger.warning("KML XML parsing error: %s", e, extra={'event': 'kml.parse_error'})
+            return None
+        except Exception:
+            logger.exception("Unexpected KML parsing error", extra={'event': 'kml.error'})
+            return None
+    
+    def parse_coordinates_text(self, coords_text):
+        """
+        Parse coordinate text from KML format (lng,lat,alt or lng,lat)
+        Returns list of {'lat': float, 'lng': float} dictionaries
+        """
+        coordinates = []
+        out_of_range = unparseable = 0
+        
+        try:
+            # Split by whitespace and newlines
+            coord_pairs = re.split(r'\s+', coords_text.strip())
+            
+            for coord_pair in coord_pairs:
+                if not coord_pair:
+                    continue
+                    
+                # Split by comma (KML format is lng,lat,alt or lng,lat)
+                parts = coord_pair.split(',')
+                
+                if len(parts) >= 2:
+                    try:
+                        lng = float(parts[0])
+                        lat = float(parts[1])
+                        
+                        # Validate coordinate ranges
+                        if -180 <= lng <= 180 and -90 <= lat <= 90:
+                            coordinates.append({'lat': lat, 'lng': lng})
+                        else:
+                            out_of_range += 1
+                    except ValueError:
+                        unparseable += 1
+        
+        except Exception:
+            logger.exception("Error parsing KML coordinates text", extra={'event': 'kml.coordinates_error'})
+        
+        # One summary record per block instead of one line per bad vertex
+        if out_of_range or unparseable:
+            logger.warning(
+                "Skipped %d out-of-range and %d unparseable KML coordinates",
+                out_of_range, unparseable,
+                extra={'event': 'kml.invalid_coordinates'},
+            )
+        return coordinates
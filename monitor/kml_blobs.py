@@ -0,0 +1,112 @@
+"""
+Reference counting and geometry reuse for content-addressed KML blobs.
+
+FieldSubmission saves and deletes adjust ``KmlBlob.refcount``; when the last
+reference goes away the blob file is removed after the transaction commits.
+
+Storage skips writing bytes it already has, so an upload can find a blob's
+file just before ``_collect`` removes it. ``_collect`` deletes under the
+blob's row lock, which ``add_reference`` waits on; a reference that comes
+second finds the file gone and writes the upload's bytes back.
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import FieldSubmission, KmlBlob
+from .storage import digest_from_name, kml_storage, sha256_of
+
+_DEFERRED = object()
+
+
+def digest_upload(uploaded_file):
+    """Hash an upload and remember the digest so storage doesn't hash it again"""
+    uploaded_file.sha256 = sha256_of(uploaded_file)
+    return uploaded_file.sha256
+
+
+def cached_geometry(digest):
+    """Polygon parsed from an earlier upload of the same bytes, if any"""
+    return KmlBlob.objects.filter(digest=digest).values_list('polygon', flat=True).first()
+
+
+def remember_geometry(digest, polygon):
+    KmlBlob.objects.filter(digest=digest, polygon__isnull=True).update(polygon=polygon)
+
+
+def add_reference(name, content=None):
+    """Count a reference to blob ``name``; ``content`` is the upload it came from, if at hand"""
+    digest = digest_from_name(name)
+    if digest is None:
+        return
+    with transaction.atomic():
+        # The UPDATE takes the row lock _collect deletes under
+        if not KmlBlob.objects.filter(digest=digest).update(refcount=F('refcount') + 1):
+            blob, created = KmlBlob.objects.get_or_create(digest=digest, defaults={'name': name, 'refcount': 1})
+            if not created:
+                KmlBlob.objects.filter(digest=digest).update(refcount=F('refcount') + 1)
+        if content is not None and not kml_storage.exists(name):
+            # Collected between storage finding the file and this reference
+            content.seek(0)
+            kml_storage.save(name, content)
+
+
+def drop_reference(name):
+    digest = digest_from_name(name)
+    if digest is None:
+        return
+    KmlBlob.objects.filter(digest=digest, refcount__gt=0).update(refcount=F('refcount') - 1)
+    transaction.on_commit(lambda: _collect(digest))
+
+
+def _collect(digest):
+    with transaction.atomic():
+        blob = KmlBlob.objects.select_for_update().filter(digest=digest, refcount=0).first()
+        if blob is None:
+            return
+        blob.delete()
+        kml_storage.delete(blob.name)
+
+
+def _stored_name(instance):
+    if 'kml_file' not in instance.__dict__:
+        return _DEFERRED
+    value = instance.__dict__['kml_file']
+    return (value if isinstance(value, str) else getattr(value, 'name', None)) or None
+
+
+@receiver(post_init, sender=FieldSubmission)
+def remember_kml_name(sender, instance, **kwargs):
+    instance._loaded_kml_name = _stored_name(instance)
+
+
+@receiver(pre_save, sender=FieldSubmission)
+def remember_kml_upload(sender, instance, **kwargs):
+    # Storage replaces the upload with its name once saved; keep the bytes for add_reference
+    instance._kml_upload = None
+    if 'kml_file' in instance.__dict__:
+        kml_file = instance.kml_file
+        if kml_file and not kml_file._committed:
+            instance._kml_upload = kml_file.file
+
+
+@receiver(post_save, sender=FieldSubmission)
+def count_kml_reference(sender, instance, **kwargs):
+    old, new = instance._loaded_kml_name, _stored_name(instance)
+    upload, instance._kml_upload = getattr(instance, '_kml_upload', None), None
+    if old is _DEFERRED or new is _DEFERRED or old == new:
+        return
+    if new:
+        add_reference(new, upload)
+    if old:
+        drop_reference(old)
+    instance._loaded_kml_name = new
+
+
+@receiver(post_delete, sender=FieldSubmission)
+def release_kml_reference(sender, instance, **kwargs):
+    name = _stored_name(instance)
+    if name and name is not _DEFERRED:
+        drop_reference(name)
@@ -0,0 +1,226 @@
+"""
+Batch point-in-field lookup for scouts' devices.
+
+``locate`` answers "which field is each of these points in" for thousands of
+points at once:
+
+1. the database prunes fields to those whose bbox overlaps the points' bbox
+   (``fieldsub_approved_bbox_idx``);
+2. ``FieldIndex`` buckets the candidate bboxes into a uniform grid and pairs
+   each point only with fields sharing its cell and containing it in bbox
+   (fields too big for the grid are paired with every point instead);
+3. the surviving pairs are ray-cast with NumPy in a few vectorized passes
+   over padded vertex arrays.
+
+Where fields overlap the smallest one wins, being the most specific answer.
+"""
+
+import base64
+import binascii
+
+import numpy as np
+
+from . import polyline
+from .geometry import points_in_polygon, polygon_array
+from .models import FieldSubmission
+
+# Aim for this many fields per occupied grid cell; cells never get smaller
+# than MIN_CELL_DEGREES (~10 m) so degenerate polygons can't explode the grid
+FIELDS_PER_CELL = 2
+MIN_CELL_DEGREES = 1e-4
+# Fields whose bbox covers more cells than this stay out of the grid, so one
+# huge or badly drawn polygon can't expand into millions of cells
+MAX_CELLS_PER_FIELD = 1024
+# Polygons up to this size are ray-cast together in padded batches of about
+# PAIR_CHUNK_CELLS pair x vertex cells; larger ones are tested one by one
+PADDED_MAX_VERTICES = 256
+PAIR_CHUNK_CELLS = 1 << 20
+
+
+def parse_points(data):
+    """
+    Points from a request body as a float64 (n, 2) lat/lng array. Accepts
+    ``points`` as [[lat, lng], ...], [{'lat': .., 'lng': ..}, ...] or polyline
+    bytes (msgpack bin), or ``points_polyline`` as URL-safe base64 text.
+    Raises ValueError on malformed input.
+    """
+    raw = data.get('points')
+    if raw is None and data.get('points_polyline'):
+        try:
+            raw = base64.urlsafe_b64decode(data['points_polyline'])
+        except (binascii.Error, TypeError, ValueError):
+            raise ValueError('points_polyline is not valid base64')
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        return polyline.decode_array(bytes(raw))
+    if not isinstance(raw, list):
+        raise ValueError('points must be a list of [lat, lng] pairs')
+    if not raw:
+        return np.empty((0, 2))
+    try:
+        if isinstance(raw[0], dict):
+            coords = np.array([(p['lat'], p['lng']) for p in raw], dtype=np.float64)
+        else:
+            coords = np.array(raw, dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('points must be a list of [lat, lng] pairs')
+    if coords.ndim != 2 or coords.shape[1] != 2:
+        raise ValueError('points must be a list of [lat, lng] pairs')
+    if not np.isfinite(coords).all() or (np.abs(coords[:, 0]) > 90).any() or (np.abs(coords[:, 1]) > 180).any():
+        raise ValueError('points must be finite, with -90 <= lat <= 90 and -180 <= lng <= 180')
+    return coords
+
+
+class FieldIndex:
+    """Uniform grid over field bboxes plus the polygons for exact tests"""
+
+    def __init__(self, ids, polygons):
+        """``polygons`` are (n, 2) lat/lng arrays, parallel to ``ids``"""
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.polygons = list(polygons)
+        if not self.polygons:
+            self.bboxes = np.empty((0, 4))
+            return
+        self.bboxes = np.array(
+            [(*coords.min(axis=0), *coords.max(axis=0)) for coords in self.polygons],
+            dtype=np.float64,
+        )
+        # Smaller fields last, so they overwrite larger overlapping ones in locate()
+        heights = self.bboxes[:, 2] - self.bboxes[:, 0]
+        widths = self.bboxes[:, 3] - self.bboxes[:, 1]
+        self.order = np.argsort(-(heights * widths), kind='stable')
+
+        self.origin = self.bboxes[:, :2].min(axis=0)
+        self.cell = max(float(np.median(np.maximum(heights, widths))) * FIELDS_PER_CELL, MIN_CELL_DEGREES)
+        lo = self._cells(self.bboxes[:, :2])
+        hi = self._cells(self.bboxes[:, 2:])
+        spans = hi - lo + 1
+        counts = spans[:, 0] * spans[:, 1]
+        oversized = counts > MAX_CELLS_PER_FIELD
+        self.oversized = np.flatnonzero(oversized)
+        counts[oversized] = 0
+        self.columns = int(hi[~oversized, 1].max()) + 1 if not oversized.all() else 1
+
+        # Expand every other field into the cells its bbox covers (CSR layout:
+        # sorted cell keys with the matching field index alongside)
+        field = np.repeat(np.arange(len(self.polygons)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        row = lo[field, 0] + offset // spans[field, 1]
+        col = lo[field, 1] + offset % spans[field, 1]
+        keys = row * self.columns + col
+        sort = np.argsort(keys, kind='stable')
+        self.cell_keys = keys[sort]
+        self.cell_fields = field[sort]
+        self._pad_polygons()
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        ids, polygons = [], []
+        for pk, polygon in queryset.values_list('pk', 'polygon').iterator():
+            coords = polygon_array(polygon)
+            if coords is not None:
+                ids.append(pk)
+                polygons.append(coords)
+        return cls(ids, polygons)
+
+    def _cells(self, coords):
+        return np.floor((coords - self.origin) / self.cell).astype(np.int64)
+
+    def candidate_pairs(self, points):
+        """(point index, field index) pairs whose grid cell and bbox match"""
+        cells = self._cells(points)
+        in_grid = (cells >= 0).all(axis=1) & (cells[:, 1] < self.columns)
+        keys = np.where(in_grid, cells[:, 0] * self.columns + cells[:, 1], -1)
+        start = np.searchsorted(self.cell_keys, keys, side='left')
+        stop = np.searchsorted(self.cell_keys, keys, side='right')
+        counts = np.where(in_grid, stop - start, 0)
+
+        point = np.repeat(np.arange(len(points)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        field = self.cell_fields[np.repeat(start, counts) + offset]
+        if len(self.oversized):
+            point = np.concatenate([point, np.repeat(np.arange(len(points)), len(self.oversized))])
+            field = np.concatenate([field, np.tile(self.oversized, len(points))])
+
+        box = self.bboxes[field]
+        lat, lng = points[point, 0], points[point, 1]
+        inside = (lat >= box[:, 0]) & (lat <= box[:, 2]) & (lng >= box[:, 1]) & (lng <= box[:, 3])
+        return point[inside], field[inside]
+
+    def _pad_polygons(self):
+        """
+        Polygons with at most PADDED_MAX_VERTICES vertices as one (n, width, 2)
+        array, padded by repeating each last vertex (zero-length edges never
+        cross a ray), so their pairs can be ray-cast in a single pass
+        """
+        sizes = np.array([len(coords) for coords in self.polygons])
+        self.small = sizes <= PADDED_MAX_VERTICES
+        width = int(sizes[self.small].max()) if self.small.any() else 1
+        self.padded = np.empty((len(self.polygons), width, 2))
+        for i in np.flatnonzero(self.small):
+            coords = self.polygons[i]
+            self.padded[i, :len(coords)] = coords
+            self.padded[i, len(coords):] = coords[-1]
+
+    def _contains_padded(self, points, point, field):
+        inside = np.empty(len(point), dtype=bool)
+        step = max(PAIR_CHUNK_CELLS // self.padded.shape[1], 1)
+        for start in range(0, len(point), step):
+            chunk = slice(start, start + step)
+            vertices = self.padded[field[chunk]]
+            y1, x1 = vertices[:, :, 0], vertices[:, :, 1]
+            y2, x2 = np.roll(y1, -1, axis=1), np.roll(x1, -1, axis=1)
+            py, px = points[point[chunk], 0][:, None], points[point[chunk], 1][:, None]
+            crosses = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_at_y = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside[chunk] = np.count_nonzero(crosses & (px < x_at_y), axis=1) % 2 == 1
+        return inside
+
+    def locate(self, points):
+        """Field id per point (0 where a point is in no field)"""
+        result = np.zeros(len(points), dtype=np.int64)
+        if not self.polygons or not len(points):
+            return result
+        point, field = self.candidate_pairs(points)
+        if not len(field):
+            return result
+
+        # Typical fields: all pairs ray-cast in one vectorized pass; the odd
+        # huge polygon is tested on its own so it doesn't inflate the padding
+        inside = np.zeros(len(point), dtype=bool)
+        batched = self.small[field]
+        inside[batched] = self._contains_padded(points, point[batched], field[batched])
+        for large in np.unique(field[~batched]):
+            pairs = np.flatnonzero(field == large)
+            inside[pairs] = points_in_polygon(
+                points[point[pairs], 0], points[point[pairs], 1], self.polygons[large],
+            )
+
+        # Where fields overlap keep the smallest: sort hits by point, then
+        # by descending area rank, and take the last hit per point
+        point, field = point[inside], field[inside]
+        rank = np.empty_like(self.order)
+        rank[self.order] = np.arange(len(self.order))
+        sort = np.lexsort((rank[field], point))
+        point, field = point[sort], field[sort]
+        last = np.r_[point[1:] != point[:-1], True]
+        result[point[last]] = self.ids[field[last]]
+        return result
+
+
+def locate(points, fields=None):
+    """
+    Field id (or None) for each row of ``points``, searching approved
+    ``fields`` (a FieldSubmission queryset; all approved fields by default).
+    """
+    if not len(points):
+        return []
+    fields = FieldSubmission.objects.all() if fields is None else fields
+    (min_lat, min_lng), (max_lat, max_lng) = points.min(axis=0), points.max(axis=0)
+    candidates = fields.filter(
+        is_approved=True,
+        min_lat__lte=max_lat, max_lat__gte=min_lat,
+        min_lng__lte=max_lng, max_lng__gte=min_lng,
+    )
+    found = FieldIndex.from_queryset(candidates).locate(points)
+    return [int(pk) or None for pk in found.tolist()]
@@ -0,0 +1,58 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+def _lock_key(name):
+    # pg_advisory_lock takes a signed 64-bit key
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(name, using='default'):
+    """
+    Hold a cross-process lock named ``name`` for the duration of the block.
+
+    Uses ``pg_advisory_lock`` on PostgreSQL so replicas on different hosts
+    serialize; otherwise falls back to an flock()ed file, which is enough for
+    SQLite where every process shares the same disk.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        key = _lock_key(name)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [key])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+        return
+
+    db_name = str(connection.settings_dict.get('NAME') or '')
+    if db_name and not db_name.startswith(':memory:') and 'mode=memory' not in db_name:
+        path = f'{db_name}.{name}.lock'
+    else:
+        path = os.path.join(tempfile.gettempdir(), f'crop_monitor.{name}.lock')
+    with open(path, 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def transaction_lock(name, using='default'):
+    """
+    Serialize the current transaction with others taking the same lock until
+    it commits (``pg_advisory_xact_lock``). Elsewhere this is a no-op: SQLite
+    already lets one transaction write at a time.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_lock_key(name)])
@@ -0,0 +1,151 @@
+"""
+Structured, non-blocking logging for request paths.
+
+Records are formatted on a background QueueListener thread, so request
+threads only pay for a ``put_nowait`` and never block on stdout. Pass
+``extra={'event': 'kml.parse_error', ...}`` to tag records: the event name
+keys the rate limiter and every extra field ends up in the JSON line.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+current_request_id = ContextVar('monitor_request_id', default=None)
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id',
+}
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including the request id and extra fields"""
+
+    converter = time.gmtime
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None) or current_request_id.get(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc_info'] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Allow at most ``rate`` records per event per ``period`` seconds.
+
+    Records may also carry ``sample_rate`` (0..1) to keep only a fraction of a
+    noisy event. The first record let through after a suppressed burst carries
+    a ``suppressed`` count so the volume isn't silently lost.
+    """
+
+    def __init__(self, rate=20, period=1.0):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        sample_rate = getattr(record, 'sample_rate', 1.0)
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            return False
+
+        key = getattr(record, 'event', None) or (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - window_start >= self.period:
+                window_start, count = now, 0
+            if count >= self.rate:
+                self._windows[key] = (window_start, count, suppressed + 1)
+                return False
+            self._windows[key] = (window_start, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class AsyncStreamHandler(QueueHandler):
+    """
+    QueueHandler that owns a QueueListener writing to a StreamHandler.
+
+    The listener thread is (re)started lazily per process, so it keeps working
+    after gunicorn forks workers from a preloaded master. When the queue is
+    full records are dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, not in the request
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = current_request_id.get()
+        # Merge args now; they may not be safe to touch from another thread
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until queued records have been written (used by tests and shutdown)"""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+        self.target.flush()
+
+    def close(self):
+        self.flush()
+        super().close()
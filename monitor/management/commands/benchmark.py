@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from monitor.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run performance micro-benchmarks (all of them if no names are given)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f'Benchmarks to run: {", ".join(sorted(BENCHMARKS))}')
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(sorted(unknown))}')
+
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name}'))
+            for label, seconds, note in BENCHMARKS[name]():
+                timing = f'{seconds * 1000:>10.2f} ms' if seconds is not None else ' ' * 13
+                self.stdout.write(f'  {label:<48} {timing}  {note}')
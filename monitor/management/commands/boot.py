@@ -0,0 +1,115 @@
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+
+from monitor.locks import advisory_lock
+
+User = get_user_model()
+
+STATIC_FINGERPRINT_FILE = '.static-fingerprint'
+MANIFEST_FILE = 'staticfiles.json'
+
+
+def pending_migrations(using='default'):
+    """Migrations in the on-disk graph that the database hasn't applied yet"""
+    executor = MigrationExecutor(connections[using])
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def static_fingerprint():
+    """Hash of every static source file's path, size and mtime"""
+    digest = hashlib.sha256()
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list(['CVS', '.*', '*~']):
+            stat = os.stat(storage.path(path))
+            entries.append(f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}')
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Run only the startup steps that are out of date, then exec gunicorn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-exec', action='store_true',
+                            help='Run the startup steps but do not start gunicorn')
+        parser.add_argument('--bind', default=f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+        parser.add_argument('--asgi', action='store_true',
+                            help='Serve the ASGI app with uvicorn workers (needed for notification streams)')
+        parser.add_argument('gunicorn_args', nargs='*',
+                            help='Extra arguments passed through to gunicorn (after --)')
+
+    def handle(self, *args, **options):
+        boot_start = time.perf_counter()
+        self.step('migrate', self.migrate)
+        self.step('create_admin', self.create_admin)
+        self.step('collectstatic', self.collectstatic)
+        self.stdout.write(f'boot: ready in {time.perf_counter() - boot_start:.2f}s')
+
+        if options['no_exec']:
+            return
+
+        if options['asgi']:
+            app = ['crop_monitor_backend.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker']
+        else:
+            app = ['crop_monitor_backend.wsgi:application']
+        argv = [
+            'gunicorn', *app,
+            '--bind', options['bind'],
+            '--timeout', '120',
+            '--preload',
+            *options['gunicorn_args'],
+        ]
+        connections.close_all()
+        self.stdout.flush()
+        os.execvp(argv[0], argv)
+
+    def step(self, name, func):
+        start = time.perf_counter()
+        outcome = func()
+        self.stdout.write(f'boot: {name:<14} {outcome:<40} {time.perf_counter() - start:.2f}s')
+
+    def migrate(self):
+        if not pending_migrations():
+            return 'skipped (up to date)'
+        # Replicas booting together queue here; the losers find nothing left to do
+        with advisory_lock('boot-migrate'):
+            plan = pending_migrations()
+            if not plan:
+                return 'skipped (applied by another replica)'
+            call_command('migrate', interactive=False, verbosity=0)
+        return self.style.SUCCESS(f'applied {len(plan)} migration(s)')
+
+    def create_admin(self):
+        if User.objects.filter(username='admin').exists():
+            return 'skipped (admin exists)'
+        call_command('create_admin', stdout=self.stdout)
+        return self.style.SUCCESS('created')
+
+    def collectstatic(self):
+        fingerprint = static_fingerprint()
+        marker = os.path.join(settings.STATIC_ROOT, STATIC_FINGERPRINT_FILE)
+        manifest = os.path.join(settings.STATIC_ROOT, MANIFEST_FILE)
+        try:
+            with open(marker) as fh:
+                up_to_date = fh.read() == fingerprint and os.path.exists(manifest)
+        except OSError:
+            up_to_date = False
+        if up_to_date:
+            return 'skipped (static sources unchanged)'
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(marker, 'w') as fh:
+            fh.write(fingerprint)
+        return self.style.SUCCESS('collected')
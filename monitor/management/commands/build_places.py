@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from monitor import geocoder
+
+
+class Command(BaseCommand):
+    help = 'Compile monitor/data/places.csv into the memory-mapped reverse-geocoding dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=geocoder.SOURCE_CSV)
+        parser.add_argument('--output', default=None, help='Defaults to settings.GEOCODER_DATASET')
+
+    def handle(self, *args, **options):
+        count = geocoder.build_dataset(options['source'], options['output'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Wrote {count} places to the geocoder dataset'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from monitor import changes
+
+
+class Command(BaseCommand):
+    help = 'Collapse the field change log to each field\'s latest entry and expire old tombstones'
+
+    def handle(self, *args, **options):
+        removed = changes.compact()
+        self.stdout.write(self.style.SUCCESS(f'✅ Removed {removed} change log entries'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from monitor import geocoder
+from monitor.models import FieldSubmission
+
+
+class Command(BaseCommand):
+    help = 'Check every submission\'s city/country against its coordinates, filling blanks and flagging contradictions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without saving them')
+
+    def handle(self, *args, **options):
+        checked = flagged = changed = 0
+        fields = FieldSubmission.objects.select_related('user').order_by('pk')
+        for field in fields.iterator(chunk_size=500):
+            checked += 1
+            check = geocoder.check_location(field.lat, field.lng, field.city, field.country)
+            flagged += bool(check.warning)
+            updates = {
+                name: value for name, value in
+                (('city', check.city), ('country', check.country), ('location_warning', check.warning))
+                if getattr(field, name) != value
+            }
+            if not updates:
+                continue
+            changed += 1
+            if options['dry_run']:
+                self.stdout.write(f'  field {field.pk}: {updates}')
+                continue
+            for name, value in updates.items():
+                setattr(field, name, value)
+            # save() rather than update() so stored payloads, summaries and caches follow
+            field.save(update_fields=[*updates, 'updated_at'])
+
+        verb = 'would update' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Checked {checked} fields: {flagged} flagged, {verb} {changed}'
+        ))
@@ -0,0 +1,36 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from monitor import signups
+
+
+class Command(BaseCommand):
+    help = 'Process queued signup geometry (run with SIGNUP_PROCESSING_BACKEND=worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Jobs processed in parallel')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling')
+
+    def handle(self, *args, **options):
+        def work():
+            processed = 0
+            while True:
+                close_old_connections()
+                if signups.run() is not None:
+                    processed += 1
+                elif options['once']:
+                    return processed
+                else:
+                    time.sleep(options['poll'])
+
+        threads = options['threads']
+        if threads <= 1:
+            processed = work()
+        else:
+            with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='signups') as pool:
+                processed = sum(future.result() for future in [pool.submit(work) for _ in range(threads)])
+        self.stdout.write(self.style.SUCCESS(f'✅ Processed {processed} signup jobs'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from monitor import analytics
+
+
+class Command(BaseCommand):
+    help = 'Recompute crop/country/month field summaries from all submissions'
+
+    def handle(self, *args, **options):
+        groups = analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {groups} summary groups'))
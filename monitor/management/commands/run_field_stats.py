@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from monitor import field_stats
+
+
+class Command(BaseCommand):
+    help = 'Fetch vegetation statistics for every approved field, resuming an interrupted run for the same period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='Period start (default: PERIOD_DAYS before --end)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Period end (default: yesterday)')
+        parser.add_argument('--concurrency', type=int, help='Parallel upstream requests (default: FIELD_STATS_CONCURRENCY)')
+        parser.add_argument('--restart', action='store_true', help='Start over instead of resuming an unfinished run')
+
+    def handle(self, *args, **options):
+        if not settings.FIELD_STATS_URL:
+            raise CommandError('FIELD_STATS_URL is not configured')
+        end = options['end'] or date.today() - timedelta(days=1)
+        start = options['start'] or end - timedelta(days=settings.FIELD_STATS_PERIOD_DAYS - 1)
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        def progress(run, requests_made):
+            self.stdout.write(f'  {run.fields_done} fields done (up to id {run.last_field_id}), {requests_made} requests')
+
+        try:
+            run = field_stats.run(
+                start, end, concurrency=options['concurrency'], restart=options['restart'], progress=progress,
+            )
+        except field_stats.StatsAPIError as exc:
+            raise CommandError(f'{exc}; rerun to resume from the last checkpoint')
+        if run.failed_field_ids:
+            self.stdout.write(self.style.WARNING(
+                f'{len(run.failed_field_ids)} fields got no statistics (ids {run.failed_field_ids}); '
+                f'rerun to retry just those, or --restart to start over'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Statistics for {start}..{end}: {run.fields_done} fields'))
@@ -0,0 +1,242 @@
+"""
+Lightweight Prometheus-style metrics shared across gunicorn workers.
+
+Every process accumulates samples in memory and periodically dumps them to
+``<METRICS_DIR>/<pid>.json``. The ``/metrics`` view merges all files found
+there, so any worker can answer a scrape and counters survive worker restarts.
+"""
+
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-request timing collected by RequestMetricsMiddleware
+current_timings = ContextVar('monitor_request_timings', default=None)
+
+
+class RequestTimings:
+    """Mutable accumulator for a single request's DB and upstream time"""
+
+    __slots__ = ('db_queries', 'db_seconds', 'upstream_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.upstream_seconds = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: [[list(key), value] for key, value in metric.dump()]
+                for name, metric in self._metrics.items()
+            }
+
+    def _metrics_dir(self):
+        path = getattr(settings, 'METRICS_DIR', None) or os.path.join(
+            tempfile.gettempdir(), 'crop_monitor_metrics'
+        )
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def flush(self):
+        """Write this process's cumulative samples to its pid file"""
+        directory = self._metrics_dir()
+        data = json.dumps(self.snapshot(), separators=(',', ':'))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(data)
+        os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def collect(self):
+        """Merge the samples of every worker that has written a pid file"""
+        self.flush()
+        directory = self._metrics_dir()
+        merged = {}
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as fh:
+                    worker = json.load(fh)
+            except (OSError, ValueError):
+                continue  # worker is mid-write or the file is corrupt
+            for name, samples in worker.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                values = merged.setdefault(name, {})
+                for key, value in samples:
+                    key = tuple(key)
+                    values[key] = metric.merge(values.get(key), value)
+        return merged
+
+    def render(self):
+        """Render merged samples in the Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(merged.get(name, {}).items()):
+                lines.extend(metric.expose(dict(zip(metric.labelnames, key)), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._registry = registry or REGISTRY
+        self._registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labelnames)
+
+    def dump(self):
+        return list(self._values.items())
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def merge(self, current, value):
+        return (current or 0) + value
+
+    def expose(self, labels, value):
+        return [f'{self.name}{_format_labels(labels)} {value}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._registry._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def dump(self):
+        return [(key, [list(counts), total, count]) for key, (counts, total, count) in self._values.items()]
+
+    def merge(self, current, value):
+        if current is None:
+            return [list(value[0]), value[1], value[2]]
+        return [
+            [a + b for a, b in zip(current[0], value[0])],
+            current[1] + value[1],
+            current[2] + value[2],
+        ]
+
+    def expose(self, labels, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": le})} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+REGISTRY = Registry()
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by view, method and status.',
+    ('view', 'method', 'status'),
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'End-to-end request latency by view.', ('view',),
+)
+RESPONSE_BYTES = Counter(
+    'http_response_bytes_total', 'Response body bytes sent by view.', ('view',),
+)
+DB_QUERIES = Counter(
+    'db_queries_total', 'Database queries issued by view.', ('view',),
+)
+DB_SECONDS = Counter(
+    'db_query_seconds_total', 'Time spent executing database queries by view.', ('view',),
+)
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds', 'Latency of calls to external services.', ('service',),
+)
+
+
+def db_timing_wrapper(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` hook that charges query time to the request"""
+    timings = current_timings.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if timings is not None:
+            timings.db_queries += 1
+            timings.db_seconds += time.perf_counter() - start
+
+
+@contextmanager
+def upstream_timer(service):
+    """Time a call to an external service such as Copernicus"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        UPSTREAM_LATENCY.observe(elapsed, service=service)
+        timings = current_timings.get()
+        if timings is not None:
+            timings.upstream_seconds += elapsed
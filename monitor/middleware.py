@@ -0,0 +1,138 @@
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import log, metrics, profiling, replicas
+from .authentication import CachedJWTAuthentication
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class RequestMetricsMiddleware:
+    """
+    Record latency, DB usage, response size and upstream time per view.
+    Adds a Server-Timing header so the numbers show up in browser devtools.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        timings = metrics.RequestTimings()
+        token = metrics.current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.db_timing_wrapper))
+                response = self.get_response(request)
+        finally:
+            metrics.current_timings.reset(token)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths share one label so 404 scans can't explode cardinality
+        view = (match.view_name or match.url_name) if match else '<unmatched>'
+
+        metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view)
+        metrics.DB_QUERIES.inc(timings.db_queries, view=view)
+        metrics.DB_SECONDS.inc(timings.db_seconds, view=view)
+        if not response.streaming:
+            metrics.RESPONSE_BYTES.inc(len(response.content), view=view)
+
+        server_timing = [
+            f'app;dur={elapsed * 1000:.1f}',
+            f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_queries} queries"',
+        ]
+        if timings.upstream_seconds:
+            server_timing.append(f'upstream;dur={timings.upstream_seconds * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(server_timing)
+
+        metrics.REGISTRY.maybe_flush()
+        return response
+
+
+class RequestIdMiddleware:
+    """
+    Tag every log record emitted while handling a request with a request id.
+    Reuses a sane incoming X-Request-ID (e.g. from the Railway proxy) and echoes it back.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get('X-Request-ID', '')
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = log.new_request_id()
+        request.request_id = request_id
+        token = log.current_request_id.set(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            log.current_request_id.reset(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Let reads made while handling a request use a read replica (see monitor.replicas)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replicas.begin(request)
+        try:
+            return self.get_response(request)
+        finally:
+            replicas.finish(token)
+
+    def process_exception(self, request, exception):
+        replicas.failed(exception)
+
+
+class ProfilingMiddleware:
+    """Capture stack-sampling profiles of asked-for or sampled requests (see monitor.profiling)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = profiling.choose(request, self.profiling_user(request))
+        if trigger is None:
+            return self.get_response(request)
+
+        with profiling.Profile(trigger) as profile:
+            response = self.get_response(request)
+        if profile.worth_keeping():
+            match = getattr(request, 'resolver_match', None)
+            response['X-Profile-Id'] = profiling.save(profile, {
+                'method': request.method,
+                'path': request.path,
+                'view': (match.view_name or match.url_name) if match else '<unmatched>',
+                'status': response.status_code,
+                'user_id': request.user.pk if request.user.is_authenticated else None,
+            })
+        return response
+
+    def profiling_user(self, request):
+        """Who asked for a profile; API clients authenticate in the view, so check their token here"""
+        if not profiling.requested(request):
+            return None
+        if request.user.is_authenticated:
+            return request.user
+        try:
+            authenticated = CachedJWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        return authenticated[0] if authenticated else None
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "monitor",
+            "0003_remove_user_is_approved_fieldsubmission_approved_at_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="claim_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="claimed_by",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="claimed_fields",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fieldsubmission",
+            index=models.Index(
+                condition=models.Q(("is_approved", False)),
+                fields=["created_at"],
+                name="fieldsub_pending_idx",
+            ),
+        ),
+    ]
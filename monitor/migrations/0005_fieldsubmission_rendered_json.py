@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0004_fieldsubmission_review_claims"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="rendered_json",
+            field=models.BinaryField(null=True),
+        ),
+    ]
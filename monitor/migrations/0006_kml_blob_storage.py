@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:18
+
+import monitor.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0005_fieldsubmission_rendered_json"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KmlBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("refcount", models.PositiveIntegerField(default=0)),
+                ("polygon", models.JSONField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="fieldsubmission",
+            name="kml_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=monitor.storage.get_kml_storage,
+                upload_to="kml_files/",
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0006_kml_blob_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FieldSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "dimension",
+                    models.CharField(
+                        choices=[
+                            ("total", "All fields"),
+                            ("crop", "Crop"),
+                            ("country", "Country"),
+                            ("month", "Plantation month"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("key", models.CharField(max_length=100)),
+                ("field_count", models.IntegerField(default=0)),
+                ("approved_count", models.IntegerField(default=0)),
+                ("total_hectares", models.FloatField(default=0)),
+                ("approved_hectares", models.FloatField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Field Summary",
+                "verbose_name_plural": "Field Summaries",
+                "ordering": ["dimension", "-field_count"],
+            },
+        ),
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="area_hectares",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="fieldsummary",
+            constraint=models.UniqueConstraint(
+                fields=("dimension", "key"), name="fieldsummary_dimension_key_uniq"
+            ),
+        ),
+    ]
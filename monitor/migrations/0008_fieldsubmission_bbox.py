@@ -0,0 +1,57 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:21
+
+from django.db import migrations, models
+
+
+def backfill_bboxes(apps, schema_editor):
+    FieldSubmission = apps.get_model("monitor", "FieldSubmission")
+    for field in FieldSubmission.objects.exclude(polygon__isnull=True).only("polygon").iterator():
+        try:
+            lats = [float(point["lat"]) for point in field.polygon]
+            lngs = [float(point["lng"]) for point in field.polygon]
+        except (KeyError, TypeError, ValueError):
+            continue
+        if len(lats) < 3:
+            continue
+        FieldSubmission.objects.filter(pk=field.pk).update(
+            min_lat=min(lats), min_lng=min(lngs), max_lat=max(lats), max_lng=max(lngs)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0007_field_summaries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="max_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="max_lng",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="min_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="min_lng",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="fieldsubmission",
+            index=models.Index(
+                condition=models.Q(("is_approved", True)),
+                fields=["min_lat", "max_lat", "min_lng", "max_lng"],
+                name="fieldsub_approved_bbox_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_bboxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0008_fieldsubmission_bbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="location_warning",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=255
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0010_rate_limit_buckets"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FieldStatsRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("period_end", models.DateField()),
+                ("last_field_id", models.IntegerField(default=0)),
+                ("fields_done", models.IntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="FieldStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("period_end", models.DateField()),
+                ("stats", models.JSONField()),
+                ("computed_at", models.DateTimeField()),
+                (
+                    "field",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="statistics",
+                        to="monitor.fieldsubmission",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-period_end"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="fieldstatistics",
+            constraint=models.UniqueConstraint(
+                fields=("field", "period_start", "period_end"),
+                name="fieldstats_unique_period",
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0011_field_statistics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimeSeriesChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.CharField(max_length=16)),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField()),
+                ("count", models.PositiveIntegerField()),
+                ("dtype", models.CharField(max_length=4)),
+                ("data", models.BinaryField()),
+                (
+                    "field",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeseries_chunks",
+                        to="monitor.fieldsubmission",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["start_date"],
+                "indexes": [
+                    models.Index(
+                        fields=["field", "index", "start_date"],
+                        name="timeseries_range_idx",
+                    )
+                ],
+            },
+        ),
+    ]
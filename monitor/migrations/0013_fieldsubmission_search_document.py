@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-19 13:05
+
+import re
+
+from django.db import migrations, models
+
+SEARCHED = ("city", "country", "crop_name", "email", "field_name", "first_name", "last_name", "zip_code")
+
+
+def backfill_search_documents(apps, schema_editor):
+    FieldSubmission = apps.get_model("monitor", "FieldSubmission")
+    for field in FieldSubmission.objects.select_related("user").iterator():
+        values = [getattr(field, name) for name in SEARCHED] + [field.user.username, field.user.email]
+        document = " ".join(re.findall(r"\w+", " ".join(str(value) for value in values if value).lower()))
+        FieldSubmission.objects.filter(pk=field.pk).update(search_document=document)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0012_timeseries_chunks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldsubmission",
+            name="search_document",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        # The full-text index itself is installed by monitor.search after migrate
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import monitor.storage
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0013_fieldsubmission_search_document"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SignupJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("field_data", models.JSONField()),
+                (
+                    "kml_file",
+                    models.FileField(
+                        blank=True,
+                        null=True,
+                        storage=monitor.storage.get_kml_storage,
+                        upload_to="kml_files/",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=12,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                (
+                    "available_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "field",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="signup_job",
+                        to="monitor.fieldsubmission",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="signup_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status__in", ["pending", "processing"])),
+                        fields=["available_at"],
+                        name="signupjob_due_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.23 on 2026-10-19 13:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0014_signup_jobs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FieldChangeCompaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("horizon", models.BigIntegerField()),
+                ("removed", models.IntegerField(default=0)),
+                ("compacted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="FieldChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_id", models.BigIntegerField()),
+                ("field_id", models.BigIntegerField()),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("created", "Created"),
+                            ("updated", "Updated"),
+                            ("approved", "Approved"),
+                            ("unapproved", "Unapproved"),
+                            ("deleted", "Deleted"),
+                        ],
+                        max_length=12,
+                    ),
+                ),
+                ("seq", models.BigIntegerField(blank=True, null=True, unique=True)),
+                ("changed_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["seq"],
+                "indexes": [
+                    models.Index(
+                        fields=["user_id", "seq"], name="fieldchange_user_seq_idx"
+                    ),
+                    models.Index(
+                        fields=["field_id", "seq"], name="fieldchange_field_seq_idx"
+                    ),
+                    models.Index(
+                        condition=models.Q(("seq__isnull", True)),
+                        fields=["id"],
+                        name="fieldchange_unstamped_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0016_notifications"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fieldstatsrun",
+            name="failed_field_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-19 14:02
+
+from django.db import migrations
+
+
+def clear_rendered_json(apps, schema_editor):
+    # Stored payloads carried search_document; list endpoints re-render missing ones on read
+    FieldSubmission = apps.get_model("monitor", "FieldSubmission")
+    FieldSubmission.objects.exclude(rendered_json=None).update(rendered_json=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("monitor", "0017_fieldstatsrun_failed_field_ids"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_rendered_json, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+import re
+import uuid
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
@@ -6,6 +9,22 @@ from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from .geometry import polygon_area_hectares, polygon_bbox
+from .storage import get_kml_storage
+
+# Submission columns that make up search_document, plus the owner's username and email
+SEARCH_DOCUMENT_FIELDS = {
+    'field_name', 'crop_name', 'city', 'country', 'zip_code', 'first_name', 'last_name', 'email', 'user',
+}
+
+
+def search_document(field, user):
+    """Lower-cased words of a submission's searchable text ('ada@example.com' -> 'ada example com')"""
+    values = [getattr(field, name) for name in sorted(SEARCH_DOCUMENT_FIELDS - {'user'})]
+    values += [user.username, user.email]
+    return ' '.join(re.findall(r'\w+', ' '.join(str(value) for value in values if value).lower()))
+
+
 class User(AbstractUser):
     # Remove is_approved field - users are auto-approved
     created_at = models.DateTimeField(auto_now_add=True)
@@ -27,6 +46,8 @@ class FieldSubmission(models.Model):
     city = models.CharField(max_length=100)
     country = models.CharField(max_length=10)
     zip_code = models.CharField(max_length=10)
+    # Set when city/country contradict lat/lng (see monitor.geocoder)
+    location_warning = models.CharField(max_length=255, blank=True, default='', editable=False)
     
     # Field Information
     field_name = models.CharField(max_length=100)
@@ -37,13 +58,28 @@ class FieldSubmission(models.Model):
     lat = models.FloatField()
     lng = models.FloatField()
     polygon = models.JSONField(blank=True, null=True)
-    kml_file = models.FileField(upload_to='kml_files/', null=True, blank=True)
+    area_hectares = models.FloatField(null=True, blank=True, editable=False)
+    # Polygon bounding box, used to prune point-in-field lookups
+    min_lat = models.FloatField(null=True, blank=True, editable=False)
+    min_lng = models.FloatField(null=True, blank=True, editable=False)
+    max_lat = models.FloatField(null=True, blank=True, editable=False)
+    max_lng = models.FloatField(null=True, blank=True, editable=False)
+    kml_file = models.FileField(upload_to='kml_files/', storage=get_kml_storage, null=True, blank=True)
     
     # Approval Status - Only fields need approval
     is_approved = models.BooleanField(default=False)
     approved_at = models.DateTimeField(null=True, blank=True)
     approved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='approved_fields')
     
+    # Review queue claim - a reviewer holds pending fields until the lease expires
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_fields')
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    # Public JSON representation, refreshed on save (see monitor.renderers)
+    rendered_json = models.BinaryField(null=True, editable=False)
+    # Normalized text of the searchable columns, full-text indexed (see monitor.search)
+    search_document = models.TextField(blank=True, default='', editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -52,16 +88,55 @@ class FieldSubmission(models.Model):
         ordering = ['-created_at']
         verbose_name = "Field Submission"
         verbose_name_plural = "Field Submissions"
+        indexes = [
+            # Partial index: the pending queue stays small even as approved rows pile up
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(is_approved=False),
+                name='fieldsub_pending_idx',
+            ),
+            # Covers the bbox overlap filter of point-in-field lookups
+            models.Index(
+                fields=['min_lat', 'max_lat', 'min_lng', 'max_lng'],
+                condition=models.Q(is_approved=True),
+                name='fieldsub_approved_bbox_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.field_name} - {self.user.username} ({'Approved' if self.is_approved else 'Pending'})"
 
+    def derive_geometry(self):
+        """Recompute area and bbox from the polygon (bulk_create callers must do this themselves)"""
+        self.area_hectares = polygon_area_hectares(self.polygon)
+        self.min_lat, self.min_lng, self.max_lat, self.max_lng = polygon_bbox(self.polygon) or (None,) * 4
+
+    def derive_search_document(self):
+        """Rebuild search_document (bulk_create callers must do this themselves)"""
+        self.search_document = search_document(self, self.user)
+
+    def save(self, *args, **kwargs):
+        self.derive_geometry()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'polygon' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'area_hectares', 'min_lat', 'min_lng', 'max_lat', 'max_lng'}
+        if update_fields is None or SEARCH_DOCUMENT_FIELDS.intersection(update_fields):
+            self.derive_search_document()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_document'}
+        super().save(*args, **kwargs)
+
     def approve(self, approved_by_user):
         """Approve the field and send notification email"""
         self.is_approved = True
         self.approved_at = timezone.now()
         self.approved_by = approved_by_user
+        self.claimed_by = None
+        self.claim_expires_at = None
         self.save()
+
+        from . import notifications
+        notifications.field_approval_changed(self.pk, self.user_id, self.field_name, True, self.approved_at)
         
         # Send approval email
         try:
@@ -90,6 +165,46 @@ Crop Monitoring Team
         except Exception as e:
             print(f"Failed to send approval email: {e}")
 
+class KmlBlob(models.Model):
+    """One stored KML file, shared by every submission that uploaded the same bytes"""
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    refcount = models.PositiveIntegerField(default=0)
+    # Geometry parsed from the first upload, reused when the same file comes in again
+    polygon = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.refcount} refs)"
+
+class FieldSummary(models.Model):
+    """Running totals per crop, country or plantation month (see monitor.analytics)"""
+    DIMENSION_CHOICES = [
+        ('total', 'All fields'),
+        ('crop', 'Crop'),
+        ('country', 'Country'),
+        ('month', 'Plantation month'),
+    ]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=100)
+    field_count = models.IntegerField(default=0)
+    approved_count = models.IntegerField(default=0)
+    total_hectares = models.FloatField(default=0)
+    approved_hectares = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['dimension', '-field_count']
+        verbose_name = "Field Summary"
+        verbose_name_plural = "Field Summaries"
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='fieldsummary_dimension_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.key}: {self.field_count} fields"
+
 # Email notification signals
 @receiver(post_save, sender=User)
 def send_welcome_email(sender, instance, created, **kwargs):
@@ -119,4 +234,169 @@ Crop Monitoring Team
                 fail_silently=True,
             )
         except Exception as e:
-            print(f"Failed to send welcome email: {e}")
\ No newline at end of file
+            print(f"Failed to send welcome email: {e}")
+
+
+class FieldStatsRun(models.Model):
+    """One pass of manage.py run_field_stats over every approved field"""
+    period_start = models.DateField()
+    period_end = models.DateField()
+    # Checkpoint: every approved field with a lower or equal id has been processed
+    last_field_id = models.IntegerField(default=0)
+    fields_done = models.IntegerField(default=0)
+    # Fields upstream answered without; retried at the end of every pass
+    failed_field_ids = models.JSONField(default=list, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        state = 'finished' if self.finished_at else f'at field {self.last_field_id}'
+        return f"Stats {self.period_start}..{self.period_end} ({state})"
+
+
+class FieldStatistics(models.Model):
+    """Vegetation statistics for one field over one period, as returned upstream"""
+    field = models.ForeignKey(FieldSubmission, on_delete=models.CASCADE, related_name='statistics')
+    period_start = models.DateField()
+    period_end = models.DateField()
+    stats = models.JSONField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-period_end']
+        constraints = [
+            models.UniqueConstraint(fields=['field', 'period_start', 'period_end'], name='fieldstats_unique_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.field_id} {self.period_start}..{self.period_end}"
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket state for monitor.ratelimit, shared by all workers"""
+    key = models.CharField(max_length=200, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField()  # unix time of the last take
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f} tokens"
+
+
+class TimeSeriesChunk(models.Model):
+    """
+    Up to TIMESERIES_CHUNK_SIZE consecutive points of one field's index history
+    (see monitor.timeseries). ``data`` is uint16 day deltas followed by values.
+    """
+    field = models.ForeignKey(FieldSubmission, on_delete=models.CASCADE, related_name='timeseries_chunks')
+    index = models.CharField(max_length=16)  # 'ndvi', 'ndwi', ...
+    start_date = models.DateField()
+    end_date = models.DateField()
+    count = models.PositiveIntegerField()
+    dtype = models.CharField(max_length=4)  # numpy dtype of the values, '<f2' or '<f4'
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['start_date']
+        indexes = [
+            models.Index(fields=['field', 'index', 'start_date'], name='timeseries_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.field_id} {self.index} {self.start_date}..{self.end_date} ({self.count})"
+
+
+class SignupJob(models.Model):
+    """
+    Deferred geometry processing for one signup (see monitor.signups): the raw
+    field data and upload are kept here until a worker creates the submission.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (PROCESSING, 'Processing'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='signup_jobs')
+    field_data = models.JSONField()
+    kml_file = models.FileField(upload_to='kml_files/', storage=get_kml_storage, null=True, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    # Pending: earliest next attempt; processing: when the worker's lease runs out
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    field = models.OneToOneField(FieldSubmission, on_delete=models.SET_NULL, null=True, blank=True, related_name='signup_job')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(
+                fields=['available_at'],
+                condition=models.Q(status__in=['pending', 'processing']),
+                name='signupjob_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Signup {self.id} for user {self.user_id} ({self.status})"
+
+class FieldChange(models.Model):
+    """
+    One entry of the per-user field change log behind the delta sync API
+    (see monitor.changes). ``seq`` is stamped after commit, in commit order.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    APPROVED = 'approved'
+    UNAPPROVED = 'unapproved'
+    DELETED = 'deleted'
+    KIND_CHOICES = [
+        (CREATED, 'Created'), (UPDATED, 'Updated'), (APPROVED, 'Approved'),
+        (UNAPPROVED, 'Unapproved'), (DELETED, 'Deleted'),
+    ]
+
+    # Plain ids: tombstones outlive the field and, when an account is deleted, its owner
+    user_id = models.BigIntegerField()
+    field_id = models.BigIntegerField()
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    seq = models.BigIntegerField(null=True, blank=True, unique=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['seq']
+        indexes = [
+            models.Index(fields=['user_id', 'seq'], name='fieldchange_user_seq_idx'),
+            models.Index(fields=['field_id', 'seq'], name='fieldchange_field_seq_idx'),
+            models.Index(fields=['id'], condition=models.Q(seq__isnull=True), name='fieldchange_unstamped_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} field {self.field_id} {self.kind}"
+
+class FieldChangeCompaction(models.Model):
+    """A compaction run; cursors below the highest ``horizon`` may have missed tombstones"""
+    horizon = models.BigIntegerField()
+    removed = models.IntegerField(default=0)
+    compacted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Compaction up to #{self.horizon} ({self.removed} removed)"
+
+class Notification(models.Model):
+    """A pushed event kept for Last-Event-ID replay (see monitor.notifications)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    event = models.CharField(max_length=40)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['user', 'id'], name='notification_user_id_idx')]
+
+    def __str__(self):
+        return f"#{self.id} {self.event} for user {self.user_id}"
@@ -0,0 +1,236 @@
+"""
+Per-user push notifications (field approvals) and their pub/sub backends.
+
+``publish`` hands an event to the backend once the surrounding transaction
+commits; every process serving ``monitor.sse`` streams keeps a ``Hub`` of
+its open connections and receives events for them from the backend.
+Backends (``NOTIFICATIONS_BACKEND``):
+
+* ``memory``: events go straight to this process's hub and the last
+  ``NOTIFICATIONS_REPLAY_LIMIT`` are kept for replay. Tests and
+  single-process development only.
+* ``database``: events are ``Notification`` rows, so any process can replay
+  them after ``Last-Event-ID``. One listener thread per process reads new
+  rows and fans them out. On PostgreSQL it is woken by ``NOTIFY``;
+  elsewhere it polls every ``NOTIFICATIONS_POLL_SECONDS``. Inserts take a
+  transaction lock so ids become visible in order and a reconnecting client
+  can't skip an event that committed late. Rows older than
+  ``NOTIFICATIONS_RETENTION_SECONDS`` are pruned as new ones arrive.
+"""
+
+import asyncio
+import itertools
+import logging
+import select
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from . import locks, metrics
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED = metrics.Counter('notifications_published_total', 'Push notifications published, by event.', ('event',))
+CHANNEL = 'monitor_notifications'
+PRUNE_EVERY = 100
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    user_id: int
+    event: str
+    data: dict
+
+
+class Subscription:
+    """One open stream: events for ``user_id`` are queued on its event loop"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def deliver(self, event):
+        # Called from publishing or listener threads
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+class Hub:
+    """The open streams of this process, by user"""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def connections(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def dispatch(self, events):
+        for event in events:
+            with self._lock:
+                subscriptions = list(self._subscriptions.get(event.user_id, ()))
+            for subscription in subscriptions:
+                try:
+                    subscription.deliver(event)
+                except RuntimeError:
+                    # Its event loop has closed; the stream is going away
+                    pass
+
+
+hub = Hub()
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._events = deque(maxlen=settings.NOTIFICATIONS_REPLAY_LIMIT)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event, data):
+        with self._lock:
+            published = Event(next(self._ids), user_id, event, data)
+            self._events.append(published)
+        hub.dispatch([published])
+        return published
+
+    def replay(self, user_id, after):
+        with self._lock:
+            return [event for event in self._events if event.user_id == user_id and event.id > after]
+
+    def start(self):
+        pass
+
+
+class DatabaseBackend:
+    def __init__(self):
+        self._listener = None
+        self._last_id = None
+        self._start_lock = threading.Lock()
+
+    def publish(self, user_id, event, data):
+        with transaction.atomic():
+            locks.transaction_lock('notifications')
+            row = Notification.objects.create(user_id=user_id, event=event, data=data)
+            if connections['default'].vendor == 'postgresql':
+                with connections['default'].cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(row.id)])
+        if row.id % PRUNE_EVERY == 0:
+            cutoff = timezone.now() - timedelta(seconds=settings.NOTIFICATIONS_RETENTION_SECONDS)
+            Notification.objects.filter(created_at__lt=cutoff).delete()
+        return _event(row)
+
+    def replay(self, user_id, after):
+        cutoff = timezone.now() - timedelta(seconds=settings.NOTIFICATIONS_RETENTION_SECONDS)
+        rows = Notification.objects.filter(user_id=user_id, id__gt=after, created_at__gte=cutoff).order_by('id')
+        return [_event(row) for row in rows[:settings.NOTIFICATIONS_REPLAY_LIMIT]]
+
+    def start(self):
+        """Start fanning out new rows; called before a stream subscribes"""
+        with self._start_lock:
+            if self._listener is None:
+                # Fix the starting point now rather than on the listener's first
+                # poll, so rows committed after the first stream subscribes are
+                # fanned out; streams replay what came before they connected
+                self._last_id = Notification.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                self._listener = threading.Thread(target=self._listen, name='notifications', daemon=True)
+                self._listener.start()
+
+    def poll_once(self):
+        """Fan out rows written since the last poll (or ``start``); returns how many"""
+        rows = list(Notification.objects.filter(id__gt=self._last_id).order_by('id')[:1000])
+        if rows:
+            self._last_id = rows[-1].id
+            hub.dispatch([_event(row) for row in rows])
+        return len(rows)
+
+    def _listen(self):
+        listen_connection = None
+        while True:
+            try:
+                if listen_connection is None and connections['default'].vendor == 'postgresql':
+                    listen_connection = _listen_connection()
+                if listen_connection is not None:
+                    # NOTIFY only wakes us up; the rows are read either way
+                    if select.select([listen_connection], [], [], settings.NOTIFICATIONS_POLL_SECONDS)[0]:
+                        listen_connection.poll()
+                        listen_connection.notifies.clear()
+                else:
+                    threading.Event().wait(settings.NOTIFICATIONS_POLL_SECONDS)
+                while self.poll_once() == 1000:
+                    pass
+            except Exception:
+                logger.exception("Notification listener failed", extra={'event': 'notifications.listener_error'})
+                listen_connection = None
+                threading.Event().wait(settings.NOTIFICATIONS_POLL_SECONDS)
+            finally:
+                close_old_connections()
+
+
+def _listen_connection():
+    connection = connections['default']
+    raw = connection.get_new_connection(connection.get_connection_params())
+    raw.autocommit = True
+    with raw.cursor() as cursor:
+        cursor.execute(f'LISTEN {CHANNEL}')
+    return raw
+
+
+def _event(row):
+    return Event(row.id, row.user_id, row.event, row.data)
+
+
+BACKENDS = {'memory': MemoryBackend, 'database': DatabaseBackend}
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def backend():
+    name = settings.NOTIFICATIONS_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+def publish(user_id, event, data):
+    """Push ``event`` to ``user_id``'s open streams once the current transaction commits"""
+    def send():
+        try:
+            backend().publish(user_id, event, data)
+        except Exception:
+            # A lost notification must never fail the approval that caused it
+            logger.exception("Could not publish %s for user %s", event, user_id,
+                             extra={'event': 'notifications.publish_error'})
+            return
+        PUBLISHED.inc(event=event)
+    transaction.on_commit(send)
+
+
+def field_approval_changed(field_id, user_id, field_name, is_approved, approved_at=None):
+    publish(user_id, 'field.approved' if is_approved else 'field.unapproved', {
+        'field_id': field_id,
+        'field_name': field_name,
+        'is_approved': is_approved,
+        'approved_at': approved_at.isoformat() if approved_at else None,
+    })
@@ -0,0 +1,98 @@
+"""
+Compact binary polygon encoding for low-bandwidth clients.
+
+Vertices are rounded to int32 microdegrees, delta-encoded against the previous
+vertex (lat and lng interleaved), zigzag-mapped to unsigned and written as
+LEB128 varints. A typical field vertex costs 2-4 bytes instead of ~45 bytes of
+``{"lat": ..., "lng": ...}`` JSON. Encoding and decoding are vectorized with NumPy.
+"""
+
+import base64
+import binascii
+
+import numpy as np
+
+SCALE = 1e6
+_MAX_VARINT_BYTES = 5  # zigzagged int32 fits in 5 x 7 bits
+
+
+def points_to_array(points):
+    """[{'lat': .., 'lng': ..}, ...] -> float64 array of shape (n, 2)"""
+    try:
+        return np.array([(point['lat'], point['lng']) for point in points], dtype=np.float64).reshape(-1, 2)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Polygon points must be objects with numeric lat and lng')
+
+
+def array_to_points(coords):
+    return [{'lat': lat, 'lng': lng} for lat, lng in coords.tolist()]
+
+
+def encode_array(coords):
+    """(n, 2) lat/lng degrees -> polyline bytes"""
+    micro = np.rint(np.asarray(coords, dtype=np.float64) * SCALE).astype(np.int64)
+    deltas = np.diff(micro, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+
+    nbytes = np.ones(zigzag.shape, dtype=np.int64)
+    for k in range(1, _MAX_VARINT_BYTES):
+        nbytes += zigzag >= (1 << (7 * k))
+    offsets = np.cumsum(nbytes) - nbytes
+
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(_MAX_VARINT_BYTES):
+        has_byte = nbytes > k
+        chunk = (zigzag[has_byte] >> (7 * k)) & 0x7F
+        continuation = np.where(nbytes[has_byte] > k + 1, 0x80, 0)
+        out[offsets[has_byte] + k] = chunk | continuation
+    return out.tobytes()
+
+
+def decode_array(data):
+    """Polyline bytes -> (n, 2) lat/lng degrees; raises ValueError on malformed input"""
+    buf = np.frombuffer(bytes(data), dtype=np.uint8)
+    if buf.size == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    if buf[-1] & 0x80:
+        raise ValueError('Truncated polyline')
+
+    ends = np.flatnonzero((buf & 0x80) == 0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    if lengths.max() > _MAX_VARINT_BYTES:
+        raise ValueError('Polyline varint too long')
+    if ends.size % 2:
+        raise ValueError('Polyline has an odd number of values')
+
+    position = np.arange(buf.size) - np.repeat(starts, lengths)
+    values = np.add.reduceat((buf & 0x7F).astype(np.int64) << (7 * position), starts)
+    deltas = (values >> 1) ^ -(values & 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / SCALE
+
+
+def encode(points):
+    return encode_array(points_to_array(points))
+
+
+def decode(data):
+    return array_to_points(decode_array(data))
+
+
+def encode_b64(points):
+    """Polyline as URL-safe base64 text, for JSON and form fields"""
+    return base64.urlsafe_b64encode(encode(points)).decode('ascii')
+
+
+def decode_b64(text):
+    try:
+        data = base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+    except (binascii.Error, TypeError):
+        raise ValueError('polygon_polyline is not valid base64')
+    return decode(data)
+
+
+def coerce_polygon(value):
+    """Decode a polygon sent as raw polyline bytes (e.g. a msgpack bin); pass anything else through"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return decode(value)
+    return value
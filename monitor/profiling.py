@@ -0,0 +1,230 @@
+"""
+On-demand request profiling.
+
+A request is profiled when a staff user asks for it (``X-Profile: 1`` header
+or ``?profile=1``), or at random with probability ``PROFILING_SAMPLE_RATE``.
+While it runs, a background thread samples the handling thread's stack every
+``PROFILING_INTERVAL_MS``. Asked for profiles are always kept; sampled ones
+only when the request took at least ``PROFILING_THRESHOLD_MS``.
+
+tracemalloc records the peak allocation too, but it slows Python code down
+several times over (``manage.py benchmark profiling``), so by default
+(``PROFILING_TRACEMALLOC=requested``) only asked for profiles use it; ``all``
+adds sampled requests and ``off`` disables it.
+
+Profiles are written to ``PROFILING_DIR`` as folded stacks
+(``frame;frame;frame count`` per line, readable by flamegraph.pl, speedscope
+and inferno) next to a small JSON description, and only the newest
+``PROFILING_MAX_FILES`` are kept. The admin lists them under
+``/admin/profiles/``.
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+
+PROFILES = metrics.Counter('request_profiles_total', 'Request profiles written, by trigger.', ('trigger',))
+HEADER = 'X-Profile'
+QUERY_PARAM = 'profile'
+
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+
+def profiles_dir():
+    path = settings.PROFILING_DIR or os.path.join(tempfile.gettempdir(), 'crop_monitor_profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def requested(request):
+    """True if the request asks to be profiled (whether it may is checked separately)"""
+    return request.headers.get(HEADER) == '1' or request.GET.get(QUERY_PARAM) == '1'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    filename = code.co_filename
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """Counts the folded stacks of one thread, sampled from a helper thread"""
+
+    def __init__(self, thread_id=None, interval=None):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = (interval if interval is not None else settings.PROFILING_INTERVAL_MS) / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._labels = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _label(self, frame):
+        # Code objects repeat across samples; label each once
+        label = self._labels.get(frame.f_code)
+        if label is None:
+            label = self._labels[frame.f_code] = _frame_label(frame)
+        return label
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+
+def _start_tracemalloc():
+    # Concurrent profiles share tracemalloc; the last one out stops it
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+        tracemalloc.reset_peak()
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    return peak
+
+
+class Profile:
+    """One request being profiled; ``trigger`` is 'requested' or 'sampled'"""
+
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.sampler = StackSampler()
+        self.peak_bytes = None
+        self.duration = None
+        self.tracemalloc = settings.PROFILING_TRACEMALLOC == 'all' or (
+            settings.PROFILING_TRACEMALLOC == 'requested' and trigger == 'requested'
+        )
+
+    def __enter__(self):
+        if self.tracemalloc:
+            _start_tracemalloc()
+        self.start = time.perf_counter()
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.start
+        if self.tracemalloc:
+            self.peak_bytes = _stop_tracemalloc()
+
+    def worth_keeping(self):
+        return self.trigger == 'requested' or self.duration * 1000 >= settings.PROFILING_THRESHOLD_MS
+
+
+def choose(request, user):
+    """The trigger to profile this request with, or None"""
+    if requested(request) and user is not None and user.is_staff:
+        return 'requested'
+    rate = settings.PROFILING_SAMPLE_RATE
+    if rate > 0 and random.random() < rate:
+        return 'sampled'
+    return None
+
+
+def save(profile, description):
+    """Write a finished profile and prune the oldest; returns its id"""
+    created = timezone.now()
+    profile_id = f'{created:%Y%m%dT%H%M%S%f}-{os.getpid()}-{threading.get_ident() % 100000}'
+    directory = profiles_dir()
+    with open(os.path.join(directory, f'{profile_id}.folded'), 'w') as fh:
+        fh.write(profile.sampler.folded())
+    meta = {
+        **description,
+        'id': profile_id,
+        'created_at': created.isoformat(),
+        'trigger': profile.trigger,
+        'duration_ms': round(profile.duration * 1000, 1),
+        'samples': profile.sampler.samples,
+        'interval_ms': profile.sampler.interval * 1000,
+        'peak_bytes': profile.peak_bytes,
+    }
+    # The description goes last: list_profiles() only shows complete pairs
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(meta, fh)
+    os.replace(tmp_path, os.path.join(directory, f'{profile_id}.json'))
+    PROFILES.inc(trigger=profile.trigger)
+    prune(directory)
+    return profile_id
+
+
+def prune(directory=None):
+    directory = directory or profiles_dir()
+    ids = sorted(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:max(len(ids) - settings.PROFILING_MAX_FILES, 0)]:
+        for suffix in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+
+
+def list_profiles():
+    """Descriptions of the kept profiles, newest first"""
+    directory = profiles_dir()
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as fh:
+                profiles.append(json.load(fh))
+        except (FileNotFoundError, ValueError):
+            continue
+    return profiles
+
+
+def folded_path(profile_id):
+    """Path of a profile's folded stacks, or None for unknown or malformed ids"""
+    if not re.fullmatch(r'[0-9T]+-\d+-\d+', profile_id or ''):
+        return None
+    path = os.path.join(profiles_dir(), f'{profile_id}.folded')
+    return path if os.path.exists(path) else None
@@ -0,0 +1,129 @@
+"""
+Token-bucket rate limiting shared by every worker.
+
+Buckets live in the database rather than the cache: without REDIS_URL the
+cache is per process, and a single conditional UPDATE gives an exact,
+race-free "refill then take" on any backend. Each scope in
+``settings.RATE_LIMITS`` has a per-client bucket (user, or IP for anonymous
+requests) and a global one; a request must get a token from both.
+"""
+
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.db.models.lookups import GreaterThanOrEqual
+from rest_framework.exceptions import Throttled
+
+from . import metrics
+from .models import RateLimitBucket
+
+THROTTLED = metrics.Counter(
+    'rate_limited_requests_total', 'Requests rejected by a token bucket, by scope and bucket.',
+    ('scope', 'bucket'),
+)
+
+# Fraction of takes that also delete idle buckets; a bucket idle for longer
+# than it takes to refill completely is full, so dropping it changes nothing
+PRUNE_PROBABILITY = 0.01
+
+
+def _now():
+    return time.time()
+
+
+def _refilled(now, rate, burst):
+    elapsed = Greatest(Value(now) - F('updated_at'), Value(0.0))
+    return Least(Value(float(burst)), F('tokens') + elapsed * Value(float(rate)))
+
+
+def take(key, rate, burst, cost=1):
+    """
+    Take ``cost`` tokens from the bucket ``key`` (refilling at ``rate`` per
+    second up to ``burst``). Returns 0 on success, otherwise the seconds until
+    enough tokens will have accumulated.
+    """
+    now = _now()
+    refilled = _refilled(now, rate, burst)
+    for _ in range(2):
+        # The row-local condition is re-checked under the row lock, so
+        # concurrent takers can never overdraw the bucket
+        taken = RateLimitBucket.objects.filter(
+            GreaterThanOrEqual(refilled, Value(float(cost))), key=key,
+        ).update(tokens=refilled - Value(float(cost)), updated_at=now)
+        if taken:
+            return 0.0
+        bucket = RateLimitBucket.objects.filter(key=key).values_list('tokens', 'updated_at').first()
+        if bucket is not None:
+            tokens, updated_at = bucket
+            available = min(burst, tokens + max(now - updated_at, 0.0) * rate)
+            return max((cost - available) / rate, 0.001)
+        try:
+            with transaction.atomic():
+                RateLimitBucket.objects.create(key=key, tokens=burst - cost, updated_at=now)
+            return 0.0
+        except IntegrityError:
+            continue  # another worker created it first; take from that one
+    return 1.0 / rate
+
+
+def refund(key, burst, cost=1):
+    RateLimitBucket.objects.filter(key=key).update(tokens=Least(Value(float(burst)), F('tokens') + Value(float(cost))))
+
+
+def prune(scope):
+    """Delete this scope's buckets that have been idle long enough to be full"""
+    now = _now()
+    for bucket, (rate, burst) in settings.RATE_LIMITS[scope].items():
+        RateLimitBucket.objects.filter(
+            key__startswith=f'{scope}:{bucket}:', updated_at__lt=now - burst / rate,
+        ).delete()
+
+
+def client_key(request):
+    if request.user.is_authenticated:
+        return f'user-{request.user.pk}'
+    # The platform proxy appends the address it saw to X-Forwarded-For
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    return f"ip-{forwarded.split(',')[-1].strip() or request.META.get('REMOTE_ADDR', 'unknown')}"
+
+
+def check(scope, request):
+    """Seconds the request must wait (0 if it may proceed, consuming its tokens)"""
+    limits = settings.RATE_LIMITS[scope]
+    taken = []
+    for bucket, (rate, burst) in limits.items():
+        key = f'{scope}:{bucket}:' + (client_key(request) if bucket == 'user' else 'all')
+        wait = take(key, rate, burst)
+        if wait:
+            THROTTLED.inc(scope=scope, bucket=bucket)
+            # Don't charge the buckets that let this request through
+            for taken_key, taken_burst in taken:
+                refund(taken_key, taken_burst)
+            return wait
+        taken.append((key, burst))
+    if random.random() < PRUNE_PROBABILITY:
+        prune(scope)
+    return 0.0
+
+
+def rate_limited(scope):
+    """
+    Reject requests over ``settings.RATE_LIMITS[scope]`` with 429 and Retry-After.
+    Works on both APIView methods and @api_view functions.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            if settings.RATE_LIMIT_ENABLED:
+                wait = check(scope, args[-1])
+                if wait:
+                    raise Throttled(wait=math.ceil(wait))
+            return view_func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,193 @@
+"""
+Fast JSON rendering/parsing, binary transports and pre-rendered field payloads.
+
+``orjson`` is used when installed, with DRF's stdlib ``json`` path as the
+fallback. Each FieldSubmission also keeps its public JSON representation in
+``rendered_json``, refreshed whenever the row is saved, so list endpoints can
+splice stored byte fragments together instead of re-encoding every vertex.
+
+JSON stays the default; clients on slow links can send ``Accept:
+application/msgpack`` or ``application/vnd.cropmonitor.polyline+msgpack``,
+the latter also replacing every ``polygon`` with polyline bytes.
+"""
+
+import json
+
+import msgpack
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from . import polyline
+from .models import FieldSubmission, User
+from .serializers import FieldSubmissionSerializer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+_default_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Compact JSON bytes, escaping U+2028/2029 like DRF's JSONRenderer"""
+    if orjson is not None:
+        ret = orjson.dumps(data, default=_default_encoder.default, option=_ORJSON_OPTIONS)
+    else:
+        ret = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    if b'\xe2\x80' in ret:
+        ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+    return ret
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class PrerenderedJSON:
+    """A JSON array whose items are already-encoded byte fragments"""
+
+    __slots__ = ('fragments',)
+
+    def __init__(self, fragments):
+        self.fragments = list(fragments)
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def to_bytes(self):
+        return b'[' + b','.join(self.fragments) + b']'
+
+    def decode(self):
+        """Python objects, for renderers that can't splice JSON bytes"""
+        return loads(self.to_bytes())
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if isinstance(data, PrerenderedJSON):
+            if indent is None:
+                return data.to_bytes()
+            data = data.decode()
+        if indent is not None:
+            # orjson can only indent by 2; leave pretty-printing to DRF
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MsgpackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def prepare(self, data):
+        return data
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, PrerenderedJSON):
+            data = data.decode()
+        return msgpack.packb(self.prepare(data), use_bin_type=True, default=_default_encoder.default)
+
+
+class PolylineMsgpackRenderer(MsgpackRenderer):
+    """MessagePack with every ``polygon`` list replaced by polyline-encoded bytes"""
+
+    media_type = 'application/vnd.cropmonitor.polyline+msgpack'
+    format = 'polyline'
+
+    def prepare(self, data):
+        if isinstance(data, list):
+            return [self.prepare(item) for item in data]
+        if isinstance(data, dict):
+            return {
+                key: polyline.encode(value) if key == 'polygon' and isinstance(value, list) and value
+                else self.prepare(value)
+                for key, value in data.items()
+            }
+        return data
+
+
+class MsgpackParser(BaseParser):
+    media_type = 'application/msgpack'
+    renderer_class = MsgpackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
+
+
+class PolylineMsgpackParser(MsgpackParser):
+    # Same wire format; polygon bytes are decoded by the serializer
+    media_type = 'application/vnd.cropmonitor.polyline+msgpack'
+    renderer_class = PolylineMsgpackRenderer
+
+
+def render_field(field):
+    return dumps(FieldSubmissionSerializer(field).data)
+
+
+def render_fields(fields):
+    """Payloads for many fields, building the serializer's fields only once"""
+    return [dumps(data) for data in FieldSubmissionSerializer(fields, many=True).data]
+
+
+def refresh_rendered_json(queryset):
+    """Re-render stored payloads, e.g. after a queryset.update() that skipped post_save"""
+    for field in queryset.select_related('user'):
+        FieldSubmission.objects.filter(pk=field.pk).update(rendered_json=render_field(field))
+
+
+def rendered_fields(queryset):
+    """
+    Stored payloads for ``queryset`` in order, rendering and saving any that
+    are missing (rows written before rendered_json existed).
+    """
+    fragments = []
+    for pk, blob in queryset.values_list('pk', 'rendered_json'):
+        if blob is None:
+            field = FieldSubmission.objects.select_related('user').get(pk=pk)
+            blob = render_field(field)
+            FieldSubmission.objects.filter(pk=pk).update(rendered_json=blob)
+        fragments.append(bytes(blob))
+    return PrerenderedJSON(fragments)
+
+
+@receiver(post_save, sender=FieldSubmission)
+def refresh_rendered_json_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'rendered_json'}:
+        return
+    FieldSubmission.objects.filter(pk=instance.pk).update(rendered_json=render_field(instance))
+
+
+@receiver(post_save, sender=User)
+def refresh_rendered_json_on_user_save(sender, instance, created, update_fields=None, **kwargs):
+    # Payloads embed user_username; skip saves that can't have changed it (e.g. last_login)
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    refresh_rendered_json(FieldSubmission.objects.filter(user=instance))
@@ -0,0 +1,180 @@
+"""
+Read replica routing (``DATABASE_REPLICA_URLS``).
+
+Only requests use replicas: ``ReplicaRoutingMiddleware`` opens a routing
+scope, and reads in it go to one healthy replica per request. Everything
+else (management commands, background jobs) stays on the primary. Reads
+also stay on the primary when the request has already written, inside a
+transaction, or when the client or user is pinned. A pin lasts
+``DATABASE_REPLICA_PIN_SECONDS`` and is set for the client that wrote and
+for every user whose data changed (via ``caching.bump_user_version``), so a
+fresh signup and an approved farmer both see their own writes. Pins live
+in the default cache, so they are only shared between workers with Redis;
+without it (``DATABASE_REPLICA_READS_ENABLED`` off) every read stays on the
+primary.
+
+Replicas are probed at most every ``DATABASE_REPLICA_HEALTH_INTERVAL``
+seconds per process. One that can't be reached, lags by more than
+``DATABASE_REPLICA_MAX_LAG_SECONDS`` (PostgreSQL only), or fails a query is
+left out until its next probe passes.
+"""
+
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import metrics
+from .ratelimit import client_key
+
+EJECTIONS = metrics.Counter(
+    'db_replica_ejections_total', 'Read replicas taken out of rotation, by alias and reason.', ('alias', 'reason'),
+)
+
+_current = contextvars.ContextVar('replica_routing', default=None)
+_health = {}  # alias -> (healthy, checked at)
+_health_lock = threading.Lock()
+
+# Seconds of replay lag; 0 when the replica has replayed everything it received
+_PG_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+
+class RoutingState:
+    __slots__ = ('client', 'user', 'pinned', 'wrote', 'replica')
+
+    def __init__(self, client, pinned):
+        self.client = client
+        self.user = None
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+def _now():
+    return time.time()
+
+
+def enabled():
+    return bool(settings.DATABASE_REPLICAS) and settings.DATABASE_REPLICA_READS_ENABLED
+
+
+def _pin_key(ident):
+    return f'db-pin:{ident}'
+
+
+def pin(*idents):
+    """Keep reads for these clients/users on the primary for a while"""
+    if enabled():
+        cache.set_many({_pin_key(ident): 1 for ident in idents if ident},
+                       timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def pin_user(user_id):
+    pin(f'user-{user_id}')
+
+
+def begin(request):
+    """Open a routing scope for a request; returns the token for finish()"""
+    if not enabled():
+        return None
+    client = client_key(request)
+    return _current.set(RoutingState(client, cache.get(_pin_key(client)) is not None))
+
+
+def identify(user_id):
+    """Note the authenticated user once known (JWT requests authenticate in the view)"""
+    state = _current.get()
+    if state is not None and state.user is None:
+        state.user = f'user-{user_id}'
+        state.pinned = state.pinned or cache.get(_pin_key(state.user)) is not None
+
+
+def finish(token):
+    if token is None:
+        return
+    state = _current.get()
+    _current.reset(token)
+    if state.wrote:
+        pin(state.client, state.user)
+
+
+def failed(exception):
+    """Eject the request's replica if ``exception`` is a database error"""
+    state = _current.get()
+    if state is not None and state.replica not in (None, DEFAULT_DB_ALIAS) and isinstance(exception, DatabaseError):
+        eject(state.replica, 'error')
+
+
+def eject(alias, reason):
+    with _health_lock:
+        _health[alias] = (False, _now())
+    EJECTIONS.inc(alias=alias, reason=reason)
+
+
+def _probe(alias):
+    """None when the replica is usable, otherwise the reason it isn't"""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                cursor.execute('SELECT 1')
+                return None
+            cursor.execute(_PG_LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        return 'unreachable'
+    return 'lag' if float(lag) > settings.DATABASE_REPLICA_MAX_LAG_SECONDS else None
+
+
+def is_healthy(alias):
+    now = _now()
+    with _health_lock:
+        healthy, checked_at = _health.get(alias, (True, None))
+    if checked_at is not None and now - checked_at < settings.DATABASE_REPLICA_HEALTH_INTERVAL:
+        return healthy
+    reason = _probe(alias)
+    if reason is not None:
+        eject(alias, reason)
+        return False
+    with _health_lock:
+        _health[alias] = (True, now)
+    return True
+
+
+def choose_replica():
+    healthy = [alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)]
+    return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if (state is None or state.pinned or state.wrote
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = choose_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        return False if db in settings.DATABASE_REPLICAS else None
@@ -0,0 +1,91 @@
+"""
+Claim-based distribution of pending field submissions between reviewers.
+
+A reviewer claims a batch of the oldest unclaimed pending fields and holds
+them until the lease expires, so concurrent admins never page through the
+same rows. All queue reads go through ``fieldsub_pending_idx``, the partial
+index on ``is_approved = false``.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import FieldSubmission
+
+
+def pending():
+    return FieldSubmission.objects.filter(is_approved=False)
+
+
+def claimable(reviewer, now):
+    """Pending rows that are unclaimed, whose lease ran out, or already ours"""
+    return pending().filter(
+        Q(claimed_by__isnull=True) | Q(claim_expires_at__lt=now) | Q(claimed_by=reviewer)
+    )
+
+
+def claim_batch(reviewer, size=None, lease=None):
+    """
+    Claim up to ``size`` of the oldest claimable pending fields for ``reviewer``.
+
+    On PostgreSQL candidates are picked with ``SELECT ... FOR UPDATE SKIP LOCKED``
+    so concurrent claimers pass over each other's rows instead of waiting. SQLite
+    has no row locks, but it serializes writers, so there the conditional UPDATE
+    below is what keeps two reviewers from claiming the same row.
+    """
+    size = size or settings.REVIEW_QUEUE_BATCH_SIZE
+    lease = lease or timedelta(seconds=settings.REVIEW_QUEUE_LEASE_SECONDS)
+    now = timezone.now()
+    expires_at = now + lease
+
+    with transaction.atomic():
+        candidates = claimable(reviewer, now).order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True)[:size])
+        claimable(reviewer, now).filter(id__in=ids).update(
+            claimed_by=reviewer, claim_expires_at=expires_at
+        )
+        return list(
+            FieldSubmission.objects.filter(id__in=ids, claimed_by=reviewer, claim_expires_at=expires_at)
+            .select_related('user')
+            .order_by('created_at')
+        )
+
+
+def release(reviewer, field_ids=None):
+    """Give back claimed fields (all of the reviewer's claims if no ids given)"""
+    claims = FieldSubmission.objects.filter(claimed_by=reviewer)
+    if field_ids is not None:
+        claims = claims.filter(id__in=field_ids)
+    return claims.update(claimed_by=None, claim_expires_at=None)
+
+
+def approve_claimed(reviewer, field_id):
+    """
+    Approve a pending field unless another reviewer holds a live claim on it.
+    Returns the approved field, or None if it was already approved or taken.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        field = claimable(reviewer, now).select_for_update().filter(id=field_id).first()
+        if field is None:
+            return None
+        field.approve(reviewer)
+        return field
+
+
+def queue_stats():
+    """Queue depth and age of the oldest pending field, answered from the partial index"""
+    now = timezone.now()
+    oldest = pending().order_by('created_at').values_list('created_at', flat=True).first()
+    return {
+        'pending': pending().count(),
+        'claimed': pending().filter(claim_expires_at__gte=now).count(),
+        'oldest_pending_at': oldest.isoformat() if oldest else None,
+        'oldest_pending_age_seconds': (now - oldest).total_seconds() if oldest else 0,
+    }
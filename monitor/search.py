@@ -0,0 +1,132 @@
+"""
+Full-text search over field submissions.
+
+Every FieldSubmission keeps ``search_document``, the lower-cased words of its
+searchable columns and its owner's username and email, rebuilt on save. The
+document is indexed by the database itself, so ``bulk_create`` and
+``queryset.update()`` stay in sync without signals:
+
+* SQLite: an external-content FTS5 table kept current by triggers
+* PostgreSQL: a GIN index on ``to_tsvector('simple', search_document)``
+
+Both are (re)created after every ``migrate``: SQLite drops a table's triggers
+whenever a migration rebuilds it. Each query word is matched as a prefix and
+all words must match; results are ranked by BM25 / ts_rank. Other backends
+fall back to unindexed ``icontains`` filters.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import SEARCH_DOCUMENT_FIELDS, FieldSubmission, User, search_document
+
+FTS_TABLE = 'monitor_fieldsubmission_fts'
+MAX_TERMS = 8
+
+_SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON monitor_fieldsubmission BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+        END""",
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON monitor_fieldsubmission BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document)
+                VALUES ('delete', old.id, old.search_document);
+        END""",
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF search_document ON monitor_fieldsubmission BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document)
+                VALUES ('delete', old.id, old.search_document);
+            INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+        END""",
+}
+
+
+def install_index(connection):
+    """Create the backend's full-text index if missing; returns True if anything was created"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                           [f'{FTS_TABLE}%'])
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [sql for name, sql in _SQLITE_TRIGGERS.items() if name not in existing]
+            if FTS_TABLE not in existing:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(search_document, content='monitor_fieldsubmission', "
+                    f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+            for sql in missing:
+                cursor.execute(sql)
+            if missing:
+                # Rows written while the triggers were missing aren't indexed
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            return bool(missing)
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS fieldsub_search_idx ON monitor_fieldsubmission "
+                "USING GIN (to_tsvector('simple'::regconfig, search_document))"
+            )
+    return False
+
+
+@receiver(post_migrate)
+def install_index_after_migrate(sender, using, **kwargs):
+    if sender.name == 'monitor':
+        install_index(connections[using])
+
+
+@receiver(post_save, sender=User)
+def refresh_documents_on_user_change(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only; documents embed the username and email
+    if created or (update_fields is not None and not {'username', 'email'} & set(update_fields)):
+        return
+    changed = []
+    for field in FieldSubmission.objects.filter(user=instance).only('search_document', *SEARCH_DOCUMENT_FIELDS):
+        document = search_document(field, instance)
+        if document != field.search_document:
+            field.search_document = document
+            changed.append(field)
+    FieldSubmission.objects.bulk_update(changed, ['search_document'])
+
+
+def terms(query):
+    """Lower-cased words of a search box query, at most MAX_TERMS"""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def search(queryset, query):
+    """
+    FieldSubmissions in ``queryset`` matching every word of ``query`` as a
+    prefix, annotated with ``search_rank`` (higher is better) and ordered by it.
+    """
+    words = terms(query)
+    if not words:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id",
+            [match], output_field=FloatField(),
+        )
+        matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        queryset = queryset.filter(pk__in=matches).annotate(search_rank=rank)
+    elif vendor == 'postgresql':
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        vector = f"to_tsvector('simple'::regconfig, {table}.search_document)"
+        queryset = queryset.filter(pk__in=RawSQL(
+            f"SELECT id FROM {table} WHERE {vector} @@ to_tsquery('simple', %s)", [tsquery],
+        )).annotate(search_rank=RawSQL(
+            f"ts_rank({vector}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField(),
+        ))
+    else:
+        for word in words:
+            queryset = queryset.filter(search_document__icontains=word)
+        queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    return queryset.order_by(F('search_rank').desc(), '-created_at')
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from django.http import QueryDict
+from . import geocoder, polyline
 from .models import User, FieldSubmission
 
 class UserSerializer(serializers.ModelSerializer):
@@ -22,8 +24,15 @@ class FieldSubmissionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = FieldSubmission
-        fields = '__all__'
+        # Internal review-queue state, cached payload, search index text and derived geometry
+        exclude = (
+            'claimed_by', 'claim_expires_at', 'rendered_json', 'search_document', 'location_warning',
+            'area_hectares', 'min_lat', 'min_lng', 'max_lat', 'max_lng',
+        )
         extra_kwargs = {
+            # May be left blank and filled in from lat/lng
+            'city': {'required': False, 'allow_blank': True},
+            'country': {'required': False, 'allow_blank': True},
             'is_approved': {'read_only': True},
             'approved_at': {'read_only': True},
             'approved_by': {'read_only': True},
@@ -31,6 +40,19 @@ class FieldSubmissionSerializer(serializers.ModelSerializer):
             'updated_at': {'read_only': True},
         }
     
+    def to_internal_value(self, data):
+        # Polygons may arrive as polyline bytes (msgpack bin) or base64 text
+        encoded = data.get('polygon_polyline') if hasattr(data, 'get') else None
+        if encoded or (hasattr(data, 'get') and isinstance(data.get('polygon'), (bytes, bytearray))):
+            try:
+                polygon = polyline.decode_b64(encoded) if encoded else polyline.coerce_polygon(data['polygon'])
+            except ValueError as e:
+                raise serializers.ValidationError({'polygon': [str(e)]})
+            # Form fields are strings to DRF's JSONField; a plain dict keeps the list as is
+            data = data.dict() if isinstance(data, QueryDict) else data.copy()
+            data['polygon'] = polygon
+        return super().to_internal_value(data)
+    
     def validate_polygon(self, value):
         if value is not None and not isinstance(value, list):
             raise serializers.ValidationError("Polygon must be a list of coordinates")
@@ -44,4 +66,24 @@ class FieldSubmissionSerializer(serializers.ModelSerializer):
     def validate_lng(self, value):
         if not -180 <= value <= 180:
             raise serializers.ValidationError("Longitude must be between -180 and 180")
-        return value
\ No newline at end of file
+        return value
+    
+    def validate(self, attrs):
+        lat = attrs.get('lat', getattr(self.instance, 'lat', None))
+        lng = attrs.get('lng', getattr(self.instance, 'lng', None))
+        if lat is not None and lng is not None:
+            city = attrs.get('city', getattr(self.instance, 'city', ''))
+            country = attrs.get('country', getattr(self.instance, 'country', ''))
+            check = geocoder.check_location(lat, lng, city, country)
+            attrs['city'], attrs['country'] = check.city, check.country
+            attrs['location_warning'] = check.warning
+        missing = {name: ["This field is required."] for name in ('city', 'country')
+                   if not attrs.get(name, getattr(self.instance, name, ''))}
+        if missing:
+            raise serializers.ValidationError(missing)
+        return attrs
+
+
+class BulkFieldSubmissionSerializer(FieldSubmissionSerializer):
+    """One item of a bulk submission; the owner is the requesting user, never the payload"""
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
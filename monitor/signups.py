@@ -0,0 +1,267 @@
+"""
+Deferred signup geometry processing.
+
+``SignupView`` validates the account and the non-geometry field data, saves
+the user plus a ``SignupJob`` holding the raw field data and KML upload, and
+answers 202 with the job id. A worker then extracts the polygon (KML, drawn,
+or a default square around lat/lng), validates it and creates the
+FieldSubmission; ``approval_status`` reports jobs that haven't finished.
+
+Jobs are claimed with a conditional UPDATE, so each attempt runs once even
+with several workers. The submission and the job's completion are committed
+together, so a rerun after a crash never creates a second field. Attempts
+that raise are retried with exponential backoff; a worker that dies leaves
+its job to be claimed again once its lease runs out.
+
+Executors (``SIGNUP_PROCESSING_BACKEND``):
+
+* ``local``: a thread pool in the web process (``SIGNUP_PROCESSING_THREADS``;
+  0 runs jobs inline, which tests use). New jobs start on commit; a sweeper
+  thread, started with the process's first request, picks up retries and
+  expired leases every ``SIGNUP_PROCESSING_SWEEP_SECONDS``.
+* ``worker``: nothing in the web process; ``manage.py process_signups`` polls
+  the table for due jobs (new, retries and expired leases alike) on
+  ``--threads`` threads, sleeping ``--poll`` seconds (default 2) whenever
+  none is due.
+"""
+
+import base64
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import kml_blobs, metrics, polyline
+from .caching import bump_user_versions
+from .kml import KmlParserMixin
+from .models import SignupJob
+from .serializers import FieldSubmissionSerializer
+from .storage import digest_from_name
+
+logger = logging.getLogger(__name__)
+
+JOBS = metrics.Counter('signup_jobs_total', 'Signup processing attempts by outcome.', ('outcome',))
+DEFAULT_POLYGON_OFFSET = 0.005  # degrees, roughly 500 m
+
+_pool = None
+_sweeper = None
+_pool_lock = threading.Lock()
+
+
+def field_data_from_request(data):
+    """The JSON-serializable field inputs of a signup request (geometry left raw)"""
+    field_data = {name: data.get(name) for name in (
+        'first_name', 'last_name', 'email', 'phone', 'city', 'country', 'zip_code',
+        'field_name', 'crop_name', 'plantation_date', 'lat', 'lng',
+    )}
+    polygon = data.get('polygon')
+    if isinstance(polygon, (bytes, bytearray)):
+        # Raw polyline bytes (msgpack bin) are kept in their base64 form
+        field_data['polygon_polyline'] = base64.urlsafe_b64encode(bytes(polygon)).decode('ascii')
+    elif polygon:
+        field_data['polygon'] = polygon
+    if data.get('polygon_polyline'):
+        field_data['polygon_polyline'] = data.get('polygon_polyline')
+    return field_data
+
+
+def enqueue(user, field_data, kml_upload=None):
+    """Save a job for ``user``; it starts once the surrounding transaction commits"""
+    job = SignupJob.objects.create(user=user, field_data=field_data, kml_file=kml_upload)
+    if job.kml_file:
+        # Keeps the blob alive until the job's submission takes the reference over
+        kml_blobs.add_reference(job.kml_file.name, kml_upload)
+    transaction.on_commit(lambda: submit(job.pk))
+    return job
+
+
+def submit(job_id):
+    if settings.SIGNUP_PROCESSING_BACKEND != 'local':
+        return
+    if settings.SIGNUP_PROCESSING_THREADS == 0:
+        run(job_id)
+        return
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(settings.SIGNUP_PROCESSING_THREADS, thread_name_prefix='signups')
+    _pool.submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run(job_id)
+    except Exception:
+        logger.exception("Signup job %s crashed", job_id, extra={'event': 'signup.job_crashed'})
+    finally:
+        close_old_connections()
+
+
+def sweep():
+    """Process every job that is due (retries, expired leases); returns how many"""
+    processed = 0
+    while run() is not None:
+        processed += 1
+    return processed
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(settings.SIGNUP_PROCESSING_SWEEP_SECONDS)
+        close_old_connections()
+        try:
+            sweep()
+        except Exception:
+            logger.exception("Signup sweep failed", extra={'event': 'signup.sweep_error'})
+        finally:
+            close_old_connections()
+
+
+@receiver(request_started)
+def start_sweeper(**kwargs):
+    # Started from a request rather than at import so it runs in each
+    # gunicorn worker, not in the preloading master
+    global _sweeper
+    if _sweeper is not None or settings.SIGNUP_PROCESSING_BACKEND != 'local' or settings.SIGNUP_PROCESSING_THREADS == 0:
+        return
+    with _pool_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, name='signups-sweeper', daemon=True)
+            _sweeper.start()
+
+
+def claim(job_id=None):
+    """Take the next due job (or ``job_id`` if due) for one attempt, or None"""
+    now = timezone.now()
+    due = SignupJob.objects.filter(status__in=(SignupJob.PENDING, SignupJob.PROCESSING), available_at__lte=now)
+    if job_id is not None:
+        due = due.filter(pk=job_id)
+    for pk, attempts in due.order_by('available_at').values_list('pk', 'attempts')[:10]:
+        # Matching on attempts makes the claim exclusive without row locks
+        claimed = due.filter(pk=pk, attempts=attempts).update(
+            status=SignupJob.PROCESSING, attempts=F('attempts') + 1,
+            available_at=now + timedelta(seconds=settings.SIGNUP_PROCESSING_LEASE_SECONDS),
+        )
+        if claimed:
+            return SignupJob.objects.select_related('user').get(pk=pk)
+    return None
+
+
+def run(job_id=None):
+    """Claim and process one job; returns it, or None if nothing was due"""
+    job = claim(job_id)
+    if job is not None:
+        process(job)
+    return job
+
+
+class GeometryExtractor(KmlParserMixin):
+    def polygon(self, job):
+        """(polygon, digest of a KML parsed here or None) in signup priority order"""
+        data = job.field_data
+        if job.kml_file:
+            digest = digest_from_name(job.kml_file.name)
+            polygon = kml_blobs.cached_geometry(digest) if digest else None
+            if polygon:
+                return polygon, None
+            with job.kml_file.open('rb') as fh:
+                polygon = self.parse_kml_file(fh)
+            if polygon:
+                return polygon, digest
+
+        if data.get('polygon_polyline'):
+            try:
+                return polyline.decode_b64(data['polygon_polyline']), None
+            except ValueError as exc:
+                logger.warning("Polyline polygon could not be decoded: %s", exc,
+                               extra={'event': 'signup.polyline_decode_error'})
+        elif data.get('polygon'):
+            polygon = data['polygon']
+            if isinstance(polygon, str):
+                try:
+                    polygon = json.loads(polygon)
+                except json.JSONDecodeError as exc:
+                    logger.warning("Drawn polygon is not valid JSON: %s", exc,
+                                   extra={'event': 'signup.polygon_decode_error'})
+                    polygon = None
+            if polygon:
+                return polygon, None
+
+        try:
+            lat, lng, offset = float(data['lat']), float(data['lng']), DEFAULT_POLYGON_OFFSET
+        except (KeyError, TypeError, ValueError):
+            return [], None
+        return [
+            {'lat': lat - offset, 'lng': lng - offset},
+            {'lat': lat - offset, 'lng': lng + offset},
+            {'lat': lat + offset, 'lng': lng + offset},
+            {'lat': lat + offset, 'lng': lng - offset},
+            {'lat': lat - offset, 'lng': lng - offset},
+        ], None
+
+
+extractor = GeometryExtractor()
+
+
+def _finish(job, status, error=''):
+    """
+    Record the attempt's result unless a newer attempt has claimed the job
+    since (its lease ran out); returns False in that case.
+    """
+    finished = SignupJob.objects.filter(pk=job.pk, attempts=job.attempts, status=SignupJob.PROCESSING).update(
+        status=status, last_error=error, field=job.field, finished_at=timezone.now(),
+    )
+    # A created submission inherits the job's blob reference (it was built
+    # from the stored name, so its own save doesn't count one)
+    if finished and job.kml_file and job.field is None:
+        kml_blobs.drop_reference(job.kml_file.name)
+    return bool(finished)
+
+
+def process(job):
+    """One attempt at a claimed job"""
+    try:
+        polygon, parsed_digest = extractor.polygon(job)
+        data = {key: value for key, value in job.field_data.items() if key != 'polygon_polyline'}
+        serializer = FieldSubmissionSerializer(data={**data, 'user': job.user_id, 'polygon': polygon})
+        with transaction.atomic():
+            if serializer.is_valid():
+                job.field = serializer.save(kml_file=job.kml_file.name or None)
+                status, error, outcome = SignupJob.DONE, '', 'done'
+            else:
+                status, error, outcome = SignupJob.FAILED, json.dumps(serializer.errors), 'invalid'
+            if not _finish(job, status, error):
+                transaction.set_rollback(True)
+                return
+        if parsed_digest and outcome == 'done':
+            kml_blobs.remember_geometry(parsed_digest, polygon)
+    except Exception as exc:
+        logger.exception("Signup job %s attempt %d failed", job.pk, job.attempts, extra={'event': 'signup.job_error'})
+        job.field = None
+        error = f'{type(exc).__name__}: {exc}'
+        if job.attempts >= settings.SIGNUP_PROCESSING_MAX_ATTEMPTS:
+            _finish(job, SignupJob.FAILED, error)
+            outcome = 'failed'
+        else:
+            delay = settings.SIGNUP_PROCESSING_RETRY_DELAY * 2 ** (job.attempts - 1)
+            SignupJob.objects.filter(pk=job.pk, attempts=job.attempts, status=SignupJob.PROCESSING).update(
+                status=SignupJob.PENDING, last_error=error,
+                available_at=timezone.now() + timedelta(seconds=delay),
+            )
+            outcome = 'retried'
+    JOBS.inc(outcome=outcome)
+    bump_user_versions([job.user_id])
+    logger.info(
+        "Signup job %s: %s", job.pk, outcome,
+        extra={'event': 'signup.processed', 'user_id': job.user_id, 'outcome': outcome},
+    )
@@ -0,0 +1,142 @@
+"""
+Server-Sent Events stream of a user's notifications (ASGI only).
+
+``crop_monitor_backend.asgi`` routes ``STREAM_PATH`` here ahead of Django,
+so an idle stream costs one coroutine and a queue rather than a worker
+thread. Clients authenticate with their JWT access token, either as an
+``Authorization: Bearer`` header or as ``?token=`` because browsers'
+``EventSource`` can't set headers. On reconnect the browser sends
+``Last-Event-ID`` (``?last_event_id=`` works too) and missed events are
+replayed first. A comment line every ``NOTIFICATIONS_HEARTBEAT_SECONDS``
+keeps proxies from closing idle streams.
+
+Events look like::
+
+    id: 42
+    event: field.approved
+    data: {"field_id": 7, "field_name": "North", "is_approved": true, ...}
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from . import metrics, notifications
+from .authentication import CachedJWTAuthentication
+
+STREAM_PATH = '/api/v1/notifications/stream/'
+RETRY_MS = 3000
+
+STREAMS = metrics.Counter('notification_streams_total', 'Notification streams opened, by outcome.', ('outcome',))
+
+
+def format_event(event):
+    return f'id: {event.id}\nevent: {event.event}\ndata: {json.dumps(event.data)}\n\n'.encode()
+
+
+def _authenticate(raw_token):
+    authentication = CachedJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+
+
+def _credentials(scope):
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', ())}
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    token = query.get('token', [''])[0]
+    scheme, _, value = headers.get('authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and value:
+        token = value.strip()
+    last_event_id = headers.get('last-event-id') or query.get('last_event_id', [''])[0]
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = None
+    return token, last_event_id
+
+
+async def _respond(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def stream(scope, receive, send):
+    """The ASGI app for STREAM_PATH"""
+    if scope['method'] != 'GET':
+        await _respond(send, 405, {'error': 'Method not allowed'})
+        return
+    token, last_event_id = _credentials(scope)
+    user = await sync_to_async(_authenticate)(token) if token else None
+    if user is None:
+        STREAMS.inc(outcome='unauthenticated')
+        await _respond(send, 401, {'error': 'A valid access token is required'})
+        return
+
+    backend = notifications.backend()
+    await sync_to_async(backend.start)()
+    # Subscribe before replaying so nothing published in between is lost
+    subscription = notifications.hub.subscribe(user.pk)
+    STREAMS.inc(outcome='opened')
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': f'retry: {RETRY_MS}\n\n'.encode(), 'more_body': True})
+        last_sent = 0
+        if last_event_id is not None:
+            for event in await sync_to_async(backend.replay)(user.pk, last_event_id):
+                await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+                last_sent = event.id
+
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        next_event = None
+        try:
+            while not disconnected.done():
+                if next_event is None:
+                    next_event = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, timeout=settings.NOTIFICATIONS_HEARTBEAT_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if next_event in done:
+                    event = next_event.result()
+                    next_event = None
+                    # Replay and the live queue can overlap
+                    if event.id > last_sent:
+                        await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+                        last_sent = event.id
+                elif not done:
+                    await send({'type': 'http.response.body', 'body': b': heartbeat\n\n', 'more_body': True})
+        finally:
+            disconnected.cancel()
+            if next_event is not None:
+                next_event.cancel()
+    except OSError:
+        # The client went away mid-write
+        pass
+    finally:
+        notifications.hub.unsubscribe(subscription)
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def route(django_application):
+    """Serve STREAM_PATH from ``stream`` and everything else from Django"""
+    async def application(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+            await stream(scope, receive, send)
+        else:
+            await django_application(scope, receive, send)
+    return application
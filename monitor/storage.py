@@ -0,0 +1,84 @@
+"""
+Content-addressed storage for uploaded KML files.
+
+Uploads are hashed (SHA-256) while they are streamed to disk and stored once
+under ``kml_files/sha256/<ab>/<digest><ext>``; saving identical content again
+returns the existing name without writing anything. Reference counts live in
+``monitor.kml_blobs``.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+PREFIX = 'kml_files/sha256'
+_BLOB_NAME_RE = re.compile(r'^kml_files/sha256/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.\w+)?$')
+_CHUNK_SIZE = 64 * 1024
+
+
+def sha256_of(content):
+    """Hash a Django File/UploadedFile in chunks and rewind it"""
+    hasher = hashlib.sha256()
+    for chunk in content.chunks(_CHUNK_SIZE):
+        hasher.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def blob_name(digest, ext=''):
+    return f'{PREFIX}/{digest[:2]}/{digest}{ext}'
+
+
+def digest_from_name(name):
+    """The digest of a content-addressed name, or None for legacy uploads"""
+    match = _BLOB_NAME_RE.match(name or '')
+    return match.group('digest') if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save, so never suffix them
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        # SignupView hashes uploads up front; reuse that digest if present
+        digest = getattr(content, 'sha256', None)
+        if digest and self.exists(blob_name(digest, ext)):
+            return blob_name(digest, ext)
+
+        tmp_dir = self.path(PREFIX)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        hasher = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                for chunk in content.chunks(_CHUNK_SIZE):
+                    if not isinstance(chunk, bytes):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    fh.write(chunk)
+            name = blob_name(hasher.hexdigest(), ext)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(tmp_path, full_path)  # atomic: readers never see partial blobs
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+kml_storage = ContentAddressedStorage()
+
+
+def get_kml_storage():
+    return kml_storage
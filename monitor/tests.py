@@ -1,3 +1,1718 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+import msgpack
+import numpy as np
+
+from . import (
+    analytics, authentication, caching, changes, clusters, field_stats, geocoder, locate, log, metrics, notifications, polyline,
+    profiling, ratelimit, renderers, replicas, review_queue, search, signups, sse, tiling, timeseries,
+)
+from .admin import FieldSubmissionAdmin
+from .benchmarks import synthetic_polygon
+from .geometry import points_in_polygon, polygon_area_hectares
+from .kml import KmlParserMixin
+from .models import (
+    FieldChange, FieldStatistics, FieldStatsRun, FieldSubmission, FieldSummary, KmlBlob, RateLimitBucket, SignupJob, TimeSeriesChunk,
+    User,
+)
+from .serializers import BulkFieldSubmissionSerializer, FieldSubmissionSerializer
+from .storage import ContentAddressedStorage
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.override = override_settings(METRICS_DIR=self.metrics_dir)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+
+    def test_server_timing_header(self):
+        response = self.client.get('/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('app;dur=', response['Server-Timing'])
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_metrics_endpoint_merges_worker_files(self):
+        self.client.get('/health/')
+        other_worker = {
+            'http_requests_total': [[['health_check', 'GET', '200'], 5]],
+        }
+        with open(os.path.join(self.metrics_dir, '999999.json'), 'w') as fh:
+            json.dump(other_worker, fh)
+
+        merged = metrics.REGISTRY.collect()['http_requests_total']
+        own = metrics.REQUESTS._values[('health_check', 'GET', '200')]
+        self.assertEqual(merged[('health_check', 'GET', '200')], own + 5)
+
+        self.client.force_login(User.objects.create_superuser(username='ops', password='x-Secret-123'))
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="health_check",le="+Inf"}', body)
+
+    def test_metrics_endpoint_needs_staff_or_the_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        self.client.force_login(User.objects.create_user(username='farmer', password='x-Secret-123'))
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        self.client.logout()
+        with override_settings(METRICS_TOKEN='scrape-me'):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_latency', 'Test.', buckets=(0.1, 1.0), registry=metrics.Registry())
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        lines = histogram.expose({}, histogram.dump()[0][1])
+        self.assertEqual(lines[:3], [
+            'test_latency_bucket{le="0.1"} 1',
+            'test_latency_bucket{le="1.0"} 2',
+            'test_latency_bucket{le="+Inf"} 3',
+        ])
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    def make_record(self, msg, *args, **extra):
+        record = logging.LogRecord('monitor.views', logging.WARNING, __file__, 1, msg, args, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_async_handler_writes_json_with_request_id(self):
+        stream = io.StringIO()
+        handler = log.AsyncStreamHandler(stream)
+        handler.setFormatter(log.JsonFormatter())
+        token = log.current_request_id.set('abc123')
+        try:
+            handler.handle(self.make_record('parsed %d points', 42, event='kml.parsed'))
+        finally:
+            log.current_request_id.reset(token)
+        handler.flush()
+
+        payload = json.loads(stream.getvalue())
+        self.assertEqual(payload['message'], 'parsed 42 points')
+        self.assertEqual(payload['request_id'], 'abc123')
+        self.assertEqual(payload['event'], 'kml.parsed')
+
+    def test_rate_limit_filter_reports_suppressed_count(self):
+        limiter = log.RateLimitFilter(rate=2, period=60)
+        results = [limiter.filter(self.make_record('bad', event='kml.invalid')) for _ in range(5)]
+        self.assertEqual(results, [True, True, False, False, False])
+
+        limiter._windows['kml.invalid'] = (0, 2, 3)  # window long expired
+        record = self.make_record('bad', event='kml.invalid')
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.suppressed, 3)
+
+    def test_invalid_coordinates_logged_once_per_block(self):
+        coords_text = '10,20,0 ' + ' '.join(['999,999,0'] * 50) + ' abc,def'
+        with self.assertLogs('monitor.kml', level='WARNING') as captured:
+            coordinates = KmlParserMixin().parse_coordinates_text(coords_text)
+        self.assertEqual(coordinates, [{'lat': 20.0, 'lng': 10.0}])
+        self.assertEqual(len(captured.records), 1)
+        self.assertIn('50 out-of-range and 1 unparseable', captured.records[0].getMessage())
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._local_cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='x-Secret-123', email='f@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def get_profile(self):
+        return self.client.get('/api/v1/user/profile/', **self.auth)
+
+    def test_cached_user_skips_user_query(self):
+        request = RequestFactory().get('/', **self.auth)
+        backend = authentication.CachedJWTAuthentication()
+        self.assertEqual(backend.authenticate(request)[0], self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.authenticate(request)[0], self.user)
+
+    def test_each_request_gets_its_own_user_and_no_password_is_cached(self):
+        request = RequestFactory().get('/', **self.auth)
+        backend = authentication.CachedJWTAuthentication()
+        first = backend.authenticate(request)[0]
+        first.is_staff = True
+        second = backend.authenticate(request)[0]
+        self.assertIsNot(first, second)
+        self.assertFalse(second.is_staff)
+        self.assertNotIn(self.user.password, repr(cache.get(authentication._shared_key(self.user.pk))))
+        self.assertTrue(second.check_password('x-Secret-123'))  # loaded on demand
+
+    def test_deactivation_via_save_rejects_immediately(self):
+        self.get_profile()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_profile().status_code, 401)
+
+    def test_deactivation_without_signals_rejected_within_ttl(self):
+        with mock.patch.object(authentication, '_now', return_value=1000.0):
+            self.get_profile()
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            self.assertEqual(self.get_profile().status_code, 200)  # still cached
+
+        expired = 1000.0 + max(authentication.settings.AUTH_USER_CACHE_TTL,
+                               authentication.settings.AUTH_USER_CACHE_LOCAL_TTL)
+        with mock.patch.object(authentication, '_now', return_value=expired):
+            self.assertEqual(self.get_profile().status_code, 401)
+
+    def test_local_entry_expires_after_local_ttl(self):
+        with mock.patch.object(authentication, '_now', return_value=1000.0):
+            self.get_profile()
+        # Another worker deactivated the user: the shared entry is gone, ours is stale
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.clear()
+        later = 1000.0 + authentication.settings.AUTH_USER_CACHE_LOCAL_TTL
+        with mock.patch.object(authentication, '_now', return_value=later):
+            self.assertEqual(self.get_profile().status_code, 401)
+
+
+class BootCommandTests(TestCase):
+    def test_second_boot_skips_completed_steps(self):
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            first = io.StringIO()
+            call_command('boot', '--no-exec', stdout=first)
+            self.assertIn('collectstatic  collected', first.getvalue())
+            self.assertIn('migrate        skipped', first.getvalue())
+
+            second = io.StringIO()
+            call_command('boot', '--no-exec', stdout=second)
+            output = second.getvalue()
+        self.assertIn('create_admin   skipped', output)
+        self.assertIn('collectstatic  skipped', output)
+        self.assertIn('boot: ready in', output)
+
+
+def create_field(user, **overrides):
+    data = {
+        'user': user, 'first_name': 'Ada', 'last_name': 'Farmer', 'email': 'ada@example.com',
+        'phone': '123', 'city': 'Lahore', 'country': 'PK', 'zip_code': '54000',
+        'field_name': 'North', 'crop_name': 'Wheat', 'plantation_date': '2024-11-01',
+        'lat': 31.5, 'lng': 74.3,
+        'polygon': [{'lat': 31.5, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.4}],
+    }
+    data.update(overrides)
+    return FieldSubmission.objects.create(**data)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='grower', password='x-Secret-123')
+        self.admin = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.field = create_field(self.user)
+        self.field.approve(self.admin)
+
+    def get_fields(self):
+        return self.client.get('/api/v1/fields/', **self.auth).json()
+
+    def test_repeat_request_is_served_from_cache(self):
+        self.get_fields()
+        hits = caching.CACHE_REQUESTS._values.get(('user_fields', 'hit'), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.get_fields()), 1)
+        self.assertEqual(caching.CACHE_REQUESTS._values[('user_fields', 'hit')], hits + 1)
+
+    def test_field_save_bumps_version(self):
+        self.get_fields()
+        create_field(self.user, field_name='South').approve(self.admin)
+        self.assertEqual(len(self.get_fields()), 2)
+
+    def test_admin_unapprove_update_bumps_version(self):
+        self.assertEqual(len(self.get_fields()), 1)
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        model_admin = FieldSubmissionAdmin(FieldSubmission, admin.site)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.unapprove_fields(request, FieldSubmission.objects.filter(pk=self.field.pk))
+        self.assertEqual(self.get_fields(), [])
+
+    def test_disabled_without_a_shared_cache(self):
+        self.get_fields()
+        with override_settings(RESPONSE_CACHE_ENABLED=False), self.assertNumQueries(1):
+            self.get_fields()
+
+
+class ReviewQueueTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='x-Secret-123')
+        self.alice = User.objects.create_superuser(username='alice', password='x-Secret-123')
+        self.bob = User.objects.create_superuser(username='bob', password='x-Secret-123')
+        self.fields = [create_field(self.owner, field_name=f'F{i}') for i in range(5)]
+
+    def test_reviewers_claim_disjoint_batches(self):
+        alice_batch = review_queue.claim_batch(self.alice, size=3)
+        bob_batch = review_queue.claim_batch(self.bob, size=3)
+        self.assertEqual(len(alice_batch), 3)
+        self.assertEqual(len(bob_batch), 2)
+        self.assertFalse({f.id for f in alice_batch} & {f.id for f in bob_batch})
+
+    def test_expired_claims_are_reclaimable(self):
+        review_queue.claim_batch(self.alice, size=5, lease=timedelta(seconds=-1))
+        self.assertEqual(len(review_queue.claim_batch(self.bob, size=5)), 5)
+
+    def test_approve_respects_other_claims(self):
+        field = review_queue.claim_batch(self.alice, size=1)[0]
+        self.assertIsNone(review_queue.approve_claimed(self.bob, field.id))
+        self.assertIsNotNone(review_queue.approve_claimed(self.alice, field.id))
+        self.assertIsNone(review_queue.approve_claimed(self.alice, field.id))  # no re-approval
+
+    def test_stats_and_api(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.alice)}'}
+        response = self.client.post('/api/v1/review/claim/', {'size': 2}, **auth)
+        self.assertEqual(len(response.json()['fields']), 2)
+        stats = self.client.get('/api/v1/review/queue/', **auth).json()
+        self.assertEqual((stats['pending'], stats['claimed']), (5, 2))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_claim_view_redirects_to_my_claims(self):
+        self.client.force_login(self.alice)
+        response = self.client.get('/admin/monitor/fieldsubmission/review-queue/', follow=True)
+        self.assertContains(response, 'Claimed 5 pending fields')
+        self.assertContains(response, '5 pending, 5 claimed')
+
+    def test_pending_index_used_for_depth(self):
+        connection = connections['default']
+        with connection.cursor() as cursor:
+            sql, params = review_queue.pending().order_by('created_at').values('created_at')[:1].query.sql_with_params()
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('fieldsub_pending_idx', plan)
+
+
+class FastRenderingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='renderer', password='x-Secret-123')
+        self.admin = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.field = create_field(self.user, field_name='Line\u2028break')
+
+    def test_rendered_json_matches_serializer(self):
+        self.field.refresh_from_db()
+        expected = FieldSubmissionSerializer(self.field).data
+        self.assertEqual(json.loads(bytes(self.field.rendered_json)), expected)
+        self.assertIn(b'\\u2028', bytes(self.field.rendered_json))
+
+    def test_stdlib_fallback_matches_orjson(self):
+        data = {'a': [1.5, 'x\u2029'], 'b': None}
+        with mock.patch.object(renderers, 'orjson', None):
+            fallback = renderers.FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(fallback), json.loads(renderers.FastJSONRenderer().render(data)))
+
+    def test_list_endpoint_splices_fragments(self):
+        self.field.approve(self.admin)
+        FieldSubmission.objects.filter(pk=self.field.pk).update(rendered_json=None)  # legacy row
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = self.client.get('/api/v1/fields/', **auth)
+        self.field.refresh_from_db()
+        self.assertEqual(response.json(), [FieldSubmissionSerializer(self.field).data])
+        self.assertIsNotNone(self.field.rendered_json)
+
+    def test_unapprove_refreshes_payload(self):
+        self.field.approve(self.admin)
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        model_admin = FieldSubmissionAdmin(FieldSubmission, admin.site)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.unapprove_fields(request, FieldSubmission.objects.filter(is_approved=True))
+        self.field.refresh_from_db()
+        self.assertFalse(json.loads(bytes(self.field.rendered_json))['is_approved'])
+
+
+class PolylineTransportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='mobile', password='x-Secret-123')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.polygon = [
+            {'lat': 38.5, 'lng': -120.2}, {'lat': 40.7, 'lng': -120.95}, {'lat': 43.252, 'lng': -126.453},
+        ]
+
+    def test_known_encoding_and_round_trip(self):
+        encoded = polyline.encode(self.polygon[:1])
+        # 38500000 -> zigzag 77000000, -120200000 -> zigzag 240399999
+        self.assertEqual(encoded, bytes.fromhex("c0dadb24ffecd072"))
+        self.assertEqual(polyline.decode(polyline.encode(self.polygon)), self.polygon)
+        self.assertEqual(polyline.decode_b64(polyline.encode_b64(self.polygon)), self.polygon)
+
+    def test_malformed_input_rejected(self):
+        with self.assertRaises(ValueError):
+            polyline.decode(b'\x80')
+        with self.assertRaises(ValueError):
+            polyline.decode(b'\x01')  # a lat without its lng
+
+    def test_read_endpoint_negotiates_polyline(self):
+        admin_user = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        create_field(self.user, polygon=self.polygon).approve(admin_user)
+
+        response = self.client.get('/api/v1/fields/', HTTP_ACCEPT='application/vnd.cropmonitor.polyline+msgpack', **self.auth)
+        self.assertEqual(response['Content-Type'], 'application/vnd.cropmonitor.polyline+msgpack')
+        fields = msgpack.unpackb(response.content)
+        self.assertEqual(polyline.decode(fields[0]['polygon']), self.polygon)
+
+        response = self.client.get('/api/v1/fields/', HTTP_ACCEPT='application/msgpack', **self.auth)
+        self.assertEqual(msgpack.unpackb(response.content)[0]['polygon'], self.polygon)
+        self.assertEqual(self.client.get('/api/v1/fields/', **self.auth)['Content-Type'], 'application/json')
+
+    def test_field_submission_accepts_polyline_input(self):
+        payload = {
+            'first_name': 'Ada', 'last_name': 'Farmer', 'email': 'ada@example.com', 'phone': '1',
+            'city': 'Sacramento', 'country': 'US', 'zip_code': '95814', 'field_name': 'Packed',
+            'crop_name': 'Rice', 'plantation_date': '2024-05-01', 'lat': 38.5, 'lng': -120.2,
+            'polygon': polyline.encode(self.polygon),
+        }
+        response = self.client.post(
+            '/api/v1/fields/add/', msgpack.packb(payload, use_bin_type=True),
+            content_type='application/msgpack', **self.auth,
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(FieldSubmission.objects.get(pk=response.json()['field_id']).polygon, self.polygon)
+
+        payload.pop('polygon')
+        payload['polygon_polyline'] = polyline.encode_b64(self.polygon)
+        response = self.client.post('/api/v1/fields/add/', payload, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 201, response.content)
+
+        response = self.client.post('/api/v1/fields/add/', payload, **self.auth)  # multipart form
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(FieldSubmission.objects.get(pk=response.json()['field_id']).polygon, self.polygon)
+
+
+KML_DOCUMENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2"><Placemark><Polygon><outerBoundaryIs><LinearRing>
+<coordinates>74.30,31.50,0 74.31,31.50,0 74.31,31.51,0 74.30,31.50,0</coordinates>
+</LinearRing></outerBoundaryIs></Polygon></Placemark></kml>"""
+
+
+class KmlBlobStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user(username='kml', password='x-Secret-123')
+
+    def tearDown(self):
+        self.override.disable()
+
+    def upload(self, name='field.kml'):
+        return SimpleUploadedFile(name, KML_DOCUMENT, content_type='application/vnd.google-earth.kml+xml')
+
+    def test_identical_uploads_share_one_blob(self):
+        first = create_field(self.user, kml_file=self.upload('a.kml'))
+        second = create_field(self.user, kml_file=self.upload('a_copy.kml'))
+        self.assertEqual(first.kml_file.name, second.kml_file.name)
+        self.assertRegex(first.kml_file.name, r'^kml_files/sha256/[0-9a-f]{2}/[0-9a-f]{64}\.kml$')
+        self.assertEqual(KmlBlob.objects.get().refcount, 2)
+
+        path = first.kml_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(KmlBlob.objects.exists())
+
+    def test_upload_racing_collection_keeps_its_file(self):
+        first = create_field(self.user, kml_file=self.upload())
+        path = first.kml_file.path
+        with self.captureOnCommitCallbacks() as pending:
+            first.delete()
+        save = ContentAddressedStorage._save
+
+        def save_then_collect(storage, name, content):
+            stored = save(storage, name, content)  # finds the blob's file still there...
+            while pending:
+                pending.pop()()  # ...just before the last reference's removal collects it
+            return stored
+
+        with mock.patch.object(ContentAddressedStorage, '_save', save_then_collect):
+            second = create_field(self.user, kml_file=self.upload())
+        self.assertEqual(second.kml_file.path, path)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(KmlBlob.objects.get().refcount, 1)
+
+    @override_settings(SIGNUP_PROCESSING_THREADS=0)
+    def test_signup_reuses_parsed_geometry(self):
+        def signup(username):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post('/api/v1/signup/', {
+                    'username': username, 'email': f'{username}@example.com', 'password': 'x-Secret-123',
+                    'first_name': 'Ada', 'last_name': 'Farmer', 'phone': '1', 'city': 'Lahore',
+                    'country': 'PK', 'zip_code': '54000', 'field_name': 'North', 'crop_name': 'Wheat',
+                    'plantation_date': '2024-11-01', 'lat': 31.5, 'lng': 74.3, 'kml_file': self.upload(),
+                })
+
+        self.assertEqual(signup('first').status_code, 202)
+        self.assertEqual(len(KmlBlob.objects.get().polygon), 4)
+        with mock.patch.object(signups.GeometryExtractor, 'parse_kml_file') as parse:
+            response = signup('second')
+        self.assertEqual(response.status_code, 202)
+        parse.assert_not_called()
+        field = SignupJob.objects.get(pk=response.json()['processing_id']).field
+        self.assertEqual(len(field.polygon), 4)
+        self.assertEqual(KmlBlob.objects.get().refcount, 2)  # the jobs' own references were released
+
+    def test_download_streams_with_etag(self):
+        field = create_field(self.user, kml_file=self.upload())
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = self.client.get(f'/api/v1/fields/{field.id}/kml/', **auth)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), KML_DOCUMENT)
+        response = self.client.get(f'/api/v1/fields/{field.id}/kml/', HTTP_IF_NONE_MATCH=response['ETag'], **auth)
+        self.assertEqual(response.status_code, 304)
+
+
+class FieldSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='agronomist', password='x-Secret-123')
+        self.admin = User.objects.create_superuser(username='boss', password='x-Secret-123')
+
+    def group(self, dimension, key):
+        return {row['key']: row for row in analytics.summary(dimension)}[key]
+
+    def test_crop_names_are_normalized(self):
+        for name in ('Wheat', '  wheats ', 'WHEAT', 'Whéat'):
+            self.assertEqual(analytics.normalize_crop(name), 'wheat')
+        self.assertEqual(analytics.normalize_crop('Potatoes'), 'potato')
+        self.assertEqual(analytics.normalize_crop('Corn'), 'maize')
+        for name in ('Citrus', 'hibiscus', 'ASPARAGUS', 'Cannabis', 'grass'):
+            self.assertEqual(analytics.normalize_crop(name), name.lower())
+        self.assertEqual(analytics.normalize_crop('Oats'), 'oat')
+
+    def test_summaries_follow_save_approve_unapprove_delete(self):
+        first = create_field(self.user, crop_name='Wheat')
+        second = create_field(self.user, crop_name=' wheats', country='in', plantation_date='2024-12-03')
+        self.assertEqual(self.group('crop', 'wheat')['field_count'], 2)
+        self.assertEqual(self.group('country', 'IN')['field_count'], 1)
+        self.assertEqual(self.group('month', '2024-12')['field_count'], 1)
+
+        first.approve(self.admin)
+        second.approve(self.admin)
+        self.assertEqual(self.group('crop', 'wheat')['approval_rate'], 1.0)
+
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        model_admin = FieldSubmissionAdmin(FieldSubmission, admin.site)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.unapprove_fields(request, FieldSubmission.objects.filter(pk=first.pk))
+        self.assertEqual(self.group('crop', 'wheat')['approved_count'], 1)
+
+        second.delete()
+        wheat = self.group('crop', 'wheat')
+        self.assertEqual((wheat['field_count'], wheat['approved_count']), (1, 0))
+        self.assertAlmostEqual(wheat['total_hectares'], polygon_area_hectares(first.polygon), places=3)
+
+    def test_rebuild_matches_incremental_totals(self):
+        create_field(self.user, crop_name='Rice').approve(self.admin)
+        create_field(self.user, crop_name='Paddy')
+        incremental = {(r.dimension, r.key): (r.field_count, r.approved_count) for r in FieldSummary.objects.all()}
+        FieldSummary.objects.all().delete()
+        call_command('rebuild_field_summaries', stdout=io.StringIO())
+        rebuilt = {(r.dimension, r.key): (r.field_count, r.approved_count) for r in FieldSummary.objects.all()}
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(rebuilt[('crop', 'rice')], (2, 1))
+
+    def test_endpoint_reads_only_summary_table(self):
+        create_field(self.user)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.admin)}'}
+        self.client.get('/api/v1/analytics/summary/?dimension=country', **auth)  # warm auth cache
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/analytics/summary/?dimension=country', **auth)
+        self.assertEqual(response.json()['groups'][0]['key'], 'PK')
+
+
+class FieldLocateTests(TestCase):
+    SQUARE = [{'lat': 31.0, 'lng': 74.0}, {'lat': 31.0, 'lng': 74.2}, {'lat': 31.2, 'lng': 74.2}, {'lat': 31.2, 'lng': 74.0}]
+    INNER = [{'lat': 31.05, 'lng': 74.05}, {'lat': 31.05, 'lng': 74.1}, {'lat': 31.1, 'lng': 74.1}, {'lat': 31.1, 'lng': 74.05}]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='scout', password='x-Secret-123')
+        self.admin = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_bbox_is_stored_on_save(self):
+        field = create_field(self.user, polygon=self.SQUARE)
+        self.assertEqual((field.min_lat, field.min_lng, field.max_lat, field.max_lng), (31.0, 74.0, 31.2, 74.2))
+
+    def test_index_matches_brute_force_ray_casting(self):
+        rng = np.random.default_rng(5)
+        polygons = [
+            polyline.points_to_array(synthetic_polygon(random.Random(i), *rng.uniform((31, 74), (31.2, 74.2)), vertices=vertices))
+            for i, vertices in enumerate([12] * 200 + [400] * 3)  # padded batch plus a few oversized ones
+        ]
+        points = rng.uniform((30.99, 73.99), (31.21, 74.21), size=(5000, 2))
+        found = locate.FieldIndex(range(1, len(polygons) + 1), polygons).locate(points)
+        for i, field_id in enumerate(found):
+            containing = [n for n, coords in enumerate(polygons, 1) if points_in_polygon(points[i:i + 1, 0], points[i:i + 1, 1], coords)[0]]
+            if containing:
+                self.assertIn(field_id, containing)
+            else:
+                self.assertEqual(field_id, 0)
+
+    def test_huge_fields_stay_out_of_the_grid(self):
+        small = [polyline.points_to_array(self.INNER)] * 3
+        # A country-sized slip of the finger next to ordinary fields
+        huge = np.array([(0.0, 60.0), (0.0, 90.0), (40.0, 90.0), (40.0, 60.0)])
+        index = locate.FieldIndex([1, 2, 3, 4], small + [huge])
+        self.assertEqual(index.oversized.tolist(), [3])
+        self.assertLessEqual(len(index.cell_keys), 3 * locate.MAX_CELLS_PER_FIELD)
+        points = np.array([[31.07, 74.07], [10.0, 70.0], [31.07, 95.0]])
+        self.assertEqual(index.locate(points).tolist(), [3, 4, 0])
+
+    def test_endpoint_returns_smallest_approved_field_per_point(self):
+        outer = create_field(self.user, polygon=self.SQUARE)
+        inner = create_field(self.user, polygon=self.INNER)
+        pending = create_field(self.user, polygon=self.SQUARE)
+        outer.approve(self.admin)
+        inner.approve(self.admin)
+        points = [[31.15, 74.15], [31.07, 74.07], [35.0, 70.0]]
+        response = self.client.post('/api/v1/fields/locate/', {'points': points}, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['field_ids'], [outer.id, inner.id, None])
+        self.assertNotIn(pending.id, response.json()['field_ids'])
+
+        encoded = polyline.encode_b64([{'lat': lat, 'lng': lng} for lat, lng in points])
+        response = self.client.post('/api/v1/fields/locate/', {'points_polyline': encoded}, content_type='application/json', **self.auth)
+        self.assertEqual(response.json()['field_ids'], [outer.id, inner.id, None])
+
+    def test_endpoint_only_searches_own_fields_and_validates_input(self):
+        other = User.objects.create_user(username='neighbour', password='x-Secret-123')
+        create_field(other, polygon=self.SQUARE).approve(self.admin)
+        response = self.client.post('/api/v1/fields/locate/', {'points': [[31.1, 74.1]]}, content_type='application/json', **self.auth)
+        self.assertEqual(response.json()['field_ids'], [None])
+
+        response = self.client.post('/api/v1/fields/locate/', {'points': [[91, 74.1]]}, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        with override_settings(LOCATE_MAX_POINTS=1):
+            response = self.client.post('/api/v1/fields/locate/', {'points': [[31, 74]] * 2}, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class GeocoderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='x-Secret-123')
+
+    def field_data(self, **overrides):
+        data = {
+            'user': self.user.id, 'first_name': 'Ada', 'last_name': 'Farmer', 'email': 'ada@example.com',
+            'phone': '123', 'zip_code': '54000', 'field_name': 'North', 'crop_name': 'Wheat',
+            'plantation_date': '2024-11-01', 'lat': 31.45, 'lng': 74.2,
+        }
+        data.update(overrides)
+        return data
+
+    def test_dataset_is_memory_mapped_kd_tree(self):
+        self.assertIsInstance(geocoder.dataset(), np.memmap)
+        for lat, lng in ((31.45, 74.2), (25.4, 68.4), (-33.9, 151.1), (51.0, 0.1)):
+            xyz = np.asarray(geocoder.dataset()['xyz'], dtype=np.float64)
+            brute = np.argmin(((xyz - geocoder.unit_vectors(lat, lng)) ** 2).sum(axis=1))
+            self.assertEqual(geocoder.nearest(lat, lng)[0].name, geocoder.dataset()['name'][brute].decode())
+        self.assertEqual(geocoder.nearest(31.45, 74.2)[0][:2], ('Lahore', 'PK'))
+
+    def test_country_codes_from_free_text(self):
+        for value in ('PK', 'pk', 'Pakistan', ' pakistan ', 'PAK'):
+            self.assertEqual(geocoder.country_code(value), 'PK')
+        self.assertEqual(geocoder.country_code('UAE'), 'AE')
+        self.assertIsNone(geocoder.country_code('Atlantis'))
+
+    def test_serializer_autofills_blank_city_and_country(self):
+        serializer = FieldSubmissionSerializer(data=self.field_data())
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        field = serializer.save()
+        self.assertEqual((field.city, field.country, field.location_warning), ('Lahore', 'PK', ''))
+
+        far_away = FieldSubmissionSerializer(data=self.field_data(lat=0.0, lng=-140.0))
+        self.assertFalse(far_away.is_valid())
+        self.assertIn('country', far_away.errors)
+
+    def test_contradictions_are_flagged_not_rejected(self):
+        serializer = FieldSubmissionSerializer(data=self.field_data(city='Karachi', country='India'))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        warning = serializer.save().location_warning
+        self.assertIn('not India', warning)
+        self.assertIn('Karachi is', warning)
+
+        near_border = FieldSubmissionSerializer(data=self.field_data(lat=31.6, lng=74.6, city='Amritsar', country='IN'))
+        self.assertTrue(near_border.is_valid(), near_border.errors)
+        self.assertEqual(near_border.validated_data['location_warning'], '')
+
+    def test_backfill_command_fills_and_flags_existing_rows(self):
+        blank = create_field(self.user, city='', country='')
+        wrong = create_field(self.user, country='BD')
+        call_command('geocode_fields', '--dry-run', stdout=io.StringIO())
+        blank.refresh_from_db()
+        self.assertEqual(blank.city, '')
+
+        out = io.StringIO()
+        call_command('geocode_fields', stdout=out)
+        blank.refresh_from_db()
+        wrong.refresh_from_db()
+        self.assertEqual((blank.city, blank.country), ('Lahore', 'PK'))
+        self.assertIn('not Bangladesh', wrong.location_warning)
+        self.assertIn('1 flagged, updated 2', out.getvalue())
+
+
+class BulkFieldSubmissionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user(username='estate', password='x-Secret-123')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def tearDown(self):
+        self.override.disable()
+
+    def item(self, **overrides):
+        data = {
+            'first_name': 'Ada', 'last_name': 'Farmer', 'email': 'ada@example.com', 'phone': '123',
+            'city': 'Lahore', 'country': 'PK', 'zip_code': '54000', 'field_name': 'Parcel',
+            'crop_name': 'Wheat', 'plantation_date': '2024-11-01', 'lat': 31.5, 'lng': 74.3,
+            'polygon': [{'lat': 31.5, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.4}],
+        }
+        data.update(overrides)
+        return data
+
+    def post(self, items):
+        return self.client.post('/api/v1/fields/bulk/', {'fields': items}, content_type='application/json', **self.auth)
+
+    def test_partial_failure_creates_valid_items_and_reports_the_rest(self):
+        other = User.objects.create_user(username='intruder', password='x-Secret-123')
+        items = [
+            self.item(field_name='A', user=other.id),
+            self.item(lat=123),
+            self.item(field_name='B', polygon=None, kml=KML_DOCUMENT.decode()),
+            self.item(polygon=None),
+            self.item(field_name='C', polygon=None, kml=KML_DOCUMENT.decode()),
+        ]
+        response = self.post(items)
+        self.assertEqual(response.status_code, 207, response.content)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (3, 2))
+        self.assertEqual([r['status'] for r in body['results']], ['created', 'invalid', 'created', 'invalid', 'created'])
+        self.assertIn('lat', body['results'][1]['errors'])
+        self.assertIn('polygon', body['results'][3]['errors'])
+
+        fields = FieldSubmission.objects.filter(user=self.user).order_by('field_name')
+        self.assertEqual([f.field_name for f in fields], ['A', 'B', 'C'])
+        self.assertFalse(FieldSubmission.objects.filter(user=other).exists())
+        for field in fields:
+            # Work normally done by save() and post_save receivers
+            self.assertEqual(bytes(field.rendered_json), renderers.render_field(field))
+            self.assertIsNotNone(field.area_hectares)
+            self.assertIsNotNone(field.min_lat)
+        self.assertEqual(FieldSummary.objects.get(dimension='crop', key='wheat').field_count, 3)
+        self.assertEqual(fields[1].kml_file.name, fields[2].kml_file.name)
+        self.assertEqual(KmlBlob.objects.get().refcount, 2)
+        self.assertEqual(KmlBlob.objects.get().polygon, fields[1].polygon)
+
+    def test_limits_reject_the_whole_request(self):
+        with override_settings(BULK_FIELDS_MAX_ITEMS=2):
+            self.assertEqual(self.post([self.item()] * 3).status_code, 400)
+        with override_settings(BULK_FIELDS_MAX_VERTICES=5), \
+                mock.patch.object(BulkFieldSubmissionSerializer, 'run_validation', autospec=True,
+                                  side_effect=BulkFieldSubmissionSerializer.run_validation) as validate:
+            self.assertEqual(self.post([self.item()] * 10).status_code, 400)
+        self.assertEqual(validate.call_count, 1)  # rejected before validating the second item
+        with override_settings(BULK_FIELDS_MAX_KML_BYTES=10), mock.patch.object(KmlParserMixin, 'parse_kml_file') as parse:
+            response = self.post([self.item(polygon=None, kml=KML_DOCUMENT.decode())])
+        self.assertIn('kml', response.json()['results'][0]['errors'])
+        parse.assert_not_called()
+        self.assertEqual(self.post([self.item(lat='north')]).status_code, 400)
+        self.assertFalse(FieldSubmission.objects.exists())
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_bulk_create_invalidates_cached_responses(self):
+        status_url = '/api/v1/user/approval-status/'
+        self.assertEqual(self.client.get(status_url, **self.auth).json()['summary']['pending_fields'], 0)
+        self.assertEqual(self.post([self.item(), self.item()]).status_code, 201)
+        self.assertEqual(self.client.get(status_url, **self.auth).json()['summary']['pending_fields'], 2)
+
+
+@override_settings(RATE_LIMITS={
+    'sentinel_token': {'user': (0.5, 2), 'global': (1.0, 3)},
+    'signup': {'user': (0.1, 1), 'global': (1.0, 10)},
+})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        self.clock = 1000.0
+        patcher = mock.patch.object(ratelimit, '_now', lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_refills_at_rate_up_to_burst(self):
+        self.assertEqual([ratelimit.take('t', rate=0.5, burst=2) for _ in range(2)], [0.0, 0.0])
+        self.assertAlmostEqual(ratelimit.take('t', rate=0.5, burst=2), 2.0)
+        self.clock += 1
+        self.assertAlmostEqual(ratelimit.take('t', rate=0.5, burst=2), 1.0)
+        self.clock += 1
+        self.assertEqual(ratelimit.take('t', rate=0.5, burst=2), 0.0)
+        self.clock += 3600  # idle: refills to burst, not beyond
+        self.assertEqual([ratelimit.take('t', rate=0.5, burst=2) for _ in range(2)], [0.0, 0.0])
+        self.assertGreater(ratelimit.take('t', rate=0.5, burst=2), 0)
+
+    @mock.patch('monitor.views.requests.post')
+    def test_sentinel_token_per_user_and_global_buckets(self, post):
+        post.return_value = mock.Mock(status_code=200, json=lambda: {'access_token': 'abc', 'expires_in': 3600})
+        users = [User.objects.create_user(username=f'viewer{i}', password='x-Secret-123') for i in range(2)]
+
+        def fetch(user):
+            return self.client.post('/api/v1/sentinel/token/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        throttled_before = metrics.REGISTRY.collect().get('rate_limited_requests_total', {})
+        self.assertEqual([fetch(users[0]).status_code for _ in range(2)], [200, 200])
+        response = fetch(users[0])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(post.call_count, 2)
+
+        # The second user has their own bucket but shares the global one (3 tokens)
+        self.assertEqual([fetch(users[1]).status_code for _ in range(2)], [200, 429])
+        self.clock += 2
+        self.assertEqual(fetch(users[0]).status_code, 200)
+
+        throttled = metrics.REGISTRY.collect()['rate_limited_requests_total']
+        self.assertEqual(throttled[('sentinel_token', 'user')] - throttled_before.get(('sentinel_token', 'user'), 0), 1)
+        self.assertEqual(throttled[('sentinel_token', 'global')] - throttled_before.get(('sentinel_token', 'global'), 0), 1)
+        # The user bucket that admitted the globally throttled request was refunded
+        tokens = RateLimitBucket.objects.get(key=f'sentinel_token:user:user-{users[1].pk}').tokens
+        self.assertAlmostEqual(tokens, 1.0)
+
+    def test_signup_is_limited_per_client_ip(self):
+        def signup(username, ip):
+            return self.client.post('/api/v1/signup/', {'username': username}, REMOTE_ADDR=ip)
+
+        self.assertEqual(signup('a', '10.0.0.1').status_code, 400)  # invalid, but admitted
+        self.assertEqual(signup('b', '10.0.0.1').status_code, 429)
+        self.assertEqual(signup('c', '10.0.0.2').status_code, 400)
+
+
+class StandInStatsAPI(ThreadingHTTPServer):
+    """Local stand-in for the statistics API, recording what it was asked"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInStatsHandler)
+        self.requests = []
+        self.transient_failures = 0
+        self.failing_ids = set()
+        self.omitted_ids = set()  # answered without
+        self.extra_results = {}  # answered with, whatever was asked
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/statistics'
+
+
+class StandInStatsHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        ids = [feature['id'] for feature in body['fields']['features']]
+        with self.server.lock:
+            self.server.requests.append(ids)
+            transient = self.server.transient_failures > 0
+            self.server.transient_failures -= transient
+        if transient or self.server.failing_ids & set(ids):
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        results = {str(pk): {'ndvi_mean': pk / 100} for pk in ids if pk not in self.server.omitted_ids}
+        results.update(self.server.extra_results)
+        payload = json.dumps({'results': results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FieldStatsJobTests(TestCase):
+    def setUp(self):
+        self.api = StandInStatsAPI()
+        threading.Thread(target=self.api.serve_forever, daemon=True).start()
+        self.addCleanup(self.api.server_close)
+        self.addCleanup(self.api.shutdown)
+        self.override = override_settings(FIELD_STATS_URL=self.api.url, FIELD_STATS_PAGE_SIZE=2, FIELD_STATS_MAX_ATTEMPTS=3)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.sleeps = []
+        patcher = mock.patch.object(field_stats, '_sleep', self.sleeps.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user(username='grower', password='x-Secret-123')
+        admin_user = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.fields = []
+        # Two pairs of neighbouring fields (Lahore, Karachi) and one loner (Quetta)
+        for lat, lng in ((31.50, 74.30), (24.86, 67.00), (31.52, 74.31), (24.87, 67.02), (30.18, 66.97)):
+            field = create_field(user, lat=lat, lng=lng, polygon=[
+                {'lat': lat, 'lng': lng}, {'lat': lat + 0.01, 'lng': lng}, {'lat': lat + 0.01, 'lng': lng + 0.01},
+            ])
+            field.approve(admin_user)
+            self.fields.append(field)
+        create_field(user)  # pending fields are skipped
+
+    def run_job(self, *args):
+        call_command('run_field_stats', '--start', '2024-11-01', '--end', '2024-11-30', *args, stdout=io.StringIO())
+
+    def test_groups_nearby_fields_and_writes_results(self):
+        with override_settings(FIELD_STATS_PAGE_SIZE=10):
+            self.run_job()
+        ids = [f.id for f in self.fields]
+        self.assertEqual(sorted(map(sorted, self.api.requests)), sorted([[ids[0], ids[2]], [ids[1], ids[3]], [ids[4]]]))
+        stats = {s.field_id: s.stats for s in FieldStatistics.objects.all()}
+        self.assertEqual(stats, {pk: {'ndvi_mean': pk / 100} for pk in ids})
+        self.assertIsNotNone(FieldStatsRun.objects.get().finished_at)
+
+    def test_transient_failures_are_retried_with_jittered_backoff(self):
+        self.api.transient_failures = 2
+        with override_settings(FIELD_STATS_CONCURRENCY=1):
+            self.run_job()
+        self.assertEqual(FieldStatistics.objects.count(), 5)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(all(0 <= delay <= 2 * settings.FIELD_STATS_BACKOFF_BASE for delay in self.sleeps))
+
+    def test_interrupted_run_resumes_from_checkpoint_and_rewrites_idempotently(self):
+        self.api.failing_ids = {self.fields[3].id}
+        with self.assertRaises(CommandError):
+            self.run_job()
+        stats_run = FieldStatsRun.objects.get()
+        self.assertEqual(stats_run.last_field_id, self.fields[1].id)  # first page only
+        self.assertIsNone(stats_run.finished_at)
+        self.assertEqual(FieldStatistics.objects.count(), 2)
+
+        self.api.failing_ids = set()
+        self.api.requests.clear()
+        self.run_job()
+        resumed = {pk for ids in self.api.requests for pk in ids}
+        self.assertEqual(resumed, {f.id for f in self.fields[2:]})
+        self.assertEqual(FieldStatsRun.objects.get().fields_done, 5)
+
+        self.run_job('--restart')
+        self.assertEqual(FieldStatistics.objects.count(), 5)
+        self.assertEqual(FieldStatsRun.objects.filter(finished_at__isnull=False).count(), 2)
+
+    def test_unasked_results_are_dropped_and_missing_fields_recorded_and_retried(self):
+        ids = [f.id for f in self.fields]
+        self.api.extra_results = {str(ids[-1] + 1000): {'ndvi_mean': 1}}  # no such field
+        self.api.omitted_ids = {ids[1]}
+        self.run_job()
+        stats_run = FieldStatsRun.objects.get()
+        self.assertEqual(stats_run.failed_field_ids, [ids[1]])
+        self.assertEqual(stats_run.fields_done, 4)
+        stats = {s.field_id: s.stats for s in FieldStatistics.objects.all()}
+        self.assertEqual(stats, {pk: {'ndvi_mean': pk / 100} for pk in ids if pk != ids[1]})
+        # Asked again once the pass was over, and the run stays open for a rerun
+        self.assertEqual(sum(ids[1] in asked for asked in self.api.requests), 2)
+        self.assertIsNone(stats_run.finished_at)
+
+        self.api.omitted_ids = set()
+        self.api.requests.clear()
+        self.run_job()
+        self.assertEqual(self.api.requests, [[ids[1]]])
+        stats_run = FieldStatsRun.objects.get()
+        self.assertEqual((stats_run.failed_field_ids, stats_run.fields_done), ([], 5))
+        self.assertIsNotNone(stats_run.finished_at)
+        self.assertEqual(FieldStatistics.objects.get(field_id=ids[1]).stats, {'ndvi_mean': ids[1] / 100})
+
+
+@override_settings(TIMESERIES_CHUNK_SIZE=10)
+class TimeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='agronomist', password='x-Secret-123')
+        self.field = create_field(self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def days(self, start, count, step=1):
+        return [date(2024, 1, 1) + timedelta(days=start + i * step) for i in range(count)]
+
+    def test_appends_fill_the_open_chunk_and_round_trip_as_float16(self):
+        values = np.linspace(-0.2, 0.9, 25)
+        timeseries.append(self.field.id, 'ndvi', self.days(0, 7), values[:7])
+        timeseries.append(self.field.id, 'ndvi', self.days(7, 18), values[7:])
+        chunks = list(TimeSeriesChunk.objects.filter(field=self.field))
+        self.assertEqual([c.count for c in chunks], [10, 10, 5])
+        self.assertEqual(len(chunks[0].data), 10 * (2 + 2))
+        days, stored = timeseries.query(self.field.id, 'ndvi')
+        self.assertEqual(timeseries.to_dates(days), [d.isoformat() for d in self.days(0, 25)])
+        np.testing.assert_allclose(stored, values, atol=1e-3)
+
+    def test_range_query_decodes_only_overlapping_chunks_and_backfills_replace(self):
+        timeseries.append(self.field.id, 'ndvi', self.days(0, 40), np.full(40, 0.5), dtype='float32')
+        timeseries.append(self.field.id, 'ndvi', [date(2024, 1, 15)], [0.25], dtype='float32')
+        self.assertEqual(TimeSeriesChunk.objects.filter(field=self.field).count(), 4)
+        with mock.patch.object(timeseries, 'decode_chunk', wraps=timeseries.decode_chunk) as decode:
+            days, values = timeseries.query(self.field.id, 'ndvi', date(2024, 1, 12), date(2024, 1, 18))
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(timeseries.to_dates(days)[0], '2024-01-12')
+        self.assertEqual(values.tolist(), [0.5, 0.5, 0.5, 0.25, 0.5, 0.5, 0.5])
+
+    def test_weekly_and_monthly_rollups_skip_missing_values(self):
+        # 2024-01-01 is a Monday
+        values = [0.1] * 7 + [0.3] * 6 + [np.nan] + [0.5] * 30
+        days = timeseries.to_days(self.days(0, 44))
+        weekly = timeseries.rollup(days, np.array(values), 'weekly')
+        self.assertEqual(weekly['dates'][:2], ['2024-01-01', '2024-01-08'])
+        self.assertEqual(weekly['count'][:2], [7, 6])
+        self.assertEqual(weekly['mean'][:2], [0.1, 0.3])
+        monthly = timeseries.rollup(days, np.array(values), 'monthly')
+        self.assertEqual(monthly['dates'], ['2024-01-01', '2024-02-01'])
+        self.assertEqual(monthly['count'], [30, 13])
+        self.assertEqual((monthly['min'][0], monthly['max'][0]), (0.1, 0.5))
+
+    def test_endpoint_slices_ranges_for_owners_only(self):
+        timeseries.append(self.field.id, 'ndvi', self.days(0, 60, step=2), np.linspace(0, 0.6, 60))
+        url = f'/api/v1/fields/{self.field.id}/timeseries/'
+        response = self.client.get(url, {'from': '2024-01-10', 'to': '2024-01-20'}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['dates'], [d.isoformat() for d in self.days(10, 5, step=2)])
+        response = self.client.get(url, {'rollup': 'monthly', 'index': 'ndvi'}, **self.auth)
+        self.assertEqual(response.json()['count'], [16, 14, 16, 14])
+        self.assertEqual(self.client.get(url, {'rollup': 'daily'}, **self.auth).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': 'yesterday'}, **self.auth).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': '2024-02-30'}, **self.auth).status_code, 400)
+
+        other = User.objects.create_user(username='neighbour', password='x-Secret-123')
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+        self.assertEqual(response.status_code, 404)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """The test database is the primary; a second SQLite file plays a lagging replica"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.tmp.name, 'replica.sqlite3')}
+        connections.settings['replica'] = connections.configure_settings(
+            {'default': connections.settings['default'], 'replica': replica},
+        )['replica']
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        override = override_settings(
+            DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_READS_ENABLED=True,
+            RATE_LIMIT_ENABLED=False, SIGNUP_PROCESSING_THREADS=0,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(replicas._health.clear)
+        self.clock = 1000.0
+        patcher = mock.patch.object(replicas, '_now', lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+        # Replicated so far: the user, but not their field
+        User.objects.using('replica').all().delete()
+        self.user = User.objects.create_user(username='scout', password='x-Secret-123')
+        User.objects.using('replica').bulk_create([User.objects.get(pk=self.user.pk)])
+        create_field(self.user)
+        cache.clear()  # drop the pins those writes set
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def pending_count(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        return self.client.get('/api/v1/user/profile/', **self.auth).json()['pending_fields_count']
+
+    def test_reads_go_to_the_replica_until_the_user_writes(self):
+        self.assertEqual(self.pending_count(), 0)
+        response = self.client.post('/api/v1/fields/add/', {
+            'first_name': 'Ada', 'last_name': 'Farmer', 'email': 'ada@example.com', 'phone': '1',
+            'city': 'Lahore', 'country': 'PK', 'zip_code': '54000', 'field_name': 'South',
+            'crop_name': 'Rice', 'plantation_date': '2024-11-01', 'lat': 31.5, 'lng': 74.3,
+            'polygon': [{'lat': 31.5, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.4}],
+        }, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.pending_count(), 2)  # pinned to the primary
+
+        cache.delete_many([f'db-pin:user-{self.user.pk}', 'db-pin:ip-127.0.0.1'])  # pin expired
+        self.assertEqual(self.pending_count(), 0)
+
+    def test_fresh_signup_can_log_in_and_see_its_field(self):
+        response = self.client.post('/api/v1/signup/', {
+            'username': 'newbie', 'email': 'newbie@example.com', 'password': 'x-Secret-123',
+            'first_name': 'Ada', 'last_name': 'Farmer', 'phone': '1', 'city': 'Lahore', 'country': 'PK',
+            'zip_code': '54000', 'field_name': 'North', 'crop_name': 'Wheat', 'plantation_date': '2024-11-01',
+            'lat': 31.5, 'lng': 74.3,
+        })
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(User.objects.using('replica').filter(username='newbie').exists())
+        token = self.client.post('/api/v1/token/', {'username': 'newbie', 'password': 'x-Secret-123'}).json()['access']
+        profile = self.client.get('/api/v1/user/profile/', HTTP_AUTHORIZATION=f'Bearer {token}').json()
+        self.assertEqual(profile['pending_fields_count'], 1)
+
+    def test_failing_replica_is_ejected_until_it_recovers(self):
+        def ejections():
+            return metrics.REGISTRY.collect().get('db_replica_ejections_total', {}).get(('replica', 'unreachable'), 0)
+
+        before = ejections()
+        with mock.patch.object(replicas, '_probe', return_value='unreachable'):
+            self.assertEqual(self.pending_count(), 1)
+        self.assertEqual(ejections() - before, 1)
+
+        self.assertEqual(self.pending_count(), 1)  # not probed again yet
+        self.clock += settings.DATABASE_REPLICA_HEALTH_INTERVAL
+        self.assertEqual(self.pending_count(), 0)
+
+    def test_work_outside_requests_stays_on_the_primary(self):
+        self.assertEqual(FieldSubmission.objects.count(), 1)
+        router = replicas.ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'monitor'))
+        self.assertIsNone(router.allow_migrate('default', 'monitor'))
+
+    def test_reads_stay_on_the_primary_without_a_shared_cache(self):
+        with override_settings(DATABASE_REPLICA_READS_ENABLED=False):
+            self.assertEqual(self.pending_count(), 1)
+            create_field(self.user)
+            self.assertFalse(cache.has_key(f'db-pin:user-{self.user.pk}'))  # nor pinned
+        self.assertEqual(self.pending_count(), 0)
+
+
+class FieldSearchTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='ahmad', email='ahmad@farms.pk', password='x-Secret-123')
+        self.admin = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.wheat = create_field(self.farmer, field_name='North Block', crop_name='Wheat', city='Multan')
+        self.rice = create_field(self.farmer, field_name='River Plot', crop_name='Basmati Rice', city='Gujranwala')
+        self.other = create_field(self.admin, field_name='Test', crop_name='Cotton', city='Multan', email='x@y.com')
+
+    def found(self, query, queryset=None):
+        return [field.pk for field in search.search(queryset or FieldSubmission.objects.all(), query)]
+
+    def test_prefix_words_must_all_match_and_results_are_ranked(self):
+        self.assertEqual(set(self.found('mult')), {self.wheat.pk, self.other.pk})
+        self.assertEqual(self.found('multan whe'), [self.wheat.pk])
+        self.assertEqual(self.found('ahmad@farms.pk basmati'), [self.rice.pk])
+        self.assertEqual(self.found('!!'), [])
+        create_field(self.farmer, field_name='Rice Rice', crop_name='Rice', city='Lahore')
+        self.assertEqual(self.found('rice')[1], self.rice.pk)  # more mentions rank higher
+
+    def test_index_follows_bulk_writes_updates_deletes_and_renames(self):
+        bulk = FieldSubmission(
+            user=self.farmer, first_name='Ada', last_name='Farmer', email='ada@example.com', phone='1',
+            city='Sukkur', country='PK', zip_code='1', field_name='Date Grove', crop_name='Dates',
+            plantation_date='2024-11-01', lat=27.7, lng=68.8,
+        )
+        bulk.derive_search_document()
+        FieldSubmission.objects.bulk_create([bulk])
+        self.assertEqual(self.found('sukkur'), [bulk.pk])
+
+        FieldSubmission.objects.filter(pk=self.wheat.pk).update(search_document='barley')
+        self.assertEqual(self.found('barl'), [self.wheat.pk])
+        self.rice.delete()
+        self.assertEqual(self.found('basmati'), [])
+
+        self.farmer.username = 'ahmad_khan'
+        self.farmer.save()
+        self.assertEqual(set(self.found('khan')), {self.wheat.pk, bulk.pk})
+
+    def test_missing_triggers_are_reinstalled_and_index_rebuilt(self):
+        connection = connections['default']
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {search.FTS_TABLE}_ai')
+        late = create_field(self.farmer, crop_name='Sugarcane')
+        self.assertEqual(self.found('sugarcane'), [])
+        self.assertTrue(search.install_index(connection))
+        self.assertEqual(self.found('sugarcane'), [late.pk])
+        self.assertFalse(search.install_index(connection))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_api_q_parameter_and_admin_search(self):
+        for field in (self.wheat, self.rice, self.other):
+            field.approve(self.admin)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.farmer)}'}
+        self.assertEqual(len(self.client.get('/api/v1/fields/', **auth).json()), 2)
+        response = self.client.get('/api/v1/fields/', {'q': 'multan'}, **auth)
+        self.assertEqual([field['id'] for field in response.json()], [self.wheat.pk])
+        # Index text (with the owner's email words) stays internal
+        self.assertNotIn('search_document', response.json()[0])
+        self.wheat.refresh_from_db()
+        self.assertNotIn('search_document', json.loads(bytes(self.wheat.rendered_json)))
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/monitor/fieldsubmission/', {'q': 'cotton mult'})
+        self.assertEqual([field.pk for field in response.context['cl'].result_list], [self.other.pk])
+        response = self.client.get('/admin/monitor/user/', {'q': 'gujranwala'})
+        self.assertEqual([user.pk for user in response.context['cl'].result_list], [self.farmer.pk])
+
+
+@override_settings(SIGNUP_PROCESSING_THREADS=0, RATE_LIMIT_ENABLED=False)
+class SignupProcessingTests(TestCase):
+    def signup(self, username='newbie', **extra):
+        data = {
+            'username': username, 'email': f'{username}@example.com', 'password': 'x-Secret-123',
+            'first_name': 'Ada', 'last_name': 'Farmer', 'phone': '1', 'city': 'Lahore', 'country': 'PK',
+            'zip_code': '54000', 'field_name': 'North', 'crop_name': 'Wheat', 'plantation_date': '2024-11-01',
+            'lat': 31.5, 'lng': 74.3, **extra,
+        }
+        return self.client.post('/api/v1/signup/', data, content_type='application/json')
+
+    def status(self, user):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+        return self.client.get('/api/v1/user/approval-status/', **auth).json()
+
+    def test_signup_answers_202_and_reports_processing_until_the_worker_runs(self):
+        with override_settings(SIGNUP_PROCESSING_BACKEND='worker'), self.captureOnCommitCallbacks(execute=True):
+            response = self.signup(polygon=[{'lat': 31.5, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.4}])
+        self.assertEqual(response.status_code, 202)
+        user = User.objects.get(username='newbie')
+        self.assertEqual(self.status(user)['processing'][0]['id'], response.json()['processing_id'])
+        self.assertEqual(self.status(user)['summary']['total_fields'], 0)
+
+        out = io.StringIO()
+        call_command('process_signups', '--once', '--threads', '1', stdout=out)
+        self.assertIn('Processed 1 signup jobs', out.getvalue())
+        status = self.status(user)
+        self.assertEqual((status['processing'], status['summary']['pending_fields']), ([], 1))
+        self.assertEqual(len(FieldSubmission.objects.get(user=user).polygon), 3)
+
+    def test_invalid_field_data_is_rejected_synchronously(self):
+        response = self.signup(lat=120)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('lat', response.json()['details'])
+        self.assertFalse(User.objects.filter(username='newbie').exists())
+
+    def test_failed_attempts_are_retried_and_never_create_two_fields(self):
+        with override_settings(SIGNUP_PROCESSING_BACKEND='worker'):
+            job_id = self.signup().json()['processing_id']
+        with mock.patch.object(signups.extractor, 'polygon', side_effect=OSError('storage unavailable')):
+            signups.run(job_id)
+        job = SignupJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.attempts), (SignupJob.PENDING, 1))
+        self.assertIn('storage unavailable', job.last_error)
+        self.assertIsNone(signups.run(job_id))  # backing off
+
+        SignupJob.objects.filter(pk=job_id).update(available_at=job.created_at)
+        stale = signups.claim(job_id)
+        # The lease runs out and another worker claims the job again
+        SignupJob.objects.filter(pk=job_id).update(available_at=job.created_at)
+        signups.run(job_id)
+        signups.process(stale)  # the first worker finishes late
+        self.assertEqual(FieldSubmission.objects.count(), 1)
+        job = SignupJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.attempts, job.field), (SignupJob.DONE, 3, FieldSubmission.objects.get()))
+
+    def test_local_processing_sweeps_up_retries_and_abandoned_jobs(self):
+        with override_settings(SIGNUP_PROCESSING_BACKEND='worker'):
+            retried = self.signup(username='retried').json()['processing_id']
+            abandoned = self.signup(username='abandoned').json()['processing_id']
+        with mock.patch.object(signups.extractor, 'polygon', side_effect=OSError('storage unavailable')):
+            signups.run(retried)
+        signups.claim(abandoned)  # its worker restarted mid-job
+        self.assertEqual(signups.sweep(), 0)  # backing off / leased
+
+        SignupJob.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(signups.sweep(), 2)
+        self.assertEqual(set(SignupJob.objects.values_list('status', flat=True)), {SignupJob.DONE})
+
+        with override_settings(SIGNUP_PROCESSING_THREADS=2), mock.patch.object(signups, '_sweeper', None), \
+                mock.patch('threading.Thread') as thread:
+            self.client.get('/api/v1/fields/')
+            self.client.get('/api/v1/fields/')
+        thread.return_value.start.assert_called_once()
+
+    def test_retries_give_up_after_max_attempts(self):
+        with override_settings(SIGNUP_PROCESSING_BACKEND='worker'):
+            job_id = self.signup(username='unlucky').json()['processing_id']
+        with override_settings(SIGNUP_PROCESSING_MAX_ATTEMPTS=1), \
+                mock.patch.object(signups.extractor, 'polygon', side_effect=ValueError('bad geometry')):
+            signups.run(job_id)
+        status = self.status(User.objects.get(username='unlucky'))
+        self.assertEqual(status['processing'][0]['status'], 'failed')
+        self.assertIn('bad geometry', status['processing'][0]['error'])
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.profiles_dir = tempfile.mkdtemp()
+        overrides = self.settings(PROFILING_DIR=self.profiles_dir, PROFILING_INTERVAL_MS=1, RATE_LIMIT_ENABLED=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.staff = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.farmer = User.objects.create_user(username='farmer', password='x-Secret-123')
+
+    def get_fields(self, user, data=None, **extra):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+        return self.client.get('/api/v1/fields/', data, **auth, **extra)
+
+    def test_sampler_folds_stacks_root_first(self):
+        def busy_leaf():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        sampler = profiling.StackSampler(interval=1).start()
+        busy_leaf()
+        sampler.stop()
+        self.assertGreater(sampler.samples, 5)
+        lines = dict(line.rsplit(' ', 1) for line in sampler.folded().splitlines())
+        stack = max(lines, key=lambda stack: int(lines[stack]))
+        self.assertTrue(stack.split(';')[-1].startswith('busy_leaf (monitor/tests.py:'), stack)
+
+    def test_staff_can_ask_for_a_profile_others_cannot(self):
+        response = self.get_fields(self.farmer, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        response = self.get_fields(self.staff, HTTP_X_PROFILE='1')
+        profile = profiling.list_profiles()[0]
+        self.assertEqual(response['X-Profile-Id'], profile['id'])
+        self.assertEqual((profile['trigger'], profile['path'], profile['status']), ('requested', '/api/v1/fields/', 200))
+        self.assertEqual(profile['user_id'], self.staff.pk)
+        self.assertGreater(profile['peak_bytes'], 0)
+        self.assertTrue(os.path.exists(profiling.folded_path(profile['id'])))
+
+    def test_sampled_profiles_kept_above_threshold_in_a_bounded_buffer(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_THRESHOLD_MS=60000):
+            self.assertNotIn('X-Profile-Id', self.get_fields(self.farmer))
+        with override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_THRESHOLD_MS=0, PROFILING_MAX_FILES=3):
+            ids = [self.get_fields(self.farmer)['X-Profile-Id'] for _ in range(5)]
+        self.assertEqual([profile['id'] for profile in profiling.list_profiles()], ids[:1:-1])
+        self.assertEqual(len(os.listdir(self.profiles_dir)), 6)
+        self.assertIsNone(profiling.folded_path(ids[0]))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_lists_and_serves_profiles_to_staff_only(self):
+        profile_id = self.get_fields(self.staff, data={'profile': '1'})['X-Profile-Id']
+        self.client.force_login(self.farmer)
+        self.assertEqual(self.client.get('/admin/profiles/').status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get('/admin/profiles/')
+        self.assertContains(response, '/api/v1/fields/')
+        response = self.client.get(f'/admin/profiles/{profile_id}.folded')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/admin/profiles/..%2Fsecrets.folded').status_code, 404)
+
+
+class FieldClusterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clusters.reset()
+        self.addCleanup(clusters.reset)
+        rng = np.random.default_rng(3)
+        self.ids = np.arange(1, 2001)
+        self.lat = rng.uniform(24, 36, len(self.ids))
+        self.lng = rng.uniform(61, 77, len(self.ids))
+        self.hectares = rng.uniform(1, 10, len(self.ids))
+
+    def index(self, mask=slice(None)):
+        return clusters.ClusterIndex(self.ids[mask], self.lat[mask], self.lng[mask], self.hectares[mask], max_zoom=12)
+
+    def snapshot(self, index, zoom, bbox=(-180, -85, 180, 85)):
+        return sorted((c['count'], c.get('field_id') or 0, c['hectares']) for c in index.clusters(*bbox, zoom)[0])
+
+    def assertSameClusters(self, first, second):
+        self.assertEqual([row[:2] for row in first], [row[:2] for row in second])
+        for (*_, hectares), (*_, expected) in zip(first, second):
+            self.assertAlmostEqual(hectares, expected, delta=0.05)
+
+    def test_every_zoom_partitions_the_fields(self):
+        index = self.index()
+        for zoom in range(14):
+            found = index.clusters(-180, -85, 180, 85, zoom)[0]
+            self.assertEqual(sum(c['count'] for c in found), len(self.ids))
+            self.assertAlmostEqual(sum(c['hectares'] for c in found), self.hectares.sum(), delta=0.5)
+        self.assertEqual(len(index.clusters(-180, -85, 180, 85, 0)[0]), 1)
+        points = index.clusters(-180, -85, 180, 85, 13)[0]
+        self.assertEqual(sorted(c['field_id'] for c in points), list(self.ids))
+
+    def test_bbox_query_matches_brute_force(self):
+        index = self.index()
+        west, south, east, north = 65.0, 28.0, 70.0, 31.0
+        inside = (self.lng >= west) & (self.lng <= east) & (self.lat >= south) & (self.lat <= north)
+        found = index.clusters(west, south, east, north, 13)[0]
+        self.assertEqual(sorted(c['field_id'] for c in found), sorted(self.ids[inside]))
+        # At coarser zooms clusters whose centre is in view are returned
+        for cluster in index.clusters(west, south, east, north, 6)[0]:
+            self.assertTrue(west <= cluster['lng'] <= east and south <= cluster['lat'] <= north)
+        # Across the antimeridian
+        pacific = clusters.ClusterIndex([1, 2, 3], [0, 0, 0], [179.5, -179.5, 0], [1, 1, 1], max_zoom=12)
+        self.assertEqual(sorted(c['field_id'] for c in pacific.clusters(179, -1, -179, 1, 13)[0]), [1, 2])
+
+    def test_incremental_updates_match_a_rebuild(self):
+        index = self.index(slice(0, 1500))
+        for position in range(1500, 2000):
+            index.add(self.ids[position], self.lat[position], self.lng[position], self.hectares[position])
+        for field_id in self.ids[:300]:
+            index.remove(field_id)
+        index.remove(99999)
+        self.lat[500] = 30.0
+        index.add(self.ids[500], self.lat[500], self.lng[500], self.hectares[500])
+
+        expected = self.index(slice(300, None))
+        for zoom in (0, 4, 8, 13):
+            self.assertSameClusters(self.snapshot(index, zoom), self.snapshot(expected, zoom))
+        self.assertSameClusters(self.snapshot(index.compacted(), 8), self.snapshot(expected, 8))
+
+    def test_every_field_can_be_removed_at_full_depth(self):
+        index = clusters.ClusterIndex(self.ids, self.lat, self.lng, self.hectares, max_zoom=16)
+        for field_id in self.ids:
+            index.remove(field_id)
+        for level in index.levels:
+            self.assertEqual(int(level.count.sum()), 0)
+        index.add(7, 30.0, 70.0, 1.0)
+        self.assertEqual([c['field_id'] for c in index.clusters(60, 20, 80, 40, 17)[0]], [7])
+
+    @override_settings(CLUSTER_CHANGE_FEED='cache')
+    def test_api_follows_approvals_through_the_cache_feed(self):
+        self.test_api_follows_approvals()
+        with mock.patch.object(clusters.ClusterIndex, 'remove', side_effect=IndexError), \
+                self.assertLogs('monitor.clusters', 'ERROR'):
+            clusters.publish([(1, None)])
+            clusters.current_index()  # the failed replay is dropped for a rebuild
+        self.assertEqual(clusters.current_index().clusters(60, 20, 80, 40, 20)[0][0]['field_id'],
+                         FieldSubmission.objects.get(is_approved=True).pk)
+
+    def test_api_follows_approvals(self):
+        admin_user = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        farmer = User.objects.create_user(username='farmer', password='x-Secret-123')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(admin_user)}'}
+        fields = [create_field(farmer, lat=31.5 + i * 0.001, lng=74.3) for i in range(3)]
+        create_field(farmer, lat=24.9, lng=67.0)  # pending, never shown
+
+        def get(zoom, bbox='60,20,80,40'):
+            return self.client.get('/api/v1/fields/clusters/', {'bbox': bbox, 'zoom': zoom}, **auth)
+
+        self.assertEqual(get(5).json()['clusters'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            for field in fields:
+                field.approve(admin_user)
+        cluster, = get(5).json()['clusters']
+        self.assertEqual(cluster['count'], 3)
+        self.assertAlmostEqual(cluster['hectares'], sum(f.area_hectares for f in fields), places=2)
+        self.assertEqual(len(get(20).json()['clusters']), 3)
+
+        request = RequestFactory().post('/')
+        request.user = admin_user
+        model_admin = FieldSubmissionAdmin(FieldSubmission, admin.site)
+        with mock.patch.object(model_admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            model_admin.unapprove_fields(request, FieldSubmission.objects.filter(pk=fields[0].pk))
+        self.assertEqual(get(5).json()['clusters'][0]['count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            fields[1].delete()
+        self.assertEqual(get(20).json()['clusters'][0]['field_id'], fields[2].pk)
+
+        self.assertEqual(get(5, bbox='60,20,80').status_code, 400)
+        farmer_auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(farmer)}'}
+        self.assertEqual(self.client.get('/api/v1/fields/clusters/', {'bbox': '60,20,80,40', 'zoom': 5},
+                                         **farmer_auth).status_code, 403)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class FieldChangesTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x-Secret-123')
+        self.other = User.objects.create_user(username='other', password='x-Secret-123')
+        self.admin = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.farmer)}'}
+
+    def sync(self, since=None):
+        params = {} if since is None else {'since': since}
+        return self.client.get('/api/v1/fields/changes/', params, **self.auth)
+
+    def test_delta_sync_reports_changes_and_tombstones(self):
+        kept, doomed = create_field(self.farmer, field_name='Kept'), create_field(self.farmer, field_name='Doomed')
+        doomed_id = doomed.pk
+        snapshot = self.sync().json()
+        self.assertEqual([field['field_name'] for field in snapshot['fields']], ['Kept', 'Doomed'])
+
+        kept.approve(self.admin)
+        doomed.delete()
+        create_field(self.other)
+        new = create_field(self.farmer, field_name='New')
+        body = self.sync(snapshot['cursor']).json()
+        self.assertEqual(sorted(field['id'] for field in body['fields']), [kept.pk, new.pk])
+        self.assertTrue(next(f for f in body['fields'] if f['id'] == kept.pk)['is_approved'])
+        self.assertEqual((body['deleted'], body['has_more']), ([doomed_id], False))
+        self.assertGreater(body['cursor'], snapshot['cursor'])
+        self.assertEqual(self.sync(body['cursor']).json()['fields'], [])
+        kinds = list(FieldChange.objects.filter(field_id=kept.pk).values_list('kind', flat=True))
+        self.assertEqual(kinds, [FieldChange.CREATED, FieldChange.APPROVED])
+
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        model_admin = FieldSubmissionAdmin(FieldSubmission, admin.site)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.unapprove_fields(request, FieldSubmission.objects.filter(user=self.farmer))
+        body = self.sync(body['cursor']).json()
+        self.assertEqual([(field['id'], field['is_approved']) for field in body['fields']], [(kept.pk, False)])
+        self.assertEqual(FieldChange.objects.filter(kind=FieldChange.UNAPPROVED).count(), 1)
+
+        self.assertEqual(self.sync('abc').status_code, 400)
+        self.assertEqual(self.sync(body['cursor'] + 100).status_code, 400)
+
+    def test_late_commits_get_later_cursors(self):
+        changes.record([(1, self.farmer.pk, FieldChange.CREATED)])
+        cursor, _, changed, _ = changes.changes_since(self.farmer, 0)
+        self.assertEqual(changed, [1])
+        # An entry inserted earlier (lower id) by a transaction that commits
+        # later is numbered after every cursor already handed out
+        FieldChange.objects.create(id=FieldChange.objects.get().id - 1, field_id=2, user_id=self.farmer.pk, kind='created')
+        later, _, changed, _ = changes.changes_since(self.farmer, cursor)
+        self.assertEqual((changed, later), ([2], cursor + 1))
+
+    def test_pages_and_bulk_creates(self):
+        item = {
+            'first_name': 'Ada', 'last_name': 'Farmer', 'email': 'ada@example.com', 'phone': '123',
+            'city': 'Lahore', 'country': 'PK', 'zip_code': '54000', 'crop_name': 'Wheat',
+            'plantation_date': '2024-11-01', 'lat': 31.5, 'lng': 74.3,
+            'polygon': [{'lat': 31.5, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.4}],
+        }
+        response = self.client.post('/api/v1/fields/bulk/', {'fields': [{**item, 'field_name': f'Bulk {i}'} for i in range(5)]},
+                                    content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        with override_settings(FIELD_CHANGES_PAGE_SIZE=2):
+            cursor, names = 0, []
+            while True:
+                body = self.sync(cursor).json()
+                names += [field['field_name'] for field in body['fields']]
+                cursor = body['cursor']
+                if not body['has_more']:
+                    break
+        self.assertEqual(names, [f'Bulk {i}' for i in range(5)])
+
+    def test_compaction_collapses_and_expires_old_cursors(self):
+        field = create_field(self.farmer)
+        old_cursor = self.sync().json()['cursor']
+        for name in ('A', 'B', 'C'):
+            field.field_name = name
+            field.save()
+        gone = create_field(self.farmer)
+        gone_id = gone.pk
+        gone.delete()
+        self.sync(old_cursor)  # stamps everything
+
+        self.assertEqual(changes.compact(), 4)  # three older entries of field, gone's creation
+        self.assertEqual(list(FieldChange.objects.values_list('field_id', flat=True)), [field.pk, gone_id])
+        body = self.sync(old_cursor).json()
+        self.assertEqual(([f['field_name'] for f in body['fields']], body['deleted']), (['C'], [gone_id]))
+
+        out = io.StringIO()
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=31)):
+            call_command('compact_field_changes', stdout=out)
+        self.assertIn('Removed 1 change log entries', out.getvalue())
+        self.assertEqual(self.sync(old_cursor).status_code, 410)
+        cursor = self.sync().json()['cursor']
+        self.assertGreaterEqual(cursor, body['cursor'])
+        field.save()
+        self.assertGreater(self.sync(cursor).json()['cursor'], cursor)
+
+
+@override_settings(NOTIFICATIONS_BACKEND='memory', NOTIFICATIONS_HEARTBEAT_SECONDS=0.05)
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        notifications._backends.clear()
+        self.addCleanup(notifications._backends.clear)
+        self.farmer = User.objects.create_user(username='farmer', password='x-Secret-123')
+        self.admin = User.objects.create_superuser(username='boss', password='x-Secret-123')
+        self.token = str(AccessToken.for_user(self.farmer))
+
+    def stream(self, headers=(), query_string=b'', during=None, until=lambda body: True):
+        """Run a stream until ``until(body)`` holds, calling ``during`` once it is subscribed"""
+        scope = {'type': 'http', 'method': 'GET', 'path': sse.STREAM_PATH, 'query_string': query_string,
+                 'headers': [(name.encode(), value.encode()) for name, value in headers]}
+        messages = []
+
+        async def run():
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if until(b''.join(m.get('body', b'') for m in messages).decode()):
+                    disconnect.set()
+
+            task = asyncio.ensure_future(sse.stream(scope, receive, send))
+            if during is not None:
+                while not notifications.hub.connections() and not task.done():
+                    await asyncio.sleep(0.01)
+                await sync_to_async(during)()
+            await asyncio.wait_for(task, 5)
+
+        async_to_sync(run)()
+        self.assertEqual(notifications.hub.connections(), 0)
+        return messages[0]['status'], b''.join(m.get('body', b'') for m in messages).decode()
+
+    def test_requires_a_valid_token(self):
+        self.assertEqual(self.stream()[0], 401)
+        self.assertEqual(self.stream(query_string=b'token=junk')[0], 401)
+        django_app = mock.AsyncMock()
+        async_to_sync(sse.route(django_app))({'type': 'http', 'path': '/api/v1/fields/'}, None, None)
+        django_app.assert_awaited_once()
+
+    def test_approval_changes_are_pushed_live(self):
+        field = create_field(self.farmer, field_name='North')
+
+        def review():
+            with self.captureOnCommitCallbacks(execute=True):
+                FieldSubmission.objects.get(pk=field.pk).approve(self.admin)
+            request = RequestFactory().post('/')
+            request.user = self.admin
+            model_admin = FieldSubmissionAdmin(FieldSubmission, admin.site)
+            with self.captureOnCommitCallbacks(execute=True), mock.patch.object(model_admin, 'message_user'):
+                model_admin.unapprove_fields(request, FieldSubmission.objects.all())
+
+        status, body = self.stream(headers=[('authorization', f'Bearer {self.token}')], during=review,
+                                   until=lambda body: 'field.unapproved' in body)
+        self.assertEqual(status, 200)
+        self.assertTrue(body.startswith('retry: 3000\n\n'))
+        events = [dict(line.split(': ', 1) for line in chunk.splitlines()) for chunk in body.split('\n\n')[1:] if chunk]
+        self.assertEqual([(e['id'], e['event']) for e in events], [('1', 'field.approved'), ('2', 'field.unapproved')])
+        data = json.loads(events[0]['data'])
+        self.assertEqual((data['field_id'], data['field_name'], data['is_approved']), (field.pk, 'North', True))
+        self.assertIsNotNone(data['approved_at'])
+
+    def test_reconnect_replays_missed_events_then_heartbeats(self):
+        other = User.objects.create_user(username='other', password='x-Secret-123')
+        with self.captureOnCommitCallbacks(execute=True):
+            for user_id, name in ((self.farmer.pk, 'A'), (self.farmer.pk, 'B'), (other.pk, 'C'), (self.farmer.pk, 'D')):
+                notifications.field_approval_changed(1, user_id, name, True)
+        status, body = self.stream(headers=[('last-event-id', '1')], query_string=f'token={self.token}'.encode(),
+                                   until=lambda body: ': heartbeat' in body)
+        self.assertEqual(status, 200)
+        self.assertEqual([line for line in body.splitlines() if line.startswith('id: ')], ['id: 2', 'id: 4'])
+        self.assertLess(body.index('id: 4'), body.index(': heartbeat'))
+
+    @override_settings(NOTIFICATIONS_BACKEND='database')
+    def test_database_backend_fans_out_new_rows_and_replays(self):
+        backend = notifications.DatabaseBackend()
+        first = backend.publish(self.farmer.pk, 'field.approved', {'field_id': 1})
+        with mock.patch.object(notifications.threading, 'Thread'):
+            backend.start()  # only rows written from here on are fanned out, even before the first poll
+
+        async def receive_next():
+            subscription = notifications.hub.subscribe(self.farmer.pk)
+            try:
+                await sync_to_async(backend.publish)(self.farmer.pk, 'field.unapproved', {'field_id': 1})
+                self.assertEqual(await sync_to_async(backend.poll_once)(), 1)
+                return await asyncio.wait_for(subscription.queue.get(), 1)
+            finally:
+                notifications.hub.unsubscribe(subscription)
+
+        second = async_to_sync(receive_next)()
+        self.assertEqual((second.id, second.event), (first.id + 1, 'field.unapproved'))
+        self.assertEqual(backend.replay(self.farmer.pk, first.id), [second])
+        self.assertEqual(backend.replay(self.admin.pk, 0), [])
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=2)):
+            self.assertEqual(backend.replay(self.farmer.pk, 0), [])
+
+
+class FieldTilingTests(SimpleTestCase):
+    # An L-shaped estate about 67 km tall and 57 km wide: 3 x 3 tiles at 10 m
+    ESTATE = [
+        {'lat': 31.0, 'lng': 74.0}, {'lat': 31.0, 'lng': 74.6}, {'lat': 31.1, 'lng': 74.6},
+        {'lat': 31.1, 'lng': 74.1}, {'lat': 31.6, 'lng': 74.1}, {'lat': 31.6, 'lng': 74.0},
+    ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_large_fields_split_into_even_tiles_covering_the_polygon(self):
+        tile_plan = tiling.plan(self.ESTATE)
+        self.assertGreater(tile_plan.height, 2500)
+        # The notch's four tiles are dropped
+        self.assertEqual([(tile.row, tile.col) for tile in tile_plan.tiles], [(0, 0), (1, 0), (2, 0), (2, 1), (2, 2)])
+        self.assertLessEqual(max(tile.height for tile in tile_plan.tiles), 2500)
+        self.assertLessEqual(max(tile.width for tile in tile_plan.tiles) - min(tile.width for tile in tile_plan.tiles), 1)
+        bottom = [tile for tile in tile_plan.tiles if tile.row == 2]
+        self.assertEqual(sum(tile.width for tile in bottom), tile_plan.width)
+
+        # A ragged, concave polygon: the clipped pieces add up to the whole
+        estate = synthetic_polygon(random.Random(0), 31.5, 74.3, vertices=500, radius=0.3)
+        tile_plan = tiling.plan(estate)
+        self.assertEqual(len(tile_plan.tiles), 12)  # 4 x 3, none empty
+        for tile in tile_plan.tiles:
+            min_lat, min_lng, max_lat, max_lng = tile.bbox
+            self.assertTrue(((tile.coords[:, 0] >= min_lat) & (tile.coords[:, 0] <= max_lat)).all())
+            self.assertTrue(((tile.coords[:, 1] >= min_lng) & (tile.coords[:, 1] <= max_lng)).all())
+        pieces = sum(polygon_area_hectares(tile.points()) for tile in tile_plan.tiles)
+        self.assertAlmostEqual(pieces / polygon_area_hectares(estate), 1, places=3)
+
+        small = tiling.plan([{'lat': 31.5, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.3}, {'lat': 31.6, 'lng': 74.4}])
+        self.assertEqual(len(small.tiles), 1)
+        self.assertIsNone(tiling.plan([{'lat': 1, 'lng': 2}]))
+
+    def test_per_tile_results_merge_into_field_results(self):
+        tile_plan = tiling.plan(self.ESTATE, resolution_m=1000, max_pixels=20)
+        rng = np.random.default_rng(0)
+        truth = rng.uniform(-1, 1, (tile_plan.height, tile_plan.width))
+        valid = rng.random(truth.shape) > 0.3
+        images, stats = {}, []
+        for tile in tile_plan.tiles:
+            window = np.s_[tile.top:tile.top + tile.height, tile.left:tile.left + tile.width]
+            images[tile.key] = truth[window]
+            pixels = truth[window][valid[window]]
+            stats.append({'ndvi': {'count': pixels.size, 'mean': pixels.mean(), 'std': pixels.std(),
+                                   'min': pixels.min(), 'max': pixels.max()}})
+        stats.append({'ndvi': {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None}})
+
+        image = tiling.mosaic(tile_plan, images)
+        covered = ~np.isnan(image)
+        np.testing.assert_array_equal(image[covered], truth[covered])
+        self.assertTrue(np.isnan(image[:tile_plan.tiles[1].top, -1]).all())  # the notch
+
+        pixels = truth[covered & valid]
+        merged = tiling.merge_statistics(stats)['ndvi']
+        self.assertEqual(merged['count'], pixels.size)
+        for key, expected in (('mean', pixels.mean()), ('std', pixels.std()), ('min', pixels.min()), ('max', pixels.max())):
+            self.assertAlmostEqual(merged[key], expected, places=9)
+
+        with self.assertRaises(ValueError):
+            tiling.mosaic(tile_plan, {tile_plan.tiles[0].key: np.zeros((1, 1))})
+
+    def test_tile_results_are_cached_by_deterministic_keys(self):
+        first, second = tiling.plan(self.ESTATE), tiling.plan([dict(point) for point in self.ESTATE])
+        self.assertEqual([tile.key for tile in first.tiles], [tile.key for tile in second.tiles])
+        self.assertEqual(len({tile.key for tile in first.tiles}), len(first.tiles))
+
+        compute = mock.Mock(side_effect=lambda tile: {'ndvi': {'count': tile.width}})
+        results = tiling.fetch(first, compute)
+        self.assertEqual(compute.call_count, 5)
+        self.assertEqual(tiling.fetch(second, compute), results)
+        self.assertEqual(compute.call_count, 5)
+        cache.delete(first.tiles[0].key)
+        tiling.fetch(second, compute)
+        self.assertEqual(compute.call_count, 6)
 
-# Create your tests here.
@@ -0,0 +1,197 @@
+"""
+Splitting large fields into upstream-sized tiles and merging the results.
+
+Sentinel Hub Process/Statistical requests are capped at
+``TILING_MAX_PIXELS`` per side, which a large estate exceeds at
+``TILING_RESOLUTION_M``. ``plan`` lays a pixel grid over the field's bbox,
+cuts it into the fewest near-equal tiles that fit (no thin sliver along one
+edge), clips the polygon to each tile and drops tiles it doesn't reach.
+Tiles share edges on pixel boundaries, so no pixel is counted twice.
+
+Each tile has a ``key`` derived from its bbox, size and clipped polygon:
+the same field always plans to the same tiles, and ``fetch`` only asks
+upstream for tiles that aren't cached. ``merge_statistics`` combines
+per-tile statistics weighted by pixel count; ``mosaic`` stitches per-tile
+images into one field-sized array.
+
+Clipping is Sutherland-Hodgman against the tile's four edges. A concave
+field crossing a tile edge more than once comes back as one ring whose parts
+are joined by zero-width slivers along that edge; its area and even-odd
+rasterization are still exact.
+"""
+
+import hashlib
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .geometry import EARTH_RADIUS_M, polygon_array
+
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+STAT_KEYS = ('count', 'mean', 'std', 'min', 'max')
+
+
+@dataclass(frozen=True)
+class Tile:
+    row: int
+    col: int
+    top: int  # pixel offsets into the field's grid
+    left: int
+    height: int
+    width: int
+    bbox: tuple  # (min_lat, min_lng, max_lat, max_lng)
+    coords: np.ndarray = field(compare=False, repr=False)  # clipped polygon, (n, 2) lat/lng
+
+    @property
+    def key(self):
+        digest = hashlib.sha1(repr((self.bbox, self.height, self.width)).encode())
+        # + 0.0 folds -0.0 into 0.0 so equal polygons hash equally
+        digest.update((np.round(self.coords, 7) + 0.0).tobytes())
+        return f'tile:{digest.hexdigest()}'
+
+    def points(self):
+        """The clipped polygon in FieldSubmission.polygon form"""
+        return [{'lat': float(lat), 'lng': float(lng)} for lat, lng in self.coords]
+
+
+@dataclass(frozen=True)
+class TilePlan:
+    bbox: tuple
+    height: int  # the whole field's grid, in pixels
+    width: int
+    tiles: list
+
+
+def _split(pixels, max_pixels):
+    """Edges splitting ``pixels`` into the fewest near-equal parts of at most ``max_pixels``"""
+    parts = -(-pixels // max_pixels)
+    return np.arange(parts + 1) * pixels // parts
+
+
+def _clip_half_plane(coords, axis, bound, keep_below):
+    """One Sutherland-Hodgman pass: keep the side of ``coords[:, axis] == bound`` asked for"""
+    values = coords[:, axis]
+    inside = values <= bound if keep_below else values >= bound
+    following = np.roll(coords, -1, axis=0)
+    crossing = inside != np.roll(inside, -1)
+    delta = following[:, axis] - values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(crossing, (bound - values) / delta, 0.0)
+    crossings = coords + t[:, None] * (following - coords)
+    crossings[:, axis] = bound
+    # Each edge contributes its start if inside, then its crossing if any
+    candidates = np.stack([coords, crossings], axis=1).reshape(-1, 2)
+    return candidates[np.stack([inside, crossing], axis=1).reshape(-1)]
+
+
+def clip_to_bbox(coords, bbox):
+    """``coords`` ((n, 2) lat/lng) clipped to ``bbox``; an empty array if they don't meet"""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    for axis, bound, keep_below in ((0, min_lat, False), (0, max_lat, True), (1, min_lng, False), (1, max_lng, True)):
+        if len(coords) == 0:
+            break
+        coords = _clip_half_plane(coords, axis, bound, keep_below)
+    return coords
+
+
+def _shoelace(coords):
+    if len(coords) < 3:
+        return 0.0
+    lat, lng = coords[:, 0], coords[:, 1]
+    return 0.5 * abs(float(np.dot(lng, np.roll(lat, -1)) - np.dot(lat, np.roll(lng, -1))))
+
+
+def plan(points, resolution_m=None, max_pixels=None):
+    """Tiles covering a FieldSubmission.polygon, or None if the polygon is unusable"""
+    coords = polygon_array(points)
+    if coords is None:
+        return None
+    resolution_m = resolution_m or settings.TILING_RESOLUTION_M
+    max_pixels = max_pixels or settings.TILING_MAX_PIXELS
+    if np.array_equal(coords[0], coords[-1]):
+        coords = coords[:-1]
+    (min_lat, min_lng), (max_lat, max_lng) = coords.min(axis=0), coords.max(axis=0)
+    bbox = (float(min_lat), float(min_lng), float(max_lat), float(max_lng))
+    metres_per_lng = METRES_PER_DEGREE * math.cos(math.radians((min_lat + max_lat) / 2))
+    height = max(1, math.ceil((max_lat - min_lat) * METRES_PER_DEGREE / resolution_m))
+    width = max(1, math.ceil((max_lng - min_lng) * metres_per_lng / resolution_m))
+    row_edges, col_edges = _split(height, max_pixels), _split(width, max_pixels)
+    # Pixels stretch slightly so the bbox is a whole number of them; rows run north to south
+    lat_edges = max_lat - row_edges * (max_lat - min_lat) / height
+    lng_edges = min_lng + col_edges * (max_lng - min_lng) / width
+
+    area = _shoelace(coords)
+    tiles = []
+    for row in range(len(row_edges) - 1):
+        for col in range(len(col_edges) - 1):
+            tile_bbox = (float(lat_edges[row + 1]), float(lng_edges[col]), float(lat_edges[row]), float(lng_edges[col + 1]))
+            clipped = clip_to_bbox(coords, tile_bbox)
+            # Slivers along an edge clip to zero area
+            if _shoelace(clipped) <= area * 1e-12:
+                continue
+            tiles.append(Tile(
+                row=row, col=col, top=int(row_edges[row]), left=int(col_edges[col]),
+                height=int(row_edges[row + 1] - row_edges[row]), width=int(col_edges[col + 1] - col_edges[col]),
+                bbox=tile_bbox, coords=clipped,
+            ))
+    return TilePlan(bbox=bbox, height=height, width=width, tiles=tiles)
+
+
+def fetch(tile_plan, compute, timeout=None):
+    """{tile key: compute(tile)} for every tile, reusing cached results"""
+    timeout = timeout if timeout is not None else settings.TILING_CACHE_TIMEOUT
+    keys = [tile.key for tile in tile_plan.tiles]
+    results = cache.get_many(keys)
+    computed = {tile.key: compute(tile) for tile in tile_plan.tiles if tile.key not in results}
+    if computed:
+        cache.set_many(computed, timeout)
+    return {key: results[key] if key in results else computed[key] for key in keys}
+
+
+def merge_statistics(parts):
+    """
+    One field's statistics from its tiles'. Each part maps an index name to
+    ``{'count', 'mean', 'std', 'min', 'max'}`` over its valid pixels; means
+    are weighted by count and spreads combined as population variances.
+    """
+    parts = list(parts)
+    merged = {}
+    for index in sorted({index for part in parts for index in part}):
+        rows = [part[index] for part in parts if index in part and part[index]['count'] > 0]
+        if not rows:
+            merged[index] = {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None}
+            continue
+        count, mean, std, low, high = np.array([[row[key] for key in STAT_KEYS] for row in rows], dtype=np.float64).T
+        total = count.sum()
+        merged_mean = float(np.dot(count, mean) / total)
+        variance = float(np.dot(count, std ** 2 + (mean - merged_mean) ** 2) / total)
+        merged[index] = {
+            'count': int(total), 'mean': merged_mean, 'std': math.sqrt(max(variance, 0.0)),
+            'min': float(low.min()), 'max': float(high.max()),
+        }
+    return merged
+
+
+def mosaic(tile_plan, images, fill=np.nan):
+    """
+    Per-tile images ({tile key: (height, width[, bands]) array}) stitched into
+    one field-sized array; dropped or missing tiles are left as ``fill``.
+    """
+    first = next((images[tile.key] for tile in tile_plan.tiles if tile.key in images), None)
+    if first is None:
+        return np.full((tile_plan.height, tile_plan.width), fill)
+    first = np.asarray(first)
+    # Integer images can't hold a NaN fill
+    dtype = first.dtype if np.can_cast(np.min_scalar_type(fill), first.dtype) else np.float64
+    out = np.full((tile_plan.height, tile_plan.width, *first.shape[2:]), fill, dtype=dtype)
+    for tile in tile_plan.tiles:
+        if tile.key not in images:
+            continue
+        image = np.asarray(images[tile.key])
+        if image.shape[:2] != (tile.height, tile.width):
+            raise ValueError(f'Tile {tile.row},{tile.col} is {image.shape[:2]}, expected {(tile.height, tile.width)}')
+        out[tile.top:tile.top + tile.height, tile.left:tile.left + tile.width] = image
+    return out
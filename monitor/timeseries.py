@@ -0,0 +1,148 @@
+"""
+Per-field vegetation index histories (NDVI, NDWI, ...) stored as compact chunks.
+
+Each ``TimeSeriesChunk`` row holds up to ``TIMESERIES_CHUNK_SIZE`` points of
+one field and index as a blob: uint16 day deltas (the first relative to
+``start_date``) followed by float16/float32 values. Chunks of a series never
+overlap in time, so a range query only loads and decodes the chunks whose
+``start_date``..``end_date`` intersects it. Appends rewrite at most the last,
+partly filled chunk; backfills and corrections rewrite only the chunks they
+overlap. Weekly and monthly rollups are computed from the sliced range.
+"""
+
+import re
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import TimeSeriesChunk
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+INDEX_RE = re.compile(r'^[a-z][a-z0-9_]{0,15}$')
+DTYPES = {'float16': '<f2', 'float32': '<f4'}
+ROLLUPS = ('raw', 'weekly', 'monthly')
+
+
+def to_days(dates):
+    """Dates (date objects or ISO strings) as int64 day ordinals"""
+    return np.array([
+        (d if isinstance(d, date) else date.fromisoformat(d)).toordinal() for d in dates
+    ], dtype=np.int64)
+
+
+def to_dates(days):
+    return [date.fromordinal(day).isoformat() for day in days.tolist()]
+
+
+def encode_chunk(days, values, dtype):
+    deltas = np.diff(days, prepend=days[0])
+    if deltas.size and deltas.max() > np.iinfo(np.uint16).max:
+        raise ValueError('Gap between consecutive points is too large for one chunk')
+    return deltas.astype('<u2').tobytes() + np.asarray(values).astype(dtype).tobytes()
+
+
+def decode_chunk(chunk):
+    """(day ordinals, float64 values) of one chunk"""
+    data = bytes(chunk.data)
+    deltas = np.frombuffer(data, dtype='<u2', count=chunk.count)
+    days = chunk.start_date.toordinal() + np.cumsum(deltas, dtype=np.int64)
+    values = np.frombuffer(data, dtype=chunk.dtype, count=chunk.count, offset=2 * chunk.count)
+    return days, values.astype(np.float64)
+
+
+def _chunks(field_id, index, days, values, dtype):
+    size = settings.TIMESERIES_CHUNK_SIZE
+    for start in range(0, len(days), size):
+        piece_days, piece_values = days[start:start + size], values[start:start + size]
+        yield TimeSeriesChunk(
+            field_id=field_id, index=index, dtype=dtype, count=len(piece_days),
+            start_date=date.fromordinal(int(piece_days[0])), end_date=date.fromordinal(int(piece_days[-1])),
+            data=encode_chunk(piece_days, piece_values, dtype),
+        )
+
+
+def append(field_id, index, dates, values, dtype=None):
+    """
+    Add points to a field's series; a point on an existing date replaces it.
+    Returns the number of chunks written.
+    """
+    if not INDEX_RE.match(index or ''):
+        raise ValueError(f'Invalid index name: {index!r}')
+    dtype = DTYPES[dtype or settings.TIMESERIES_DTYPE]
+    days = to_days(dates)
+    values = np.asarray(values, dtype=np.float64)
+    if days.shape != values.shape:
+        raise ValueError('dates and values must have the same length')
+    if not len(days):
+        return 0
+    # Sort and keep the last value given for each date
+    order = np.argsort(days, kind='stable')
+    days, values = days[order], values[order]
+    keep = np.r_[days[1:] != days[:-1], True]
+    days, values = days[keep], values[keep]
+    first, last = date.fromordinal(int(days[0])), date.fromordinal(int(days[-1]))
+
+    with transaction.atomic():
+        series = TimeSeriesChunk.objects.select_for_update().filter(field_id=field_id, index=index)
+        affected = list(series.filter(start_date__lte=last, end_date__gte=first))
+        preceding = series.filter(end_date__lt=first).order_by('-start_date').first()
+        if preceding is not None and preceding.count < settings.TIMESERIES_CHUNK_SIZE:
+            affected.insert(0, preceding)  # top up the partly filled chunk instead of starting another
+
+        if affected:
+            old = [decode_chunk(chunk) for chunk in affected]
+            old_days = np.concatenate([d for d, _ in old])
+            old_values = np.concatenate([v for _, v in old])
+            replaced = np.isin(old_days, days)
+            merged_days = np.concatenate([old_days[~replaced], days])
+            merged_values = np.concatenate([old_values[~replaced], values])
+            order = np.argsort(merged_days, kind='stable')
+            days, values = merged_days[order], merged_values[order]
+            TimeSeriesChunk.objects.filter(pk__in=[chunk.pk for chunk in affected]).delete()
+        chunks = TimeSeriesChunk.objects.bulk_create(_chunks(field_id, index, days, values, dtype))
+    return len(chunks)
+
+
+def query(field_id, index, start=None, end=None):
+    """(day ordinals, values) of a series between ``start`` and ``end`` inclusive"""
+    chunks = TimeSeriesChunk.objects.filter(field_id=field_id, index=index).order_by('start_date')
+    if start is not None:
+        chunks = chunks.filter(end_date__gte=start)
+    if end is not None:
+        chunks = chunks.filter(start_date__lte=end)
+    decoded = [decode_chunk(chunk) for chunk in chunks]
+    if not decoded:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    days = np.concatenate([d for d, _ in decoded])
+    values = np.concatenate([v for _, v in decoded])
+    lo = np.searchsorted(days, start.toordinal()) if start is not None else 0
+    hi = np.searchsorted(days, end.toordinal(), side='right') if end is not None else len(days)
+    return days[lo:hi], values[lo:hi]
+
+
+def bucket_starts(days, rollup):
+    """First day (ordinal) of the week (Monday) or month each day falls in"""
+    if rollup == 'weekly':
+        return days - (days - 1) % 7  # day 1 (0001-01-01) is a Monday
+    months = (days - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]')
+    return months.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+
+def rollup(days, values, period):
+    """Mean/min/max/count per week or month, ignoring missing (NaN) values"""
+    present = ~np.isnan(values)
+    days, values = days[present], values[present]
+    if not len(days):
+        return {'dates': [], 'mean': [], 'min': [], 'max': [], 'count': []}
+    buckets = bucket_starts(days, period)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    return {
+        'dates': to_dates(buckets[starts]),
+        'mean': (np.add.reduceat(values, starts) / counts).round(4).tolist(),
+        'min': np.minimum.reduceat(values, starts).round(4).tolist(),
+        'max': np.maximum.reduceat(values, starts).round(4).tolist(),
+        'count': counts.tolist(),
+    }
@@ -1,16 +1,30 @@
 from django.urls import path
 from .views import (
     SignupView, ApprovedFieldsView, FieldSubmissionView, 
-    UserFieldsView, get_sentinel_token,
-    user_profile, approval_status
+    UserFieldsView, FieldKmlDownloadView, FieldLocateView, BulkFieldSubmissionView,
+    FieldTimeSeriesView, FieldChangesView,
+    get_sentinel_token,
+    user_profile, approval_status,
+    review_queue_stats, review_queue_claim, review_queue_release, review_queue_approve,
+    field_clusters, field_summary,
 )
 
 urlpatterns = [
     path("signup/", SignupView.as_view(), name="signup"),
     path("fields/", UserFieldsView.as_view(), name="user-fields"),
     path("fields/add/", FieldSubmissionView.as_view(), name="add-field"),
+    path("fields/bulk/", BulkFieldSubmissionView.as_view(), name="bulk-add-fields"),
+    path("fields/locate/", FieldLocateView.as_view(), name="field-locate"),
+    path("fields/changes/", FieldChangesView.as_view(), name="field-changes"),
+    path("fields/clusters/", field_clusters, name="field-clusters"),
+    path("fields/<int:field_id>/kml/", FieldKmlDownloadView.as_view(), name="field-kml"),
+    path("fields/<int:field_id>/timeseries/", FieldTimeSeriesView.as_view(), name="field-timeseries"),
     path("user/profile/", user_profile, name="user-profile"),
     path("user/approval-status/", approval_status, name="approval-status"),
     path("sentinel/token/", get_sentinel_token, name="sentinel-token"),
-    # path('health/', views.health_check, name='health_check'),
+    path("review/queue/", review_queue_stats, name="review-queue"),
+    path("review/claim/", review_queue_claim, name="review-claim"),
+    path("review/release/", review_queue_release, name="review-release"),
+    path("review/<int:field_id>/approve/", review_queue_approve, name="review-approve"),
+    path("analytics/summary/", field_summary, name="field-summary"),
 ]
\ No newline at end of file
@@ -1,21 +1,29 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, permissions
+from rest_framework import serializers, status, permissions
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.files.base import ContentFile
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_exempt
-import json
-import xml.etree.ElementTree as ET
-import re
+import hashlib
+import hmac
 import requests
 import logging
 
-from .models import FieldSubmission, User
-from .serializers import UserSerializer, FieldSubmissionSerializer
+from . import analytics, changes, clusters, kml_blobs, locate, metrics, review_queue, search, signups, timeseries
+from .kml import KmlParserMixin
+from .ratelimit import rate_limited
+from .authentication import CachedJWTAuthentication
+from .caching import bump_user_versions, cached_user_response
+from .renderers import render_fields, rendered_fields
+from .storage import digest_from_name
+from .models import FieldChange, FieldSubmission, SignupJob, User
+from .serializers import UserSerializer, FieldSubmissionSerializer, BulkFieldSubmissionSerializer
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -24,9 +32,27 @@ logger = logging.getLogger(__name__)
 def health_check(request):
     return JsonResponse({"status": "healthy", "message": "Django app is running"})
 
+def metrics_view(request):
+    """
+    Expose aggregated metrics from all workers in Prometheus text format, to
+    scrapers holding METRICS_TOKEN or logged-in staff
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (scraper or request.user.is_staff):
+        return HttpResponse(status=401)
+    return HttpResponse(
+        metrics.REGISTRY.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
 class SignupView(APIView):
+    @rate_limited('signup')
     def post(self, request):
-        """Handle complete signup with user account + field data"""
+        """
+        Create the account and queue the field's geometry processing.
+        Answers 202 with the processing id; approval-status reports progress.
+        """
         
         try:
             with transaction.atomic():
@@ -49,226 +75,165 @@ class SignupView(APIView):
                 
                 user = user_serializer.save()
                 
-                # Extract field data
-                field_data = {
-                    'user': user.id,
-                    'first_name': request.data.get('first_name'),
-                    'last_name': request.data.get('last_name'),
-                    'email': request.data.get('email'),
-                    'phone': request.data.get('phone'),
-                    'city': request.data.get('city'),
-                    'country': request.data.get('country'),
-                    'zip_code': request.data.get('zip_code'),
-                    'field_name': request.data.get('field_name'),
-                    'crop_name': request.data.get('crop_name'),
-                    'plantation_date': request.data.get('plantation_date'),
-                    'lat': request.data.get('lat'),
-                    'lng': request.data.get('lng'),
-                }
-                
-                print(f"🔍 [SIGNUP] Processing field data for user: {user.username}")
-                print(f"   - Coordinates: {field_data['lat']}, {field_data['lng']}")
-                
-                # Initialize polygon as empty
-                extracted_polygon = None
-                
-                # 1. CHECK FOR KML FILE FIRST (highest priority)
-                if 'kml_file' in request.FILES:
-                    kml_file = request.FILES['kml_file']
-                    field_data['kml_file'] = kml_file
-                    print(f"📁 [SIGNUP] KML file uploaded: {kml_file.name}")
-                    
-                    # Parse KML file to extract polygon
-                    try:
-                        extracted_polygon = self.parse_kml_file(kml_file)
-                        if extracted_polygon:
-                            print(f"✅ [SIGNUP] Extracted {len(extracted_polygon)} coordinates from KML")
-                        else:
-                            print("⚠️ [SIGNUP] No coordinates found in KML file")
-                    except Exception as e:
-                        print(f"❌ [SIGNUP] KML parsing failed: {str(e)}")
-                
-                # 2. CHECK FOR DRAWN POLYGON (second priority)
-                if not extracted_polygon:
-                    polygon_data = request.data.get('polygon')
-                    if polygon_data:
-                        print("🖊️ [SIGNUP] Processing drawn polygon data")
-                        if isinstance(polygon_data, str):
-                            try:
-                                extracted_polygon = json.loads(polygon_data)
-                                print(f"✅ [SIGNUP] Parsed drawn polygon: {len(extracted_polygon)} points")
-                            except json.JSONDecodeError as e:
-                                print(f"❌ [SIGNUP] JSON decode error for polygon: {str(e)}")
-                        else:
-                            extracted_polygon = polygon_data
-                            print(f"✅ [SIGNUP] Direct polygon data: {len(extracted_polygon)} points")
-                
-                # 3. CREATE DEFAULT POLYGON (fallback)
-                if not extracted_polygon:
-                    print("🔄 [SIGNUP] Creating default polygon around coordinates")
-                    try:
-                        lat = float(field_data['lat'])
-                        lng = float(field_data['lng'])
-                        offset = 0.005  # Roughly 500m radius
-                        
-                        extracted_polygon = [
-                            {'lat': lat - offset, 'lng': lng - offset},
-                            {'lat': lat - offset, 'lng': lng + offset},
-                            {'lat': lat + offset, 'lng': lng + offset},
-                            {'lat': lat + offset, 'lng': lng - offset},
-                            {'lat': lat - offset, 'lng': lng - offset},  # Close polygon
-                        ]
-                        print(f"✅ [SIGNUP] Created default polygon with {len(extracted_polygon)} points")
-                    except (ValueError, TypeError) as e:
-                        print(f"❌ [SIGNUP] Could not create default polygon: {str(e)}")
-                        extracted_polygon = []
-                
-                # Set the final polygon
-                field_data['polygon'] = extracted_polygon
-                print(f"📍 [SIGNUP] Final polygon has {len(extracted_polygon)} points")
-                
-                # Create field submission
-                field_serializer = FieldSubmissionSerializer(data=field_data)
+                # Validate everything but the geometry now, so bad input is still
+                # rejected in this request; the polygon is checked by the worker
+                field_data = signups.field_data_from_request(request.data)
+                checked = {key: value for key, value in field_data.items() if key not in ('polygon', 'polygon_polyline')}
+                field_serializer = FieldSubmissionSerializer(data={**checked, 'user': user.id})
                 if not field_serializer.is_valid():
+                    transaction.set_rollback(True)  # no account without its field
                     return Response({
                         'error': 'Field data validation failed',
                         'details': field_serializer.errors
                     }, status=400)
                 
-                field_submission = field_serializer.save()
-                print(f"✅ [SIGNUP] Field submission created with ID: {field_submission.id}")
+                kml_upload = request.FILES.get('kml_file')
+                if kml_upload is not None:
+                    kml_blobs.digest_upload(kml_upload)  # storage reuses the digest
+                job = signups.enqueue(user, field_data, kml_upload)
+                logger.info(
+                    "Signup queued geometry processing %s (KML upload: %s)", job.id, kml_upload is not None,
+                    extra={'event': 'signup.queued', 'user_id': user.id},
+                )
                 
                 return Response({
-                    'message': 'Account created successfully! Your field submission is under review.',
+                    'message': 'Account created successfully! Your field is being processed and will then be reviewed.',
                     'user_id': user.id,
-                    'field_submission_id': field_submission.id,
-                    'polygon_points': len(extracted_polygon),
-                    'status': 'field_pending_approval'
-                }, status=201)
+                    'processing_id': str(job.id),
+                    'status': 'field_processing'
+                }, status=202)
                 
         except Exception as e:
-            print(f"❌ [SIGNUP] Unexpected error: {str(e)}")
+            logger.exception("Signup failed", extra={'event': 'signup.error'})
             return Response({
                 'error': 'Registration failed',
                 'details': str(e)
             }, status=400)
-    
-    def parse_kml_file(self, kml_file):
+
+class UserFieldsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @cached_user_response('user_fields')
+    def get(self, request):
+        """Get only the authenticated user's approved fields, best matches first with ?q="""
+        fields = FieldSubmission.objects.filter(user=request.user, is_approved=True)
+        if request.query_params.get('q', '').strip():
+            fields = search.search(fields, request.query_params['q'])
+        return Response(rendered_fields(fields))
+
+class FieldChangesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
         """
-        Parse KML file to extract polygon coordinates
-        Returns list of coordinate dictionaries or None if parsing fails
+        The user's fields changed since cursor ``?since=`` (all of them without
+        it), with ids of deleted ones and the cursor to send next time
         """
+        since = request.query_params.get('since', '')
+        if not since:
+            cursor = changes.head()
+            fields = FieldSubmission.objects.filter(user=request.user).order_by('id')
+            return Response({
+                'cursor': cursor, 'has_more': False, 'fields': rendered_fields(fields).decode(), 'deleted': [],
+            })
         try:
-            print("🔍 [KML_PARSER] Starting KML file parsing...")
-            
-            # Read file content
-            kml_content = kml_file.read()
-            if isinstance(kml_content, bytes):
-                kml_content = kml_content.decode('utf-8')
-            
-            # Reset file pointer for potential later use
-            kml_file.seek(0)
-            
-            print(f"📄 [KML_PARSER] KML content length: {len(kml_content)} characters")
-            
-            # Parse XML
-            root = ET.fromstring(kml_content)
-            
-            # Define KML namespace
-            ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-            
-            # Look for coordinates in various KML elements
-            coordinates = []
-            
-            # Try to find Polygon coordinates
-            for polygon in root.findall('.//kml:Polygon', ns):
-                outer_boundary = polygon.find('kml:outerBoundaryIs/kml:LinearRing/kml:coordinates', ns)
-                if outer_boundary is not None and outer_boundary.text:
-                    coords_text = outer_boundary.text.strip()
-                    print(f"📍 [KML_PARSER] Found polygon coordinates: {coords_text[:100]}...")
-                    coordinates.extend(self.parse_coordinates_text(coords_text))
-            
-            # Try to find LineString coordinates if no polygon found
-            if not coordinates:
-                for linestring in root.findall('.//kml:LineString/kml:coordinates', ns):
-                    if linestring.text:
-                        coords_text = linestring.text.strip()
-                        print(f"📍 [KML_PARSER] Found linestring coordinates: {coords_text[:100]}...")
-                        coordinates.extend(self.parse_coordinates_text(coords_text))
-            
-            # Try to find Point coordinates if no polygon/linestring found
-            if not coordinates:
-                for point in root.findall('.//kml:Point/kml:coordinates', ns):
-                    if point.text:
-                        coords_text = point.text.strip()
-                        print(f"📍 [KML_PARSER] Found point coordinates: {coords_text}")
-                        coordinates.extend(self.parse_coordinates_text(coords_text))
-            
-            # Try without namespace if nothing found
-            if not coordinates:
-                print("🔍 [KML_PARSER] Trying without namespace...")
-                for elem in root.iter():
-                    if elem.tag.endswith('coordinates') and elem.text:
-                        coords_text = elem.text.strip()
-                        print(f"📍 [KML_PARSER] Found coordinates (no namespace): {coords_text[:100]}...")
-                        coordinates.extend(self.parse_coordinates_text(coords_text))
-            
-            if coordinates:
-                print(f"✅ [KML_PARSER] Successfully extracted {len(coordinates)} coordinate points")
-                return coordinates
-            else:
-                print("❌ [KML_PARSER] No coordinates found in KML file")
-                return None
-                
-        except ET.ParseError as e:
-            print(f"❌ [KML_PARSER] XML parsing error: {str(e)}")
-            return None
-        except Exception as e:
-            print(f"❌ [KML_PARSER] Unexpected error: {str(e)}")
-            return None
-    
-    def parse_coordinates_text(self, coords_text):
-        """
-        Parse coordinate text from KML format (lng,lat,alt or lng,lat)
-        Returns list of {'lat': float, 'lng': float} dictionaries
-        """
-        coordinates = []
-        
+            cursor, has_more, changed, deleted = changes.changes_since(request.user, int(since))
+        except ValueError:
+            return Response({'error': 'since must be a cursor from a previous response'}, status=400)
+        except changes.CursorExpired:
+            return Response({'error': 'Cursor expired; sync again without since'}, status=410)
+        fields = FieldSubmission.objects.filter(user=request.user, pk__in=changed).order_by('id')
+        return Response({
+            'cursor': cursor, 'has_more': has_more, 'fields': rendered_fields(fields).decode(), 'deleted': deleted,
+        })
+
+class FieldKmlDownloadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, field_id):
+        """Stream a field's uploaded KML file to its owner (or staff)"""
+        fields = FieldSubmission.objects.all()
+        if not request.user.is_staff:
+            fields = fields.filter(user=request.user)
+        field = fields.filter(pk=field_id).only('kml_file', 'field_name').first()
+        if field is None or not field.kml_file:
+            raise Http404("No KML file for this field")
+
+        # Content-addressed blobs never change, so the digest is a perfect ETag
+        digest = digest_from_name(field.kml_file.name)
+        etag = f'"{digest}"' if digest else None
+        if etag and request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified()
         try:
-            # Split by whitespace and newlines
-            coord_pairs = re.split(r'\s+', coords_text.strip())
-            
-            for coord_pair in coord_pairs:
-                if not coord_pair:
-                    continue
-                    
-                # Split by comma (KML format is lng,lat,alt or lng,lat)
-                parts = coord_pair.split(',')
-                
-                if len(parts) >= 2:
-                    try:
-                        lng = float(parts[0])
-                        lat = float(parts[1])
-                        
-                        # Validate coordinate ranges
-                        if -180 <= lng <= 180 and -90 <= lat <= 90:
-                            coordinates.append({'lat': lat, 'lng': lng})
-                        else:
-                            print(f"⚠️ [KML_PARSER] Invalid coordinate range: {lat}, {lng}")
-                    except ValueError:
-                        print(f"⚠️ [KML_PARSER] Could not parse coordinate pair: {coord_pair}")
-        
-        except Exception as e:
-            print(f"❌ [KML_PARSER] Error parsing coordinates text: {str(e)}")
+            kml = field.kml_file.storage.open(field.kml_file.name, 'rb')
+        except FileNotFoundError:
+            raise Http404("KML file is missing from storage")
+        # FileResponse streams in chunks and uses wsgi.file_wrapper (sendfile) when available
+        response = FileResponse(
+            kml, as_attachment=True, filename=f'{field.field_name}.kml',
+            content_type='application/vnd.google-earth.kml+xml',
+        )
+        if etag:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
 
-class UserFieldsView(APIView):
+class FieldTimeSeriesView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def get(self, request):
-        """Get only the authenticated user's approved fields"""
-        fields = FieldSubmission.objects.filter(user=request.user, is_approved=True)
-        serializer = FieldSubmissionSerializer(fields, many=True)
-        return Response(serializer.data)
+    def get(self, request, field_id):
+        """A field's index history between ?from= and ?to=, raw or rolled up weekly/monthly"""
+        fields = FieldSubmission.objects.all()
+        if not request.user.is_staff:
+            fields = fields.filter(user=request.user)
+        if not fields.filter(pk=field_id).exists():
+            raise Http404("Field not found")
+
+        index = request.query_params.get('index', 'ndvi')
+        period = request.query_params.get('rollup', 'raw')
+        if period not in timeseries.ROLLUPS:
+            return Response({'error': f"rollup must be one of {', '.join(timeseries.ROLLUPS)}"}, status=400)
+        bounds = {}
+        for param in ('from', 'to'):
+            value = request.query_params.get(param)
+            try:
+                # None for malformed input, ValueError for impossible dates like 2024-02-30
+                bounds[param] = parse_date(value) if value else None
+            except ValueError:
+                bounds[param] = None
+            if value and bounds[param] is None:
+                return Response({'error': f'{param} must be a YYYY-MM-DD date'}, status=400)
+
+        days, values = timeseries.query(field_id, index, bounds['from'], bounds['to'])
+        body = {'field_id': field_id, 'index': index, 'rollup': period}
+        if period != 'raw':
+            body.update(timeseries.rollup(days, values, period))
+        elif len(days) > settings.TIMESERIES_MAX_POINTS:
+            return Response({
+                'error': f'More than {settings.TIMESERIES_MAX_POINTS} points; narrow the range or use a rollup',
+            }, status=400)
+        else:
+            # Missing observations (cloud cover) are stored as NaN and returned as null
+            body['dates'] = timeseries.to_dates(days)
+            body['values'] = [None if v != v else round(v, 4) for v in values.tolist()]
+        return Response(body)
+
+class FieldLocateView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """Which approved field (if any) each posted lat/lng point falls in"""
+        try:
+            points = locate.parse_points(request.data)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=400)
+        if len(points) > settings.LOCATE_MAX_POINTS:
+            return Response({'error': f'At most {settings.LOCATE_MAX_POINTS} points per request'}, status=400)
+        # Scouts only match their own fields; staff search every approved field
+        fields = FieldSubmission.objects.all()
+        if not request.user.is_staff:
+            fields = fields.filter(user=request.user)
+        return Response({'field_ids': locate.locate(points, fields)})
 
 class ApprovedFieldsView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -295,9 +260,114 @@ class FieldSubmissionView(APIView):
             }, status=201)
         return Response(serializer.errors, status=400)
 
+class BulkFieldSubmissionView(KmlParserMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Submit many fields at once, each with a polygon or an embedded ``kml``
+        document. Valid items are created in one transaction even if others
+        fail; the response reports each item by its index.
+        """
+        items = request.data.get('fields') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'fields must be a non-empty list'}, status=400)
+        if len(items) > settings.BULK_FIELDS_MAX_ITEMS:
+            return Response({'error': f'At most {settings.BULK_FIELDS_MAX_ITEMS} fields per request'}, status=400)
+
+        # Single validation pass; nothing touches the database until every item is checked.
+        # One serializer validates every item so its fields are only built once.
+        serializer = BulkFieldSubmissionSerializer(context={'request': request})
+        results = [None] * len(items)
+        valid = []  # (index, validated_data, kml digest to remember geometry for)
+        kml_polygons = {}
+        total_vertices = 0
+        too_many_vertices = Response(
+            {'error': f'At most {settings.BULK_FIELDS_MAX_VERTICES} polygon vertices per request'}, status=400,
+        )
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'status': 'invalid', 'errors': {'non_field_errors': ['Expected an object']}}
+                continue
+            data = dict(item)
+            parsed_digest = None
+            kml_text = data.pop('kml', None)
+            if kml_text:
+                content = kml_text.encode('utf-8') if isinstance(kml_text, str) else bytes(kml_text)
+                if len(content) > settings.BULK_FIELDS_MAX_KML_BYTES:
+                    results[index] = {'index': index, 'status': 'invalid', 'errors': {
+                        'kml': [f'KML documents are limited to {settings.BULK_FIELDS_MAX_KML_BYTES} bytes'],
+                    }}
+                    continue
+                digest = hashlib.sha256(content).hexdigest()
+                if digest not in kml_polygons:
+                    polygon = kml_blobs.cached_geometry(digest)
+                    if polygon is None:
+                        polygon = self.parse_kml_file(ContentFile(content))
+                        parsed_digest = digest
+                    kml_polygons[digest] = polygon
+                if not kml_polygons[digest]:
+                    results[index] = {'index': index, 'status': 'invalid', 'errors': {'kml': ['No coordinates found in KML document']}}
+                    continue
+                data['polygon'] = kml_polygons[digest]
+                data['kml_file'] = ContentFile(content, name=f'{digest[:16]}.kml')
+                data['kml_file'].sha256 = digest  # storage reuses the digest instead of rehashing
+            elif not (data.get('polygon') or data.get('polygon_polyline')):
+                results[index] = {'index': index, 'status': 'invalid', 'errors': {'polygon': ['Provide a polygon or a kml document']}}
+                continue
+            # Stop before validating (and geocoding) anything once the request is over budget
+            if isinstance(data.get('polygon'), list) and total_vertices + len(data['polygon']) > settings.BULK_FIELDS_MAX_VERTICES:
+                return too_many_vertices
+
+            try:
+                validated = serializer.run_validation(data)
+            except serializers.ValidationError as exc:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': serializers.as_serializer_error(exc)}
+                continue
+            total_vertices += len(validated.get('polygon') or ())
+            if total_vertices > settings.BULK_FIELDS_MAX_VERTICES:
+                return too_many_vertices
+            valid.append((index, validated, parsed_digest))
+
+        if valid:
+            fields = [FieldSubmission(**validated) for _, validated, _ in valid]
+            for field in fields:
+                field.derive_geometry()
+                field.derive_search_document()
+            with transaction.atomic():
+                FieldSubmission.objects.bulk_create(fields, batch_size=settings.BULK_CREATE_BATCH_SIZE)
+                # bulk_create skips save() and post_save, so do their work here
+                for field, payload in zip(fields, render_fields(fields)):
+                    field.rendered_json = payload
+                FieldSubmission.objects.bulk_update(fields, ['rendered_json'], batch_size=settings.BULK_CREATE_BATCH_SIZE)
+                analytics.track_created(fields)
+                changes.record((field.id, field.user_id, FieldChange.CREATED) for field in fields)
+                for field, (_, validated, parsed_digest) in zip(fields, valid):
+                    if field.kml_file:
+                        kml_blobs.add_reference(field.kml_file.name, validated['kml_file'])
+                    if parsed_digest and validated['polygon']:
+                        kml_blobs.remember_geometry(parsed_digest, validated['polygon'])
+            bump_user_versions([request.user.id])
+            for field, (index, _, _) in zip(fields, valid):
+                results[index] = {'index': index, 'status': 'created', 'field_id': field.id}
+
+        created = len(valid)
+        logger.info(
+            "Bulk submission created %d of %d fields", created, len(items),
+            extra={'event': 'fields.bulk_created', 'user_id': request.user.id},
+        )
+        if created == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'created': created, 'failed': len(items) - created, 'results': results}, status=response_status)
+
 # NEW: Sentinel Hub Token Proxy
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])  # Only authenticated users can get tokens
+@rate_limited('sentinel_token')
 def get_sentinel_token(request):
     """
     Proxy endpoint to get Sentinel Hub access tokens
@@ -325,12 +395,13 @@ def get_sentinel_token(request):
         logger.info("📤 [DJANGO] Making token request to Copernicus...")
         
         # Make the request to Copernicus
-        response = requests.post(
-            TOKEN_URL,
-            data=token_data,
-            headers=headers,
-            timeout=30  # 30 second timeout
-        )
+        with metrics.upstream_timer('copernicus'):
+            response = requests.post(
+                TOKEN_URL,
+                data=token_data,
+                headers=headers,
+                timeout=30  # 30 second timeout
+            )
         
         logger.info("📥 [DJANGO] Token response status: %s", response.status_code)
         
@@ -386,8 +457,9 @@ def get_sentinel_token(request):
         }, status=500)
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([permissions.IsAuthenticated])
+@cached_user_response('user_profile')
 def user_profile(request):
     """Get current user profile information"""
     user = request.user
@@ -412,15 +484,28 @@ def user_profile(request):
     })
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([permissions.IsAuthenticated])
+@cached_user_response('approval_status')
 def approval_status(request):
     """Check field approval status for user"""
     user = request.user
     field_submissions = FieldSubmission.objects.filter(user=user)
+    # Signups whose geometry hasn't been turned into a field (yet)
+    signup_jobs = user.signup_jobs.exclude(status=SignupJob.DONE)
     
     return Response({
         'user_approved': True,  # Users are always approved
+        'processing': [
+            {
+                'id': str(job.id),
+                'status': job.status,
+                'attempts': job.attempts,
+                'error': job.last_error if job.status == SignupJob.FAILED else None,
+                'created_at': job.created_at.isoformat(),
+            }
+            for job in signup_jobs
+        ],
         'fields': [
             {
                 'id': field.id,
@@ -436,4 +521,66 @@ def approval_status(request):
             'approved_fields': field_submissions.filter(is_approved=True).count(),
             'pending_fields': field_submissions.filter(is_approved=False).count(),
         }
-    })
\ No newline at end of file
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def review_queue_stats(request):
+    """Pending review queue depth and latency"""
+    return Response(review_queue.queue_stats())
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def review_queue_claim(request):
+    """Claim the next batch of pending fields for the requesting reviewer"""
+    try:
+        size = min(int(request.data.get('size', settings.REVIEW_QUEUE_BATCH_SIZE)),
+                   settings.REVIEW_QUEUE_MAX_BATCH_SIZE)
+    except (TypeError, ValueError):
+        return Response({'error': 'size must be an integer'}, status=400)
+    fields = review_queue.claim_batch(request.user, size=max(size, 1))
+    return Response({
+        'claim_expires_at': fields[0].claim_expires_at.isoformat() if fields else None,
+        'fields': FieldSubmissionSerializer(fields, many=True).data,
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def review_queue_release(request):
+    """Release some (``ids``) or all of the reviewer's claims"""
+    released = review_queue.release(request.user, request.data.get('ids'))
+    return Response({'released': released})
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def review_queue_approve(request, field_id):
+    """Approve a field from the queue; 409 if it is approved or claimed by someone else"""
+    field = review_queue.approve_claimed(request.user, field_id)
+    if field is None:
+        return Response({'error': 'Field is already approved or claimed by another reviewer'}, status=409)
+    return Response({'id': field.id, 'approved_at': field.approved_at.isoformat()})
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def field_clusters(request):
+    """Approved fields clustered for a map view: ``?bbox=west,south,east,north&zoom=``"""
+    try:
+        west, south, east, north = (float(value) for value in request.query_params.get('bbox', '').split(','))
+        zoom = int(request.query_params.get('zoom', ''))
+    except ValueError:
+        return Response({'error': 'bbox=west,south,east,north and an integer zoom are required'}, status=400)
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90) or zoom < 0:
+        return Response({'error': 'bbox or zoom out of range'}, status=400)
+    results, truncated = clusters.current_index().clusters(
+        west, south, east, north, zoom, limit=settings.CLUSTER_MAX_RESULTS,
+    )
+    return Response({'zoom': zoom, 'clusters': results, 'truncated': truncated})
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def field_summary(request):
+    """Field counts, hectares and approval rates grouped by crop, country or plantation month"""
+    dimension = request.query_params.get('dimension', 'crop')
+    if dimension not in analytics.DIMENSIONS:
+        return Response({'error': f"dimension must be one of: {', '.join(analytics.DIMENSIONS)}"}, status=400)
+    return Response({'dimension': dimension, 'groups': analytics.summary(dimension)})